@@ -0,0 +1,150 @@
+# attendance.py
+"""In-memory attendance tallies with group-committed writes and coalesced embed edits."""
+import asyncio
+from typing import Callable
+
+from metrics import background_errors_total
+from outbox import LOW
+
+STATUSES = ("attend", "not", "maybe")
+WRITE_DELAY = 0.5   # seconds of clicks grouped into one commit
+EDIT_WINDOW = 2.0   # at most one embed edit per message per window (seconds)
+
+
+class AttendanceTracker:
+    """Keeps each attendance post's tally in memory, seeded once from the DB.
+
+    ``await render(message, tally)`` builds the embed for a message, where tally maps
+    each status to an insertion-ordered dict of user ids (used as an ordered set).
+    Edits go through ``outbox`` (an outbox.Outbox) when one is given.
+    """
+
+    def __init__(self, db, render: Callable, write_delay: float = WRITE_DELAY, edit_window: float = EDIT_WINDOW,
+                 outbox=None):
+        self.db = db
+        self.render = render
+        self.outbox = outbox
+        self.write_delay = write_delay
+        self.edit_window = edit_window
+        self._tallies = {}     # message id -> {status: {user id: None}}
+        self._guilds = {}      # message id -> guild id of each cached tally
+        self._loading = {}     # message id -> task seeding the tally
+        self._writes = {}      # (guild id, message id, user id) -> status awaiting commit
+        self._write_task = None
+        self._edits = {}       # message id -> [latest message object, scheduled edit task]
+        self._last_edit = {}   # message id -> loop time of the last edit
+        self.commits = 0
+        self.edits = 0
+
+    async def tally(self, guild_id: str, message_id: str) -> dict:
+        tally = self._tallies.get(message_id)
+        if tally is not None:
+            return tally
+        task = self._loading.get(message_id)
+        if task is None:
+            task = self._loading[message_id] = asyncio.ensure_future(self._seed(guild_id, message_id))
+        return await asyncio.shield(task)
+
+    async def _seed(self, guild_id: str, message_id: str) -> dict:
+        try:
+            tally = {status: {} for status in STATUSES}
+            for user_id, status in await self.db.attendance.for_message(guild_id, message_id):
+                tally.setdefault(status, {})[user_id] = None
+            self._tallies[message_id] = tally
+            self._guilds[message_id] = guild_id
+            return tally
+        finally:
+            self._loading.pop(message_id, None)
+
+    async def record(self, message, user_id: str, status: str):
+        """Apply a click in memory, then queue the DB write and an embed refresh."""
+        guild_id, message_id = str(message.guild.id), str(message.id)
+        tally = await self.tally(guild_id, message_id)
+        for members in tally.values():
+            members.pop(user_id, None)
+        tally[status][user_id] = None
+
+        self._writes[(guild_id, message_id, user_id)] = status
+        if self._write_task is None:
+            self._write_task = asyncio.create_task(self._flush_writes_later())
+        self._schedule_edit(message_id, message)
+
+    # ----- writes -----
+    async def _flush_writes_later(self):
+        await asyncio.sleep(self.write_delay)
+        self._write_task = None
+        try:
+            await self.flush_writes()
+        except Exception as e:
+            background_errors_total.inc("attendance_write")
+            print("Attendance write failed:", e)
+
+    async def flush_writes(self):
+        if not self._writes:
+            return
+        batch, self._writes = self._writes, {}
+        try:
+            await self.db.attendance.set_many([(*key, status) for key, status in batch.items()])
+        except Exception:
+            # keep anything not superseded by a newer click for the next flush
+            for key, status in batch.items():
+                self._writes.setdefault(key, status)
+            if self._write_task is None:
+                self._write_task = asyncio.create_task(self._flush_writes_later())
+            raise
+        self.commits += 1
+
+    # ----- embed edits -----
+    def _schedule_edit(self, message_id: str, message):
+        pending = self._edits.get(message_id)
+        if pending is not None:
+            pending[0] = message  # the scheduled edit will render the latest tally
+            return
+        loop = asyncio.get_running_loop()
+        last = self._last_edit.get(message_id)
+        delay = 0 if last is None else max(0.0, last + self.edit_window - loop.time())
+        self._edits[message_id] = [message, asyncio.create_task(self._edit_later(message_id, delay))]
+
+    async def _edit_later(self, message_id: str, delay: float):
+        await asyncio.sleep(delay)
+        await self._edit_now(message_id)
+
+    async def _edit_now(self, message_id: str):
+        pending = self._edits.pop(message_id, None)
+        tally = self._tallies.get(message_id)
+        if pending is None or tally is None:
+            return  # forgotten since the edit was scheduled
+        message = pending[0]
+        self._last_edit[message_id] = asyncio.get_running_loop().time()
+        try:
+            embed = await self.render(message, tally)
+            if self.outbox is None:
+                await message.edit(embed=embed)
+            else:
+                await self.outbox.submit(message.channel.id, lambda: message.edit(embed=embed), LOW,
+                                         key=("edit", message.id), label="attendance edit")
+            self.edits += 1
+        except Exception as e:
+            background_errors_total.inc("attendance_edit")
+            print(f"Attendance embed edit failed for {message_id}:", e)
+
+    async def flush(self):
+        """Commit pending writes and apply pending edits immediately (used on shutdown)."""
+        if self._write_task is not None:
+            self._write_task.cancel()
+            self._write_task = None
+        await self.flush_writes()
+        for message_id, (_, task) in list(self._edits.items()):
+            task.cancel()
+            await self._edit_now(message_id)
+
+    def forget(self, guild_id: str):
+        """Drop the guild's cached tallies and pending edits; each tally is re-read from the DB
+        on its next click (after a season rollover)."""
+        for message_id in [m for m, g in self._guilds.items() if g == guild_id]:
+            del self._guilds[message_id]
+            self._tallies.pop(message_id, None)
+            self._last_edit.pop(message_id, None)
+            pending = self._edits.pop(message_id, None)
+            if pending is not None:
+                pending[1].cancel()
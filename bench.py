@@ -0,0 +1,631 @@
+# bench.py
+"""Offline benchmarks for the bot's hot paths. Run: python bench.py [scenario ...]"""
+import asyncio
+import datetime
+import glob
+import gzip
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from attendance import AttendanceTracker
+from fake_discord import Api, FakeGuild, FakeInteraction
+from db import BAN_DURATION, Database, DriverNameIndex
+from export import archive_files, import_archive, write_archive
+from greetings import Greeter
+from outbox import HIGH, LOW, Outbox
+from transcripts import write_transcript
+
+
+def _temp_db() -> Database:
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    db = Database(path)
+    db.migrate()
+    return db
+
+
+def _timed(db: Database, fn, *args, repeat: int = 2000) -> float:
+    """Average microseconds per call of fn(conn, *args) on the DB thread."""
+    def _loop(conn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(conn, *args)
+        return (time.perf_counter() - start) / repeat * 1e6
+    return db.run_sync(_loop)
+
+
+# hot-path query shapes, each should be an index search rather than a scan
+GUILD = "1"
+LOOKUPS = {
+    "bans by user+type": ("SELECT id FROM bans WHERE guild_id = ? AND user_id = ? AND type = ?",
+                          lambda u: (GUILD, u, "race")),
+    "penalties by user": ("SELECT points, reason, timestamp FROM penalties WHERE guild_id = ? AND user_id = ? "
+                          "ORDER BY id DESC", lambda u: (GUILD, u)),
+    "attendance by message": ("SELECT user_id, status FROM attendance WHERE guild_id = ? AND message_id = ?",
+                              lambda u: (GUILD, u)),
+    "tickets by channel": ("SELECT id, owner_id FROM tickets WHERE guild_id = ? AND channel_id = ?",
+                           lambda u: (GUILD, u)),
+}
+
+
+def bench_lookups(sizes=(1_000, 10_000, 100_000, 250_000)):
+    """Per-lookup latency as the penalty table grows; flat numbers mean indexed access."""
+    db = _temp_db()
+    rng = random.Random(1)
+    seeded = 0
+    print(f"{'rows/guild':>12}  " + "  ".join(f"{k:>22}" for k in LOOKUPS))
+    for size in sizes:
+        def _seed(conn, n=size - seeded):
+            users = [str(rng.randrange(size // 10 + 1)) for _ in range(n)]
+            # a second, equally large league shares the file; lookups must not scan it
+            for guild in (GUILD, "2"):
+                conn.executemany('INSERT INTO penalties (guild_id, user_id, points, reason) VALUES (?, ?, ?, ?)',
+                                 ((guild, u, rng.randint(1, 5), "bench") for u in users))
+                conn.executemany('INSERT INTO bans (guild_id, user_id, type, reason) VALUES (?, ?, ?, ?)',
+                                 ((guild, u, rng.choice(("race", "quali")), "bench") for u in users[::20]))
+                conn.executemany('INSERT OR IGNORE INTO attendance (guild_id, message_id, user_id, status) '
+                                 'VALUES (?, ?, ?, ?)', ((guild, str(i % 500), u, "attend") for i, u in enumerate(users[::5])))
+                conn.executemany('INSERT INTO tickets (guild_id, channel_id, owner_id) VALUES (?, ?, ?)',
+                                 ((guild, str(i), u) for i, u in enumerate(users[::50], start=seeded)))
+            conn.execute("ANALYZE")
+        db.run_sync(_seed)
+        seeded = size
+        probe = str(rng.randrange(size // 10))
+        cells = []
+        for sql, params in LOOKUPS.values():
+            us = _timed(db, lambda conn, p: conn.execute(sql, p).fetchall(), params(probe))
+            cells.append(f"{us:>19.1f} us")
+        print(f"{size:>12}  " + "  ".join(cells))
+
+    print("\nquery plans:")
+    for name, (sql, params) in LOOKUPS.items():
+        plan = db.run_sync(lambda conn: conn.execute("EXPLAIN QUERY PLAN " + sql, params("1")).fetchall())
+        print(f"  {name}: " + "; ".join(r[-1] for r in plan))
+    path = db.path
+    db.close()
+    os.remove(path)
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class _FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class _FakeMessage:
+    """Stands in for discord.Message: counts edits and simulates REST latency."""
+
+    def __init__(self, message_id: int, latency: float = 0.05, guild_id: int = int(GUILD)):
+        self.id = message_id
+        self.guild = _FakeGuild(guild_id)
+        self.latency = latency
+        self.edits = 0
+        self.last_embed = None
+
+    async def edit(self, embed):
+        await asyncio.sleep(self.latency)
+        self.edits += 1
+        self.last_embed = embed
+
+
+def bench_attendance(clicks: int = 600, drivers: int = 300, posts: int = 2, spread: float = 3.0):
+    """Hundreds of concurrent button clicks against the attendance tracker."""
+    async def _run():
+        db = _temp_db()
+
+        async def render(message, tally):
+            return {s: len(m) for s, m in tally.items()}
+
+        tracker = AttendanceTracker(db, render)
+        messages = [_FakeMessage(1000 + i) for i in range(posts)]
+        rng = random.Random(7)
+        latencies = []
+
+        async def click():
+            await asyncio.sleep(rng.uniform(0, spread))
+            start = time.perf_counter()
+            await tracker.record(rng.choice(messages), str(rng.randrange(drivers)),
+                                 rng.choice(("attend", "not", "maybe")))
+            latencies.append((time.perf_counter() - start) * 1e3)
+
+        wall = time.perf_counter()
+        await asyncio.gather(*(click() for _ in range(clicks)))
+        await tracker.flush()
+        wall = time.perf_counter() - wall
+
+        consistent = True
+        for msg in messages:
+            tally = await tracker.tally(GUILD, str(msg.id))
+            stored = await db.attendance.for_message(GUILD, str(msg.id))
+            consistent &= sorted(stored) == sorted((u, s) for s, members in tally.items() for u in members)
+            consistent &= msg.last_embed == {s: len(m) for s, m in tally.items()}
+        print(f"clicks={clicks} posts={posts} wall={wall:.2f}s "
+              f"record p50={_percentile(latencies, 50):.3f}ms p99={_percentile(latencies, 99):.3f}ms")
+        print(f"commits={tracker.commits} embed edits={sum(m.edits for m in messages)} "
+              f"final state flushed and consistent={consistent}")
+        path = db.path
+        db.close()
+        os.remove(path)
+    asyncio.run(_run())
+
+
+def bench_autocomplete(drivers: int = 10_000, queries: int = 20_000):
+    """Driver-name prefix search as used by slash command autocomplete."""
+    rng = random.Random(3)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    index = DriverNameIndex()
+    start = time.perf_counter()
+    index.load((str(i), "".join(rng.choice(letters) for _ in range(rng.randint(4, 14))).title()) for i in range(drivers))
+    load_ms = (time.perf_counter() - start) * 1e3
+    latencies = []
+    for _ in range(queries):
+        prefix = "".join(rng.choice(letters) for _ in range(rng.randint(0, 3)))
+        start = time.perf_counter()
+        index.search(prefix)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    start = time.perf_counter()
+    for i in range(1000):
+        index.add(str(drivers + i), f"New Driver {i}")
+    add_us = (time.perf_counter() - start) * 1e3
+    print(f"drivers={drivers} load={load_ms:.1f}ms search p50={_percentile(latencies, 50):.1f}us "
+          f"p99={_percentile(latencies, 99):.1f}us max={max(latencies):.1f}us incremental add={add_us:.2f}us")
+
+
+def bench_import(rows: int = 500, drivers: int = 100):
+    """A race's penalty sheet applied row by row versus as one batched transaction."""
+    async def _run():
+        rng = random.Random(5)
+        entries = [(str(rng.randrange(drivers)), rng.randint(1, 5), "Track limits", f"L{i // 10}-T{i % 10}")
+                   for i in range(rows)]
+        names = {uid: f"Driver {uid}" for uid, *_ in entries}
+        for label in ("sequential", "batched"):
+            db = _temp_db()
+            start = time.perf_counter()
+            if label == "sequential":
+                for uid, points, reason, _ in entries:
+                    await db.penalties.add(GUILD, uid, names[uid], points, reason)
+            else:
+                await db.penalties.add_many(GUILD, entries, names)
+            wall = (time.perf_counter() - start) * 1e3
+            stored = db.run_sync(lambda conn: conn.execute("SELECT COUNT(*), SUM(points) FROM penalties").fetchone())
+            bans = db.run_sync(lambda conn: conn.execute("SELECT COUNT(*) FROM bans").fetchone()[0])
+            print(f"{label:>10}: rows={rows} drivers={drivers} wall={wall:.1f}ms "
+                  f"stored={stored[0]} points={stored[1]} bans={bans}")
+            path = db.path
+            db.close()
+            os.remove(path)
+    asyncio.run(_run())
+
+
+def bench_ledger(histories=(10, 100, 1_000, 10_000), removals: int = 200):
+    """Point removal latency as a driver's penalty history grows; a flat line means one insert per removal."""
+    async def _run():
+        db = _temp_db()
+        rng = random.Random(11)
+        for n, size in enumerate(histories):
+            uid = str(n)
+            db.run_sync(lambda conn: conn.executemany(
+                'INSERT INTO penalties (guild_id, user_id, points, reason) VALUES (?, ?, ?, ?)',
+                ((GUILD, uid, rng.randint(1, 5), "bench") for _ in range(size))))
+            latencies = []
+            for _ in range(removals):
+                start = time.perf_counter()
+                await db.penalties.remove_points(GUILD, uid, f"Driver {uid}", 1, "bench")
+                latencies.append((time.perf_counter() - start) * 1e6)
+            audit = await db.penalties.audit(GUILD, uid, 25)
+            print(f"history={size:>6} removal p50={_percentile(latencies, 50):.0f}us "
+                  f"p99={_percentile(latencies, 99):.0f}us total={await db.penalties.total(GUILD, uid)} "
+                  f"newest adjustment offsets={audit[0][6]}")
+        path = db.path
+        db.close()
+        os.remove(path)
+    asyncio.run(_run())
+
+
+def bench_transcript(messages: int = 50_000):
+    """Archive a long ticket channel; peak memory should stay flat however long the history is."""
+    async def history():
+        author = SimpleNamespace(id=42)
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        for i in range(messages):
+            if i % 100 == 0:
+                await asyncio.sleep(0)  # a history page boundary
+            yield SimpleNamespace(id=i, author=author, created_at=start + datetime.timedelta(seconds=i), edited_at=None,
+                                  content=f"message {i} " + "lorem ipsum " * 8, attachments=[], embeds=[])
+
+    async def _run():
+        fd, path = tempfile.mkstemp(suffix=".jsonl.gz")
+        os.close(fd)
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = await write_transcript(history(), path)
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with gzip.open(path, "rt") as f:
+            lines = sum(1 for _ in f)
+        print(f"messages={count} lines={lines} wall={wall:.2f}s (traced) size={os.path.getsize(path) / 1024:.0f}KB "
+              f"peak python memory={peak / 1024:.0f}KB")
+        os.remove(path)
+    asyncio.run(_run())
+
+
+def bench_export(drivers: int = 20_000, penalties: int = 200_000, part_mb: float = 2.0):
+    """Export a large league in small parts and import it into a second guild; peak memory should stay flat."""
+    async def _run():
+        db = _temp_db()
+        rng = random.Random(24)
+
+        def _seed(conn):
+            conn.executemany("INSERT INTO drivers (guild_id, user_id, name) VALUES (?, ?, ?)",
+                             ((GUILD, str(i), f"Driver {i}") for i in range(drivers)))
+            conn.executemany("INSERT INTO penalties (guild_id, user_id, points, reason, incident_ref) VALUES (?, ?, ?, ?, ?)",
+                             ((GUILD, str(rng.randrange(drivers)), rng.choice((1, 2, 3, -1)), "Track limits", f"R{i // 500}")
+                              for i in range(penalties)))
+            conn.executemany("INSERT INTO attendance (guild_id, message_id, user_id, status) VALUES (?, ?, ?, ?)",
+                             ((GUILD, str(i // drivers), str(i % drivers), "attend") for i in range(drivers * 5)))
+        db.run_sync(_seed)
+        for fmt in ("jsonl", "csv"):
+            folder = tempfile.mkdtemp()
+            tracemalloc.start()
+            start = time.perf_counter()
+            manifest = await write_archive(db, GUILD, folder, fmt, int(part_mb * 1024 * 1024))
+            wall = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            files = archive_files(folder, manifest)
+            largest = max(os.path.getsize(path) for path in files)
+            rows = sum(entry["rows"] for entry in manifest["tables"].values())
+            print(f"export {fmt:>5}: rows={rows} wall={wall:.2f}s (traced) files={len(files)} "
+                  f"total={sum(os.path.getsize(p) for p in files) / 1024 / 1024:.1f}MB "
+                  f"largest={largest / 1024 / 1024:.2f}MB (limit {part_mb}MB) peak python memory={peak / 1024:.0f}KB")
+            target = f"2{fmt}"
+            start = time.perf_counter()
+            loaded = await import_archive(db, folder, target)
+            wall = time.perf_counter() - start
+            totals_match = await db.penalties.standings(GUILD, 10) == await db.penalties.standings(target, 10)
+            print(f"import {fmt:>5}: wall={wall:.2f}s ({rows / wall:,.0f} rows/s) penalties={loaded['penalties']} "
+                  f"points={loaded['penalty_points']} standings match={totals_match}")
+            shutil.rmtree(folder)
+        path = db.path
+        db.close()
+        os.remove(path)
+    asyncio.run(_run())
+
+
+def bench_outbox(edits: int = 500, posts: int = 20, messages: int = 5, latency: float = 0.05):
+    """A storm of cosmetic embed edits with user-visible posts mixed in, all in one channel."""
+    async def _run():
+        outbox = Outbox()
+        rng = random.Random(13)
+        calls = 0
+
+        async def rest():
+            nonlocal calls
+            await asyncio.sleep(latency)
+            calls += 1
+
+        async def timed(future, into):
+            start = time.perf_counter()
+            await future
+            into.append((time.perf_counter() - start) * 1e3)
+
+        edit_ms, post_ms, waits = [], [], []
+        for i in range(edits + posts):
+            await asyncio.sleep(rng.uniform(0, 0.004))
+            if i % ((edits + posts) // posts) == 0:
+                waits.append(asyncio.create_task(timed(outbox.submit(1, rest, HIGH), post_ms)))
+            else:
+                key = ("edit", rng.randrange(messages))
+                waits.append(asyncio.create_task(timed(outbox.submit(1, rest, LOW, key=key), edit_ms)))
+        await asyncio.gather(*waits)
+        s = outbox.stats()
+        print(f"submitted={edits + posts} REST calls={calls} superseded={s['superseded']} "
+              f"post wait p50={_percentile(post_ms, 50):.0f}ms max={max(post_ms):.0f}ms "
+              f"edit wait p50={_percentile(edit_ms, 50):.0f}ms")
+    asyncio.run(_run())
+
+
+def bench_joins(burst: int = 300, trickle: int = 10, scale: float = 0.05):
+    """Replay a quiet trickle of joins, then an announcement-sized burst, then a trickle again.
+
+    Timings run at ``scale`` of real time (0.05: a 10s raid window lasts 0.5s).
+    """
+    async def _run():
+        channel = SimpleNamespace(id=10)
+        guild = SimpleNamespace(id=1, name="League", member_count=1000, get_channel=lambda cid: channel)
+        settings = SimpleNamespace(welcome_channel_id=channel.id,
+                                   welcome_message="Welcome {mention} to {server}! We are now {member_count} drivers.")
+        sent = []
+        render_us = []
+
+        async def get_settings(guild_id):
+            return settings
+
+        async def send(channel, kind, text, members):
+            sent.append((text, len(members)))
+
+        greeter = Greeter(get_settings, send, raid_window=10.0 * scale, digest_delay=5.0 * scale)
+        rng = random.Random(17)
+
+        def member(i):
+            return SimpleNamespace(guild=guild, mention=f"<@{i}>", name=f"driver{i}", display_name=f"Driver {i}")
+
+        async def join(i, gap):
+            await asyncio.sleep(gap)
+            start = time.perf_counter()
+            await greeter.member_event("welcome", member(i))
+            render_us.append((time.perf_counter() - start) * 1e6)
+
+        n = 0
+        for phase, count, gap in (("trickle", trickle, 3.0), ("burst", burst, 0.02), ("trickle", trickle, 3.0)):
+            before = len(sent)
+            for _ in range(count):
+                await join(n, rng.uniform(0, 2 * gap) * scale)
+                n += 1
+            await asyncio.sleep(10.0 * scale)  # let digests flush and the raid window pass
+            covered = sum(m for _, m in sent[before:])
+            print(f"{phase:>8}: joins={count} messages={len(sent) - before} members covered={covered} "
+                  f"largest message={max((m for _, m in sent[before:]), default=0)}")
+        await greeter.flush()
+        digest = next((text for text, m in sent if m > 1), "")
+        print(f"total joins={n} messages={greeter.sent} digests={greeter.digests} "
+              f"event p50={_percentile(render_us, 50):.1f}us p99={_percentile(render_us, 99):.1f}us")
+        print(f"sample digest: {digest[:120]}…")
+    asyncio.run(_run())
+
+
+def bench_standings(sizes=(1_000, 10_000, 100_000), pages: int = 200):
+    """Standings page latency as the league grows; flat numbers mean no per-call GROUP BY or sort."""
+    async def _run():
+        db = _temp_db()
+        rng = random.Random(23)
+        seeded = 0
+        for size in sizes:
+            def _seed(conn, start=seeded):
+                conn.executemany("INSERT INTO drivers (guild_id, user_id, name) VALUES (?, ?, ?)",
+                                 ((GUILD, str(i), f"Driver {i}") for i in range(start, size)))
+                conn.executemany("INSERT INTO penalties (guild_id, user_id, points, reason) VALUES (?, ?, ?, ?)",
+                                 ((GUILD, str(rng.randrange(size)), rng.randint(1, 3), "bench")
+                                  for _ in range((size - start) * 3)))
+                conn.execute("ANALYZE")
+            db.run_sync(_seed)
+            seeded = size
+            first, deep = [], []
+            cursor = None
+            for _ in range(pages):
+                start = time.perf_counter()
+                rows = await db.penalties.standings(GUILD, 21, after=cursor)
+                (deep if cursor else first).append((time.perf_counter() - start) * 1e6)
+                cursor = (rows[-1][2], rows[-1][0]) if len(rows) == 21 else None
+            print(f"drivers={size:>7} first page p50={_percentile(first, 50):.0f}us "
+                  f"next pages p50={_percentile(deep, 50):.0f}us p99={_percentile(deep, 99):.0f}us")
+        path = db.path
+        db.close()
+        os.remove(path)
+    asyncio.run(_run())
+
+
+def bench_rollover(seasons: int = 3, drivers: int = 300, penalties: int = 100_000, posts: int = 200):
+    """The same league history with and without season rollovers: live file size, hot queries, archived reads."""
+    async def _run():
+        folder = tempfile.mkdtemp()
+        uids = [str(10_000 + i) for i in range(drivers)]
+
+        def _seed(conn, rng):
+            posted = int(time.time() * 1000) - 1420070400000 - 86_400_000
+            conn.executemany("INSERT OR IGNORE INTO drivers (guild_id, user_id, name) VALUES (?, ?, ?)",
+                             ((GUILD, uid, f"Driver {uid}") for uid in uids))
+            conn.executemany("INSERT INTO penalties (guild_id, user_id, points, reason) VALUES (?, ?, ?, ?)",
+                             ((GUILD, rng.choice(uids), rng.randint(1, 3), "seed") for _ in range(penalties)))
+            conn.executemany("INSERT OR IGNORE INTO attendance (guild_id, message_id, user_id, status) VALUES (?, ?, ?, ?)",
+                             ((GUILD, str((posted - rng.randrange(10**9)) << 22), uid, "attend")
+                              for _ in range(posts) for uid in uids))
+
+        for label, rollover in (("no rollover", False), ("rollover", True)):
+            path = os.path.join(folder, f"{label.replace(' ', '-')}.db")
+            db = Database(path)
+            db.migrate()
+            rng = random.Random(25)
+            spent = 0.0
+            for season in range(seasons):
+                db.run_sync(_seed, rng)
+                if rollover and season < seasons - 1:
+                    start = time.perf_counter()
+                    await db.seasons.rollover(GUILD)
+                    await db.seasons.compact(GUILD)
+                    spent += time.perf_counter() - start
+            db.run_sync(lambda conn: conn.execute("ANALYZE main"))
+            post = db.run_sync(lambda conn: conn.execute("SELECT MAX(message_id) FROM attendance").fetchone()[0])
+            timings = {}
+            for name, call in (("standings page", lambda: db.penalties.standings(GUILD, 21)),
+                               ("driver history", lambda: db.penalties.page(GUILD, rng.choice(uids), 16)),
+                               ("attendance post", lambda: db.attendance.for_message(GUILD, post))):
+                samples = []
+                for _ in range(300):
+                    start = time.perf_counter()
+                    await call()
+                    samples.append((time.perf_counter() - start) * 1e6)
+                timings[name] = _percentile(samples, 50)
+            size = sum(os.path.getsize(f) for f in glob.glob(path + "*"))
+            rows = db.run_sync(lambda conn: conn.execute("SELECT (SELECT COUNT(*) FROM penalties), "
+                                                         "(SELECT COUNT(*) FROM attendance)").fetchone())
+            print(f"{label:>11}: live file {size / 1024 / 1024:.1f}MB penalties={rows[0]} attendance={rows[1]} "
+                  f"rollovers={spent:.2f}s · " + " · ".join(f"{name} p50={us:.0f}us" for name, us in timings.items()))
+            if rollover:
+                for season in range(1, seasons):
+                    start = time.perf_counter()
+                    await db.penalties.standings(GUILD, 21, season=season)
+                    cold = (time.perf_counter() - start) * 1e6
+                    start = time.perf_counter()
+                    await db.penalties.standings(GUILD, 21, season=season)
+                    warm = (time.perf_counter() - start) * 1e6
+                    print(f"{'':>11}  season {season} standings page: first (ATTACH) {cold:.0f}us, then {warm:.0f}us")
+            db.close()
+        shutil.rmtree(folder)
+    asyncio.run(_run())
+
+
+def _load_bot(path: str):
+    """Import main against the database at ``path``; importing it has no side effects."""
+    os.environ["DB_PATH"] = path
+    import main
+    if main.db.path != path:
+        raise RuntimeError("main was already imported against another database")
+    main.db.migrate()
+    return main
+
+
+def bench_commands(drivers: int = 5_000, penalties: int = 50_000, bans: int = 300, ops: int = 400,
+                   concurrency: int = 20, latency: float = 0.02):
+    """The real command and button callbacks against fake Discord objects and a seeded database.
+
+    Each REST call the bot makes costs ``latency`` seconds. "ack" is when the user
+    sees a response; "wall" is when the callback returns.
+    """
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    bot = _load_bot(path)
+    rng = random.Random(19)
+    uids = [str(10_000 + i) for i in range(drivers)]
+    names = {uid: f"driver{uid}" for uid in uids}
+
+    def _seed(conn):
+        conn.executemany("INSERT INTO drivers (guild_id, user_id, name) VALUES (?, ?, ?)",
+                         ((GUILD, uid, names[uid]) for uid in uids))
+        conn.executemany("INSERT INTO penalties (guild_id, user_id, points, reason) VALUES (?, ?, ?, ?)",
+                         ((GUILD, rng.choice(uids), rng.randint(1, 3), "seed") for _ in range(penalties)))
+        # unexpired, so /banlist and the live ban list render every one of them
+        expires = int(time.time()) + BAN_DURATION
+        conn.executemany("INSERT INTO bans (guild_id, user_id, type, reason, expires_at) VALUES (?, ?, ?, ?, ?)",
+                         ((GUILD, uid, rng.choice(("race", "quali")), "seed", expires)
+                          for uid in rng.sample(uids, bans)))
+        conn.execute("ANALYZE")
+    bot.db.run_sync(_seed)
+
+    async def _run():
+        await bot.db.drivers.load_index()
+        bot.live_banlist.delay = 0.05
+        api = Api(latency)
+        guild = FakeGuild(api, int(GUILD))
+        steward = guild.add_member(1, "steward", (guild.add_role("Steward"),))
+        for uid in uids[: drivers * 9 // 10]:  # the rest have left; their names come from the DB
+            guild.add_member(int(uid), names[uid])
+        channel = guild.add_text_channel("attendance")
+        post = await channel.send(embed=bot.red_black_embed("Race Attendance", "Click below."))
+        # a live ban list, so penalty changes also pay for its debounced refreshes
+        await bot.live_banlist.post(guild, guild.add_text_channel("ban-list"))
+        await bot.live_standings.post(guild, guild.add_text_channel("standings"))
+        active = await bot.db.bans.active(GUILD)
+        pages = bot.render_ban_pages(active, await bot.member_names.for_ban_rows(guild, active), "Active Bans")
+        assert len(active) == bans and pages, f"seeded {bans} bans, {len(active)} active, {len(pages)} pages"
+        legacy_view = bot.AttendanceView()
+        clickers = [m for m in guild.members.values() if m is not steward]
+        tickets = iter(clickers)
+
+        def driver():
+            uid = rng.choice(uids)
+            return bot.DriverRef(uid, names[uid])
+
+        async def penaltypoints(itx):
+            await bot.penaltypoints.callback(itx, driver(), rng.randint(1, 3), "Track limits")
+
+        async def removepoints(itx):
+            await bot.removepoints.callback(itx, driver(), 1, "Appeal")
+
+        async def banlist(itx):
+            await bot.banlist.callback(itx)
+
+        async def standings(itx):
+            await bot.standings.callback(itx)
+
+        async def attendance_click(itx):
+            itx.user, itx.message = rng.choice(clickers), post
+            await bot.AttendanceButton(rng.choice(("attend", "not", "maybe")), post.id).callback(itx)
+
+        async def attendance_view_click(itx):
+            itx.user, itx.message = rng.choice(clickers), post
+            await rng.choice((legacy_view.attend, legacy_view.not_attend, legacy_view.maybe)).callback(itx)
+
+        async def create_ticket(itx):
+            itx.user = next(tickets)
+            await bot.TicketView(guild.id).create_ticket.callback(itx)
+
+        scenarios = {
+            "/penaltypoints": penaltypoints,
+            "/removepoints": removepoints,
+            "/banlist": banlist,
+            "/standings": standings,
+            "attendance button": attendance_click,
+            "AttendanceView button": attendance_view_click,
+            "create ticket": create_ticket,
+        }
+        print(f"drivers={drivers} penalties={penalties} bans={bans} ops/scenario={ops} "
+              f"concurrency={concurrency} simulated REST latency={latency * 1000:.0f}ms")
+        for name, op in scenarios.items():
+            api.calls.clear()
+            acks, walls = [], []
+            queue = iter(range(ops))
+            loop = asyncio.get_running_loop()
+
+            async def worker():
+                for _ in queue:
+                    itx = FakeInteraction(guild, steward, channel)
+                    start = loop.time()
+                    await op(itx)
+                    walls.append((loop.time() - start) * 1e3)
+                    acks.append(((itx.acked or loop.time()) - start) * 1e3)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            # background work the scenario caused: debounced ban list, coalesced edits, queued sends
+            await asyncio.sleep(bot.live_banlist.delay * 2)
+            await bot.attendance.flush()
+            await bot.outbox.flush()
+            calls = ", ".join(f"{k}={v / ops:.2f}" for k, v in sorted(api.calls.items()))
+            print(f"{name:>22}: {ops / elapsed:7.1f} ops/s  ack p50={_percentile(acks, 50):6.1f}ms "
+                  f"p99={_percentile(acks, 99):6.1f}ms  wall p50={_percentile(walls, 50):6.1f}ms "
+                  f"p99={_percentile(walls, 99):6.1f}ms")
+            print(f"{'':>24}API calls/op: {calls}")
+        await bot.greeter.flush()
+
+    try:
+        asyncio.run(_run())
+    finally:
+        bot.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+SCENARIOS = {
+    "lookups": bench_lookups,
+    "attendance": bench_attendance,
+    "autocomplete": bench_autocomplete,
+    "import": bench_import,
+    "ledger": bench_ledger,
+    "transcript": bench_transcript,
+    "export": bench_export,
+    "outbox": bench_outbox,
+    "joins": bench_joins,
+    "standings": bench_standings,
+    "rollover": bench_rollover,
+    "commands": bench_commands,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or SCENARIOS:
+        print(f"== {name} ==")
+        SCENARIOS[name]()
@@ -0,0 +1,1464 @@
+# db.py
+"""Async data-access layer for the league database.
+
+Every SQLite call runs on a dedicated worker thread per database file, so the
+discord.py event loop never waits on disk I/O. Each repository method is its own
+transaction, scoped to one guild.
+"""
+import asyncio
+import bisect
+import datetime
+import glob
+import json
+import os
+import sqlite3
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from typing import Optional
+
+from metrics import db_seconds, spent
+
+# default automatic ban thresholds (total penalty points); per guild via settings
+QUALI_BAN_POINTS = 10
+RACE_BAN_POINTS = 15
+DEFAULT_BAN_THRESHOLDS = (("quali", QUALI_BAN_POINTS), ("race", RACE_BAN_POINTS))
+# bans lift automatically this long after they are applied
+BAN_DURATION = 8 * 24 * 3600
+# archived season files kept attached to a DB connection at once (SQLite allows 10)
+SEASON_ATTACH_MAX = 4
+DISCORD_EPOCH_MS = 1420070400000
+
+# ---------- Schema migrations ----------
+# Each migration runs once, in order, inside its own transaction; the applied
+# version is recorded in schema_version. Never edit a shipped migration, append
+# a new one instead.
+_SETTINGS_TABLE = """CREATE TABLE IF NOT EXISTS {name} (
+    guild_id TEXT PRIMARY KEY,
+    welcome_channel_id TEXT,
+    goodbye_channel_id TEXT,
+    ticket_log_channel_id TEXT,
+    steward_role_name TEXT DEFAULT 'Steward',
+    ticket_category_id TEXT,
+    welcome_message TEXT,
+    goodbye_message TEXT
+)"""
+
+
+def _m1_base_schema(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS drivers (
+        user_id TEXT PRIMARY KEY,
+        name TEXT
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS penalties (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        points INTEGER,
+        reason TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS bans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        type TEXT, -- 'quali' or 'race'
+        reason TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS attendance (
+        message_id TEXT,
+        user_id TEXT,
+        status TEXT, -- attend / not / maybe
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (message_id, user_id)
+    )""")
+    conn.execute(_SETTINGS_TABLE.format(name="settings"))
+    conn.execute("""CREATE TABLE IF NOT EXISTS tickets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id TEXT,
+        channel_id TEXT,
+        owner_id TEXT,
+        opened_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        closed_at DATETIME
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS banlist_messages (
+        guild_id TEXT PRIMARY KEY,
+        channel_id TEXT,
+        message_id TEXT
+    )""")
+
+
+def _m2_repair_settings(conn: sqlite3.Connection):
+    # Databases created before migrations lost welcome_message to a missing comma
+    # (it was swallowed into ticket_category_id's type). Rebuild the table.
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(settings)")]
+    if "welcome_message" in cols:
+        return
+    conn.execute(_SETTINGS_TABLE.format(name="settings_new"))
+    keep = ", ".join(cols)
+    conn.execute(f"INSERT INTO settings_new ({keep}) SELECT {keep} FROM settings")
+    conn.execute("DROP TABLE settings")
+    conn.execute("ALTER TABLE settings_new RENAME TO settings")
+
+
+def _m3_hot_path_indexes(conn: sqlite3.Connection):
+    # attendance lookups by message_id are already served by its primary key
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bans_user_type ON bans (user_id, type)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_penalties_user_ts ON penalties (user_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_user ON attendance (user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_channel ON tickets (channel_id)")
+
+
+def _m4_driver_totals(conn: sqlite3.Connection):
+    # running point total per driver, kept in step with penalties by triggers so
+    # every insert/update/delete adjusts it inside the same transaction
+    conn.execute("""CREATE TABLE IF NOT EXISTS driver_totals (
+        user_id TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0
+    )""")
+    conn.execute("""INSERT OR REPLACE INTO driver_totals (user_id, total)
+        SELECT user_id, COALESCE(SUM(points), 0) FROM penalties GROUP BY user_id""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_penalties_insert AFTER INSERT ON penalties BEGIN
+        INSERT INTO driver_totals (user_id, total) VALUES (NEW.user_id, NEW.points)
+            ON CONFLICT (user_id) DO UPDATE SET total = total + NEW.points;
+    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_penalties_delete AFTER DELETE ON penalties BEGIN
+        UPDATE driver_totals SET total = total - OLD.points WHERE user_id = OLD.user_id;
+    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_penalties_update AFTER UPDATE OF user_id, points ON penalties BEGIN
+        UPDATE driver_totals SET total = total - OLD.points WHERE user_id = OLD.user_id;
+        INSERT INTO driver_totals (user_id, total) VALUES (NEW.user_id, NEW.points)
+            ON CONFLICT (user_id) DO UPDATE SET total = total + NEW.points;
+    END""")
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(settings)")]
+    for col in ("quali_ban_points", "race_ban_points"):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE settings ADD COLUMN {col} INTEGER")
+
+
+def _m5_ban_expiry(conn: sqlite3.Connection):
+    # bans.timestamp is free-form text; store a normalized UTC epoch expiry instead
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(bans)")]
+    if "expires_at" not in cols:
+        conn.execute("ALTER TABLE bans ADD COLUMN expires_at INTEGER")
+    conn.execute("UPDATE bans SET expires_at = CAST(strftime('%s', timestamp) AS INTEGER) + ? WHERE expires_at IS NULL",
+                 (BAN_DURATION,))
+    # unparseable timestamps: start the clock now rather than never expiring
+    conn.execute("UPDATE bans SET expires_at = CAST(strftime('%s', 'now') AS INTEGER) + ? WHERE expires_at IS NULL",
+                 (BAN_DURATION,))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bans_expires ON bans (expires_at)")
+
+
+def _m6_banlist_pages(conn: sqlite3.Connection):
+    # the live ban list can span several messages: one row per page
+    conn.execute("""CREATE TABLE banlist_messages_new (
+        guild_id TEXT NOT NULL,
+        page INTEGER NOT NULL DEFAULT 0,
+        channel_id TEXT,
+        message_id TEXT,
+        PRIMARY KEY (guild_id, page)
+    )""")
+    conn.execute("""INSERT INTO banlist_messages_new (guild_id, page, channel_id, message_id)
+        SELECT guild_id, 0, channel_id, message_id FROM banlist_messages WHERE message_id IS NOT NULL""")
+    conn.execute("DROP TABLE banlist_messages")
+    conn.execute("ALTER TABLE banlist_messages_new RENAME TO banlist_messages")
+
+
+def _m7_bot_state(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS bot_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )""")
+
+
+def _m8_persistent_messages(conn: sqlite3.Connection):
+    # every message carrying buttons that must keep working across restarts
+    conn.execute("""CREATE TABLE IF NOT EXISTS persistent_messages (
+        message_id TEXT PRIMARY KEY,
+        guild_id TEXT,
+        channel_id TEXT,
+        kind TEXT NOT NULL, -- 'attendance' / 'ticket_panel'
+        state TEXT,         -- JSON the view needs to rebuild itself
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_persistent_kind ON persistent_messages (kind, message_id)")
+    # attendance posts made before the index only survive as attendance rows
+    conn.execute("""INSERT OR IGNORE INTO persistent_messages (message_id, kind, state)
+        SELECT DISTINCT message_id, 'attendance', '{"legacy": true}' FROM attendance""")
+
+
+def _m9_driver_name_index(conn: sqlite3.Connection):
+    # keyset pagination over drivers in (name NOCASE, user_id) order; penalties
+    # pages use idx_penalties_user_ts, which already ends in the rowid (id)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_drivers_name_nocase ON drivers (name COLLATE NOCASE, user_id)")
+
+
+def _m10_incident_refs(conn: sqlite3.Connection):
+    # race-result imports tag each penalty with the steward's incident reference
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(penalties)")]
+    if "incident_ref" not in cols:
+        conn.execute("ALTER TABLE penalties ADD COLUMN incident_ref TEXT")
+
+
+def _m11_penalty_ledger(conn: sqlite3.Connection):
+    # penalties become an append-only ledger: removing points inserts a negative
+    # adjustment instead of editing or deleting history. Each row stores the driver's
+    # balance after it and its place on the driver's running tally of points accrued
+    # (positive rows) or removed (negative rows); an adjustment cancels the accrued
+    # points (cumulative + points, cumulative], oldest first.
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(penalties)")]
+    for col in ("cumulative", "balance"):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE penalties ADD COLUMN {col} INTEGER")
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(driver_totals)")]
+    for col in ("accrued", "removed"):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE driver_totals ADD COLUMN {col} INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""WITH running AS (
+            SELECT id, SUM(MAX(points, 0)) OVER w AS accrued, SUM(MAX(-points, 0)) OVER w AS removed,
+                   SUM(points) OVER w AS balance
+            FROM penalties WINDOW w AS (PARTITION BY user_id ORDER BY id))
+        UPDATE penalties SET balance = running.balance,
+            cumulative = CASE WHEN points < 0 THEN running.removed ELSE running.accrued END
+        FROM running WHERE penalties.id = running.id""")
+    conn.execute("""UPDATE driver_totals SET
+        accrued = (SELECT COALESCE(SUM(MAX(points, 0)), 0) FROM penalties p WHERE p.user_id = driver_totals.user_id),
+        removed = (SELECT COALESCE(SUM(MAX(-points, 0)), 0) FROM penalties p WHERE p.user_id = driver_totals.user_id)""")
+    for trigger in ("trg_penalties_insert", "trg_penalties_delete", "trg_penalties_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("""CREATE TRIGGER trg_penalties_insert AFTER INSERT ON penalties BEGIN
+        INSERT INTO driver_totals (user_id, total, accrued, removed)
+            VALUES (NEW.user_id, NEW.points, MAX(NEW.points, 0), MAX(-NEW.points, 0))
+            ON CONFLICT (user_id) DO UPDATE SET total = total + NEW.points,
+                accrued = accrued + MAX(NEW.points, 0), removed = removed + MAX(-NEW.points, 0);
+        UPDATE penalties SET (balance, cumulative) = (
+            SELECT total, CASE WHEN NEW.points < 0 THEN removed ELSE accrued END
+            FROM driver_totals WHERE user_id = NEW.user_id)
+            WHERE id = NEW.id;
+    END""")
+    # deletes only happen when a driver is removed outright
+    conn.execute("""CREATE TRIGGER trg_penalties_delete AFTER DELETE ON penalties BEGIN
+        UPDATE driver_totals SET total = total - OLD.points, accrued = accrued - MAX(OLD.points, 0),
+            removed = removed - MAX(-OLD.points, 0) WHERE user_id = OLD.user_id;
+    END""")
+    conn.execute("""CREATE TRIGGER trg_penalties_append_only BEFORE UPDATE OF user_id, points, reason ON penalties BEGIN
+        SELECT RAISE(ABORT, 'penalties is an append-only ledger');
+    END""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_penalties_user_id ON penalties (user_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_penalties_user_accrued ON penalties (user_id, cumulative) WHERE points > 0")
+
+
+def _legacy_guild(conn: sqlite3.Connection) -> str:
+    # rows written before partitioning belong to the one league the bot served:
+    # LEGACY_GUILD_ID if set, else the only guild the database has seen. Rows left
+    # with '' stay in the file but no guild's queries see them.
+    if os.environ.get("LEGACY_GUILD_ID"):
+        return os.environ["LEGACY_GUILD_ID"]
+    known = set()
+    for table in ("settings", "tickets", "banlist_messages", "persistent_messages"):
+        known.update(r[0] for r in conn.execute(f"SELECT DISTINCT guild_id FROM {table} WHERE guild_id IS NOT NULL"))
+    return known.pop() if len(known) == 1 else ""
+
+
+def _m12_guild_partitions(conn: sqlite3.Connection):
+    # partition league data by guild so one process can host several leagues;
+    # every key and index leads on guild_id
+    guild = _legacy_guild(conn)
+    for trigger in ("trg_penalties_insert", "trg_penalties_delete", "trg_penalties_append_only"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    conn.execute("""CREATE TABLE drivers_new (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        name TEXT,
+        PRIMARY KEY (guild_id, user_id)
+    )""")
+    conn.execute("INSERT INTO drivers_new (guild_id, user_id, name) SELECT ?, user_id, name FROM drivers", (guild,))
+    conn.execute("""CREATE TABLE driver_totals_new (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        accrued INTEGER NOT NULL DEFAULT 0,
+        removed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, user_id)
+    )""")
+    conn.execute("""INSERT INTO driver_totals_new (guild_id, user_id, total, accrued, removed)
+        SELECT ?, user_id, total, accrued, removed FROM driver_totals""", (guild,))
+    conn.execute("""CREATE TABLE attendance_new (
+        guild_id TEXT NOT NULL,
+        message_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        status TEXT, -- attend / not / maybe
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (guild_id, message_id, user_id)
+    )""")
+    conn.execute("UPDATE persistent_messages SET guild_id = ? WHERE guild_id IS NULL", (guild,))
+    conn.execute("""INSERT INTO attendance_new (guild_id, message_id, user_id, status, timestamp)
+        SELECT COALESCE((SELECT guild_id FROM persistent_messages p WHERE p.message_id = a.message_id), ?),
+               message_id, user_id, status, timestamp
+        FROM attendance a ORDER BY rowid""", (guild,))
+    for table in ("drivers", "driver_totals", "attendance"):
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    for table in ("penalties", "bans"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN guild_id TEXT NOT NULL DEFAULT ''")
+        conn.execute(f"UPDATE {table} SET guild_id = ?", (guild,))
+    for index in ("idx_bans_user_type", "idx_penalties_user_ts", "idx_penalties_user_id", "idx_penalties_user_accrued",
+                  "idx_tickets_channel"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    conn.execute("CREATE INDEX idx_drivers_guild_name ON drivers (guild_id, name COLLATE NOCASE, user_id)")
+    conn.execute("CREATE INDEX idx_attendance_guild_user ON attendance (guild_id, user_id)")
+    conn.execute("CREATE INDEX idx_penalties_guild_user ON penalties (guild_id, user_id, id)")
+    conn.execute("CREATE INDEX idx_penalties_guild_accrued ON penalties (guild_id, user_id, cumulative) WHERE points > 0")
+    conn.execute("CREATE INDEX idx_bans_guild_user_type ON bans (guild_id, user_id, type)")
+    conn.execute("CREATE INDEX idx_bans_guild_expires ON bans (guild_id, expires_at)")
+    conn.execute("CREATE INDEX idx_tickets_guild_channel ON tickets (guild_id, channel_id)")
+
+    conn.execute("""CREATE TRIGGER trg_penalties_insert AFTER INSERT ON penalties BEGIN
+        INSERT INTO driver_totals (guild_id, user_id, total, accrued, removed)
+            VALUES (NEW.guild_id, NEW.user_id, NEW.points, MAX(NEW.points, 0), MAX(-NEW.points, 0))
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET total = total + NEW.points,
+                accrued = accrued + MAX(NEW.points, 0), removed = removed + MAX(-NEW.points, 0);
+        UPDATE penalties SET (balance, cumulative) = (
+            SELECT total, CASE WHEN NEW.points < 0 THEN removed ELSE accrued END
+            FROM driver_totals WHERE guild_id = NEW.guild_id AND user_id = NEW.user_id)
+            WHERE id = NEW.id;
+    END""")
+    conn.execute("""CREATE TRIGGER trg_penalties_delete AFTER DELETE ON penalties BEGIN
+        UPDATE driver_totals SET total = total - OLD.points, accrued = accrued - MAX(OLD.points, 0),
+            removed = removed - MAX(-OLD.points, 0) WHERE guild_id = OLD.guild_id AND user_id = OLD.user_id;
+    END""")
+    conn.execute("""CREATE TRIGGER trg_penalties_append_only
+        BEFORE UPDATE OF guild_id, user_id, points, reason ON penalties BEGIN
+        SELECT RAISE(ABORT, 'penalties is an append-only ledger');
+    END""")
+
+
+def _m13_open_ticket_index(conn: sqlite3.Connection):
+    # one open ticket per owner: found by (guild, owner) among unclosed tickets only
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_open_owner ON tickets (guild_id, owner_id) WHERE closed_at IS NULL")
+
+
+def _m14_ticket_transcripts(conn: sqlite3.Connection):
+    # gzip JSONL transcripts written when a ticket closes, and where they were posted
+    conn.execute("""CREATE TABLE IF NOT EXISTS ticket_transcripts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id TEXT NOT NULL,
+        ticket_id INTEGER NOT NULL,
+        channel_id TEXT,
+        path TEXT NOT NULL,
+        message_count INTEGER,
+        bytes INTEGER,
+        log_message_id TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_guild_ticket ON ticket_transcripts (guild_id, ticket_id)")
+
+
+def _m15_standings(conn: sqlite3.Connection):
+    # driver_totals is kept current by triggers; this index keeps it ranked, so a
+    # standings page is a range read in (total DESC, user_id) order
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_driver_totals_rank ON driver_totals (guild_id, total DESC, user_id)")
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(settings)")]
+    for col in ("standings_channel_id", "standings_message_id"):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE settings ADD COLUMN {col} TEXT")
+
+
+def _m16_seasons(conn: sqlite3.Connection):
+    # a finished season's rows move to their own archive file (one row here per
+    # file); lifted bans are kept in ban_history instead of vanishing
+    conn.execute("""CREATE TABLE IF NOT EXISTS seasons (
+        guild_id TEXT NOT NULL,
+        season INTEGER NOT NULL,
+        file TEXT NOT NULL, -- archive file name, beside the live database
+        ended_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        summary TEXT,       -- JSON rows archived per table
+        PRIMARY KEY (guild_id, season)
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS ban_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id TEXT NOT NULL,
+        user_id TEXT,
+        type TEXT,
+        reason TEXT,
+        timestamp DATETIME,
+        expires_at INTEGER,
+        lifted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ban_history_guild_user ON ban_history (guild_id, user_id)")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_bans_history AFTER DELETE ON bans BEGIN
+        INSERT INTO ban_history (guild_id, user_id, type, reason, timestamp, expires_at)
+            VALUES (OLD.guild_id, OLD.user_id, OLD.type, OLD.reason, OLD.timestamp, OLD.expires_at);
+    END""")
+
+
+def _m17_guild_id_order(conn: sqlite3.Connection):
+    # a guild's ledger, bans and tickets in id order straight off an index, so an
+    # export reads only that guild's rows and never sorts them
+    for table in ("penalties", "bans", "tickets"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_guild_id ON {table} (guild_id, id)")
+
+
+MIGRATIONS = [
+    (1, _m1_base_schema),
+    (2, _m2_repair_settings),
+    (3, _m3_hot_path_indexes),
+    (4, _m4_driver_totals),
+    (5, _m5_ban_expiry),
+    (6, _m6_banlist_pages),
+    (7, _m7_bot_state),
+    (8, _m8_persistent_messages),
+    (9, _m9_driver_name_index),
+    (10, _m10_incident_refs),
+    (11, _m11_penalty_ledger),
+    (12, _m12_guild_partitions),
+    (13, _m13_open_ticket_index),
+    (14, _m14_ticket_transcripts),
+    (15, _m15_standings),
+    (16, _m16_seasons),
+    (17, _m17_guild_id_order),
+]
+
+
+def _migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations in order, each in its own transaction. Return the schema version."""
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    conn.commit()
+    current = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    for version, fn in MIGRATIONS:
+        if version > current:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                fn(conn)
+                conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+            current = version
+    return current
+
+
+class _Shard:
+    """One SQLite file and the single worker thread that uses it; migrated when first opened."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="league-db")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._attached = OrderedDict()  # archive path -> schema name, least recently used first
+
+    def _connect(self) -> sqlite3.Connection:
+        # a URI connection, so the file: URIs ATTACHed in attach() are honoured on every SQLite build
+        conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(self.path))}", uri=True)
+        # WAL + NORMAL: commits append to the log without an fsync each time
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        self.version = _migrate(conn)
+        return conn
+
+    def _call(self, fn, args):
+        # runs on the worker thread only
+        if self._conn is None:
+            self._conn = self._connect()
+        with self._conn:  # commit on success, rollback on error
+            return fn(self._conn, *args)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, self._call, fn, args)
+        finally:
+            elapsed = time.perf_counter() - start
+            db_seconds.observe(elapsed)
+            spent("db", elapsed)
+
+    def run_sync(self, fn, *args):
+        return self._executor.submit(self._call, fn, args).result()
+
+    def attach(self, conn: sqlite3.Connection, path: str) -> str:
+        """Schema name of the archive at ``path``, attached read-only on first use (worker thread only)."""
+        schema = self._attached.get(path)
+        if schema is not None:
+            self._attached.move_to_end(path)
+            return schema
+        if len(self._attached) >= SEASON_ATTACH_MAX:
+            _, oldest = self._attached.popitem(last=False)
+            conn.execute(f"DETACH DATABASE {oldest}")
+        schema = next(f"season_{n}" for n in range(SEASON_ATTACH_MAX + 1) if f"season_{n}" not in self._attached.values())
+        # mode=ro: a missing archive is an error rather than a new empty file
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro",))
+        found = {name for (name,) in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+        missing = [table for table, _, _ in SEASON_TABLES if table not in found]
+        if missing:
+            conn.execute(f"DETACH DATABASE {schema}")
+            raise sqlite3.OperationalError(f"not a season archive (no {', '.join(missing)})")
+        self._attached[path] = schema
+        return schema
+
+    def detach(self, conn: sqlite3.Connection, path: str):
+        schema = self._attached.pop(path, None)
+        if schema is not None:
+            conn.execute(f"DETACH DATABASE {schema}")
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._attached.clear()
+        self._executor.submit(_close).result()
+        self._executor.shutdown()
+
+
+class Database:
+    """Routes each guild's data to its SQLite file and owns the repositories.
+
+    By default every guild shares ``path``. With ``per_guild`` each guild gets its
+    own file beside it (``league.<guild id>.db``) and its own worker thread, so a
+    busy league's writes never queue behind another's; bot-wide state stays in
+    ``path``. Every table is keyed by guild_id either way.
+    """
+
+    def __init__(self, path: str, per_guild: bool = False):
+        self.path = path
+        self.per_guild = per_guild
+        self._shared = _Shard(path)
+        self._guild_shards = {}
+        if per_guild:
+            root, ext = os.path.splitext(path)
+            for found in glob.glob(f"{glob.escape(root)}.*{ext}"):
+                guild_id = found[len(root) + 1:len(found) - len(ext)]
+                if guild_id.isdigit():
+                    self._guild_shards[guild_id] = _Shard(found)
+        self.drivers = DriverRepo(self)
+        self.penalties = PenaltyRepo(self)
+        self.bans = BanRepo(self)
+        self.attendance = AttendanceRepo(self)
+        self.tickets = TicketRepo(self)
+        self.settings = SettingsRepo(self)
+        self.state = StateRepo(self)
+        self.persistent = PersistentMessageRepo(self)
+        self.archive = ArchiveRepo(self)
+        self.seasons = SeasonRepo(self)
+        if per_guild:
+            self._split_shared()
+
+    def _split_shared(self):
+        """Move guild rows left in the shared file (written before per_guild was turned on) into the guild files.
+
+        Each guild is copied in one transaction that also records it as split, then
+        removed from the shared file, so a crash in between is finished on the next start.
+        Raise RuntimeError if a guild's file already holds other data for it.
+        """
+        for guild_id in self._shared.run_sync(_shared_guilds):
+            shard = self.shard(guild_id)
+            shard.run_sync(lambda conn: None)  # create and migrate the file first
+            moved = self._shared.run_sync(_split_guild, guild_id, shard.path)
+            if moved is None:
+                raise RuntimeError(f"guild {guild_id} has data in both {self.path} and {shard.path}; "
+                                   f"merge them by hand before starting with DB_PER_GUILD=1")
+            self._shared.run_sync(_drop_guild, guild_id)
+            shard.run_sync(lambda conn: conn.execute("DELETE FROM bot_state WHERE key = ?", (f"split:{guild_id}",)))
+            print(f"Moved guild {guild_id} from {self.path} into {shard.path}:",
+                  ", ".join(f"{table} {rows}" for table, rows in moved.items() if rows) or "copied on an earlier start")
+
+    def shard(self, guild_id: str) -> _Shard:
+        """The file holding ``guild_id``'s data."""
+        if not self.per_guild:
+            return self._shared
+        shard = self._guild_shards.get(guild_id)
+        if shard is None:
+            root, ext = os.path.splitext(self.path)
+            shard = self._guild_shards[guild_id] = _Shard(f"{root}.{guild_id}{ext}")
+        return shard
+
+    def shards(self) -> list:
+        """Every file holding guild data, for sweeps that span all guilds."""
+        return list(self._guild_shards.values()) if self.per_guild else [self._shared]
+
+    async def run(self, fn, *args):
+        """Run ``fn(conn, *args)`` in its own transaction on the shared file's DB thread."""
+        return await self._shared.run(fn, *args)
+
+    def run_sync(self, fn, *args):
+        """Blocking variant of :meth:`run` for startup code outside the event loop."""
+        return self._shared.run_sync(fn, *args)
+
+    def migrate(self) -> int:
+        """Open and migrate the shared file now instead of on first use. Return its schema version."""
+        self.run_sync(lambda conn: None)
+        return self._shared.version
+
+    def close(self):
+        for shard in [self._shared, *self._guild_shards.values()]:
+            shard.close()
+
+
+# ---------- Per-guild split (worker thread) ----------
+def _guild_tables(conn: sqlite3.Connection) -> list:
+    """Tables keyed by guild_id, in an order that is safe to delete in: bans before the
+    ban_history their trigger fills, penalties before the driver_totals theirs update."""
+    tables = [name for (name,) in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")
+              if any(col[1] == "guild_id" for col in conn.execute(f"PRAGMA main.table_info({name})"))]
+    last = ("ban_history", "driver_totals")
+    return [t for t in tables if t not in last] + [t for t in last if t in tables]
+
+
+def _shared_guilds(conn: sqlite3.Connection) -> list:
+    union = " UNION ".join(f"SELECT guild_id FROM {table}" for table in _guild_tables(conn))
+    return [row[0] for row in conn.execute(f"SELECT guild_id FROM ({union}) WHERE guild_id IS NOT NULL ORDER BY 1")]
+
+
+def _split_guild(conn: sqlite3.Connection, guild_id: str, path: str) -> Optional[dict]:
+    """Copy the guild's rows into the guild file at ``path``. Return rows copied per table,
+    ``{}`` if an earlier run already copied them, or None if the guild file holds other rows."""
+    conn.execute("ATTACH DATABASE ? AS guild", (f"file:{urllib.parse.quote(os.path.abspath(path))}",))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        marker = f"split:{guild_id}"
+        if conn.execute("SELECT 1 FROM guild.bot_state WHERE key = ?", (marker,)).fetchone():
+            conn.rollback()
+            return {}
+        tables = _guild_tables(conn)
+        if any(conn.execute(f"SELECT 1 FROM guild.{table} WHERE guild_id = ? LIMIT 1", (guild_id,)).fetchone()
+               for table in tables):
+            conn.rollback()
+            return None
+        moved = {}
+        for table in tables:
+            if table == "driver_totals":
+                continue  # rebuilt by the penalties insert trigger, replaying the ledger in id order
+            cols = ", ".join(col[1] for col in conn.execute(f"PRAGMA main.table_info({table})"))
+            moved[table] = conn.execute(f"INSERT INTO guild.{table} ({cols}) SELECT {cols} FROM main.{table} "
+                                        f"WHERE guild_id = ? ORDER BY rowid", (guild_id,)).rowcount
+        conn.execute("INSERT INTO guild.bot_state (key, value) VALUES (?, ?)", (marker, str(int(time.time()))))
+        conn.commit()
+        return moved
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE guild")
+
+
+def _drop_guild(conn: sqlite3.Connection, guild_id: str):
+    for table in _guild_tables(conn):
+        conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (guild_id,))
+
+
+# ---------- Transaction helpers (worker thread) ----------
+def _ensure_driver(conn: sqlite3.Connection, guild_id: str, user_id: str, name: Optional[str]):
+    """Create the driver, or refresh their stored name if it changed."""
+    if name:
+        conn.execute('INSERT INTO drivers (guild_id, user_id, name) VALUES (?, ?, ?) '
+                     'ON CONFLICT (guild_id, user_id) DO UPDATE SET name = excluded.name WHERE name IS NOT excluded.name',
+                     (guild_id, user_id, name))
+
+
+def _active_ban_types(conn: sqlite3.Connection, guild_id: str, user_id: str) -> list:
+    return [r[0] for r in conn.execute('SELECT type FROM bans WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))]
+
+
+def _driver_total(conn: sqlite3.Connection, guild_id: str, user_id: str, schema: str = "main") -> int:
+    row = conn.execute(f'SELECT total FROM {schema}.driver_totals WHERE guild_id = ? AND user_id = ?',
+                       (guild_id, user_id)).fetchone()
+    return row[0] if row else 0
+
+
+def _insert_ban(conn: sqlite3.Connection, guild_id: str, user_id: str, btype: str, reason: str) -> int:
+    """Insert a ban lasting BAN_DURATION. Return its expiry epoch."""
+    expires_at = int(time.time()) + BAN_DURATION
+    conn.execute('INSERT INTO bans (guild_id, user_id, type, reason, timestamp, expires_at) '
+                 'VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?)', (guild_id, user_id, btype, reason, expires_at))
+    return expires_at
+
+
+def _apply_auto_bans(conn: sqlite3.Connection, guild_id: str, user_id: str, old_total: int, new_total: int,
+                     thresholds) -> list:
+    """Insert/remove automatic bans for each threshold the total crossed between old_total and new_total.
+
+    Return (ban type, expiry epoch) for any bans inserted.
+    """
+    added = []
+    for btype, threshold in thresholds:
+        if old_total < threshold <= new_total:
+            if conn.execute('SELECT 1 FROM bans WHERE guild_id = ? AND user_id = ? AND type = ?',
+                            (guild_id, user_id, btype)).fetchone() is None:
+                reason = f"Automatic {btype} ban for {threshold}+ points"
+                added.append((btype, _insert_ban(conn, guild_id, user_id, btype, reason)))
+        elif new_total < threshold <= old_total:
+            conn.execute('DELETE FROM bans WHERE guild_id = ? AND user_id = ? AND type = ?', (guild_id, user_id, btype))
+    return added
+
+
+def _load_settings(conn: sqlite3.Connection, guild_id: str) -> Optional[dict]:
+    cur = conn.execute('SELECT * FROM settings WHERE guild_id = ?', (guild_id,))
+    row = cur.fetchone()
+    return dict(zip((d[0] for d in cur.description), row)) if row else None
+
+
+# ---------- Repositories ----------
+class _Repo:
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def run(self, guild_id: str, fn, *args):
+        """Run ``fn(conn, *args)`` on the file holding ``guild_id``'s data."""
+        return await self.db.shard(guild_id).run(fn, *args)
+
+
+class DriverNameIndex:
+    """Sorted (casefolded name, user_id) array answering name-prefix searches with bisect."""
+
+    def __init__(self):
+        self._keys = []
+        self._names = {}  # user_id -> display name
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, rows):
+        self._names = {uid: name for uid, name in rows if name}
+        self._keys = sorted((name.casefold(), uid) for uid, name in self._names.items())
+
+    def add(self, user_id: str, name: Optional[str]):
+        old = self._names.get(user_id)
+        if not name or old == name:
+            return
+        if old is not None:
+            self._discard(old, user_id)
+        self._names[user_id] = name
+        bisect.insort(self._keys, (name.casefold(), user_id))
+
+    def remove(self, user_id: str):
+        old = self._names.pop(user_id, None)
+        if old is not None:
+            self._discard(old, user_id)
+
+    def _discard(self, name: str, user_id: str):
+        key = (name.casefold(), user_id)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def name(self, user_id: str) -> Optional[str]:
+        return self._names.get(user_id)
+
+    def search(self, prefix: str, limit: int = 25) -> list:
+        """Return up to ``limit`` (user_id, name) pairs whose name starts with prefix (case-insensitive)."""
+        prefix = prefix.casefold()
+        keys = self._keys
+        i = bisect.bisect_left(keys, (prefix,))
+        found = []
+        while i < len(keys) and len(found) < limit and keys[i][0].startswith(prefix):
+            uid = keys[i][1]
+            found.append((uid, self._names[uid]))
+            i += 1
+        return found
+
+
+class DriverRepo(_Repo):
+    def __init__(self, db: Database):
+        super().__init__(db)
+        # per-guild in-memory name indexes for autocomplete; load_index() at startup,
+        # kept in step by every repository call that creates, renames or removes a driver
+        self._indexes = {}
+
+    def index(self, guild_id: str) -> DriverNameIndex:
+        index = self._indexes.get(guild_id)
+        if index is None:
+            index = self._indexes[guild_id] = DriverNameIndex()
+        return index
+
+    async def load_index(self):
+        def _all(conn):
+            return conn.execute('SELECT guild_id, user_id, name FROM drivers').fetchall()
+        by_guild = {}
+        for shard in self.db.shards():
+            for guild_id, user_id, name in await shard.run(_all):
+                by_guild.setdefault(guild_id, []).append((user_id, name))
+        self._indexes = {}
+        for guild_id, rows in by_guild.items():
+            self.index(guild_id).load(rows)
+
+    async def ensure(self, guild_id: str, user_id: str, name: str):
+        await self.run(guild_id, _ensure_driver, guild_id, user_id, name)
+        self.index(guild_id).add(user_id, name)
+
+    async def remove(self, guild_id: str, user_id: str):
+        """Delete a driver together with their penalties, bans, ban history and attendance in this guild."""
+        def _remove(conn):
+            # ban_history after bans: the bans delete trigger copies each removed ban into it
+            for table in ("drivers", "penalties", "driver_totals", "bans", "ban_history", "attendance"):
+                conn.execute(f'DELETE FROM {table} WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+        await self.run(guild_id, _remove)
+        self.index(guild_id).remove(user_id)
+
+    async def page(self, guild_id: str, limit: int, after: Optional[tuple] = None, before: Optional[tuple] = None) -> list:
+        """Return up to ``limit`` (user_id, name) rows in name order, strictly after or before a (name, user_id) cursor."""
+        def _page(conn):
+            if before is not None:
+                rows = conn.execute('SELECT user_id, name FROM drivers WHERE guild_id = ? AND name <= ? COLLATE NOCASE '
+                                    'AND (name < ? COLLATE NOCASE OR user_id < ?) '
+                                    'ORDER BY name COLLATE NOCASE DESC, user_id DESC LIMIT ?',
+                                    (guild_id, before[0], before[0], before[1], limit)).fetchall()
+                return rows[::-1]
+            if after is not None:
+                return conn.execute('SELECT user_id, name FROM drivers WHERE guild_id = ? AND name >= ? COLLATE NOCASE '
+                                    'AND (name > ? COLLATE NOCASE OR user_id > ?) '
+                                    'ORDER BY name COLLATE NOCASE, user_id LIMIT ?',
+                                    (guild_id, after[0], after[0], after[1], limit)).fetchall()
+            return conn.execute('SELECT user_id, name FROM drivers WHERE guild_id = ? '
+                                'ORDER BY name COLLATE NOCASE, user_id LIMIT ?', (guild_id, limit)).fetchall()
+        return await self.run(guild_id, _page)
+
+    async def names_for(self, guild_id: str, user_ids: list) -> dict:
+        """Return {user_id: stored name} for the given ids that are registered drivers."""
+        def _lookup(conn):
+            found = {}
+            for i in range(0, len(user_ids), 500):  # stay under SQLite's bound-parameter limit
+                chunk = user_ids[i:i + 500]
+                marks = ", ".join("?" * len(chunk))
+                found.update(conn.execute(f'SELECT user_id, name FROM drivers WHERE guild_id = ? AND user_id IN ({marks})',
+                                          (guild_id, *chunk)))
+            return found
+        return await self.run(guild_id, _lookup) if user_ids else {}
+
+    async def rename(self, guild_id: str, renames: list):
+        """Refresh stored names from (user_id, name) pairs; ids that aren't drivers are ignored."""
+        def _rename(conn):
+            conn.executemany('UPDATE drivers SET name = ? WHERE guild_id = ? AND user_id = ? AND name IS NOT ?',
+                             ((name, guild_id, uid, name) for uid, name in renames))
+        await self.run(guild_id, _rename)
+        index = self.index(guild_id)
+        for uid, name in renames:
+            if index.name(uid) is not None:
+                index.add(uid, name)
+
+
+class PenaltyRepo(_Repo):
+    async def add(self, guild_id: str, user_id: str, name: str, points: int, reason: str,
+                  thresholds=DEFAULT_BAN_THRESHOLDS):
+        """Record a penalty and apply auto bans it triggers. Return (total, active ban types)."""
+        def _add(conn):
+            _ensure_driver(conn, guild_id, user_id, name)
+            old_total = _driver_total(conn, guild_id, user_id)
+            conn.execute('INSERT INTO penalties (guild_id, user_id, points, reason) VALUES (?, ?, ?, ?)',
+                         (guild_id, user_id, points, reason))
+            total = old_total + points
+            added = _apply_auto_bans(conn, guild_id, user_id, old_total, total, thresholds)
+            return total, _active_ban_types(conn, guild_id, user_id), [expires_at for _, expires_at in added]
+        total, active, expiries = await self.run(guild_id, _add)
+        self.db.drivers.index(guild_id).add(user_id, name)
+        self.db.bans.notify(expiries)
+        return total, active
+
+    async def remove_points(self, guild_id: str, user_id: str, name: str, points: int, reason: str,
+                            thresholds=DEFAULT_BAN_THRESHOLDS):
+        """Append an adjustment cancelling up to ``points`` of the oldest outstanding points.
+
+        Return (removed, total), or None when the driver has no points to remove.
+        """
+        def _remove(conn):
+            cur = conn.execute("""INSERT INTO penalties (guild_id, user_id, points, reason)
+                SELECT guild_id, user_id, -MIN(?, total), ? FROM driver_totals
+                WHERE guild_id = ? AND user_id = ? AND total > 0 AND ? > 0""",
+                               (points, reason, guild_id, user_id, points))
+            if cur.rowcount == 0:
+                return None
+            removed, total = conn.execute('SELECT -points, balance FROM penalties WHERE id = ?',
+                                          (cur.lastrowid,)).fetchone()
+            _ensure_driver(conn, guild_id, user_id, name)
+            _apply_auto_bans(conn, guild_id, user_id, total + removed, total, thresholds)
+            return removed, total
+        result = await self.run(guild_id, _remove)
+        if result is not None:
+            self.db.drivers.index(guild_id).add(user_id, name)
+        return result
+
+    async def add_many(self, guild_id: str, entries: list, names: dict, thresholds=DEFAULT_BAN_THRESHOLDS,
+                       dry_run: bool = False) -> dict:
+        """Record (user_id, points, reason, incident_ref) entries in one transaction.
+
+        Auto bans are evaluated once per driver against the combined change. Return
+        {user_id: (old total, new total, [ban types added])}. With ``dry_run`` the
+        outcome is computed the same way and the transaction is rolled back.
+        """
+        def _add_many(conn):
+            deltas = {}
+            for uid, pts, _, _ in entries:
+                deltas[uid] = deltas.get(uid, 0) + pts
+            old_totals = {}
+            for uid in deltas:
+                _ensure_driver(conn, guild_id, uid, names.get(uid))
+                old_totals[uid] = _driver_total(conn, guild_id, uid)
+            conn.executemany('INSERT INTO penalties (guild_id, user_id, points, reason, incident_ref) VALUES (?, ?, ?, ?, ?)',
+                             ((guild_id, *entry) for entry in entries))
+            outcome = {}
+            expiries = []
+            for uid, delta in deltas.items():
+                added = _apply_auto_bans(conn, guild_id, uid, old_totals[uid], old_totals[uid] + delta, thresholds)
+                outcome[uid] = (old_totals[uid], old_totals[uid] + delta, [btype for btype, _ in added])
+                expiries += [expires_at for _, expires_at in added]
+            if dry_run:
+                conn.rollback()
+                expiries = []
+            return outcome, expiries
+        outcome, expiries = await self.run(guild_id, _add_many)
+        if not dry_run:
+            index = self.db.drivers.index(guild_id)
+            for uid in outcome:
+                index.add(uid, names.get(uid))
+            self.db.bans.notify(expiries)
+        return outcome
+
+    async def total(self, guild_id: str, user_id: str, season: Optional[int] = None) -> int:
+        if season is None:
+            return await self.run(guild_id, _driver_total, guild_id, user_id)
+        return await self.db.seasons.query(guild_id, season, _driver_total, guild_id, user_id)
+
+    async def standings(self, guild_id: str, limit: int, after: Optional[tuple] = None,
+                        before: Optional[tuple] = None, season: Optional[int] = None) -> list:
+        """Return up to ``limit`` (user_id, name, total, comma-separated active ban types) rows for
+        drivers with points, highest total first, past a (total, user_id) cursor.
+
+        With ``season``, rank that archived season (its bans as they stood when it ended).
+        """
+        def _standings(conn, schema="main"):
+            select = (f'SELECT t.user_id, d.name, t.total, (SELECT group_concat(type) FROM {schema}.bans b '
+                      'WHERE b.guild_id = t.guild_id AND b.user_id = t.user_id) '
+                      f'FROM {schema}.driver_totals t LEFT JOIN {schema}.drivers d '
+                      'ON d.guild_id = t.guild_id AND d.user_id = t.user_id WHERE t.guild_id = ? AND t.total > 0 ')
+            if before is not None:
+                rows = conn.execute(select + 'AND t.total >= ? AND (t.total > ? OR t.user_id < ?) '
+                                    'ORDER BY t.total, t.user_id DESC LIMIT ?',
+                                    (guild_id, before[0], before[0], before[1], limit)).fetchall()
+                return rows[::-1]
+            if after is not None:
+                return conn.execute(select + 'AND t.total <= ? AND (t.total < ? OR t.user_id > ?) '
+                                    'ORDER BY t.total DESC, t.user_id LIMIT ?',
+                                    (guild_id, after[0], after[0], after[1], limit)).fetchall()
+            return conn.execute(select + 'ORDER BY t.total DESC, t.user_id LIMIT ?', (guild_id, limit)).fetchall()
+        if season is None:
+            return await self.run(guild_id, _standings)
+        return await self.db.seasons.query(guild_id, season, _standings)
+
+    async def page(self, guild_id: str, user_id: str, limit: int, after: Optional[tuple] = None,
+                   before: Optional[tuple] = None, season: Optional[int] = None) -> list:
+        """Return up to ``limit`` (id, points, reason, timestamp) rows, newest first, past an (id,) cursor."""
+        args = ('id, points, reason, timestamp', guild_id, user_id, limit, after, before)
+        if season is None:
+            return await self.run(guild_id, _ledger_page, *args)
+        return await self.db.seasons.query(guild_id, season, _ledger_page, *args)
+
+    async def audit(self, guild_id: str, user_id: str, limit: int, after: Optional[tuple] = None,
+                    before: Optional[tuple] = None) -> list:
+        """Like ``page`` for the full ledger: (id, points, balance, reason, incident_ref, timestamp, offset ids).
+
+        offset ids lists the penalty entries an adjustment cancelled points from (empty for penalties).
+        """
+        def _audit(conn):
+            rows = _ledger_page(conn, 'id, points, balance, reason, incident_ref, timestamp, cumulative',
+                                guild_id, user_id, limit, after, before)
+            return [row[:6] + (_offset_ids(conn, guild_id, user_id, row[6] + row[1], row[6]) if row[1] < 0 else [],)
+                    for row in rows]
+        return await self.run(guild_id, _audit)
+
+
+def _ledger_page(conn: sqlite3.Connection, cols: str, guild_id: str, user_id: str, limit: int, after, before,
+                 schema: str = "main") -> list:
+    # ids only grow, so they give the ledger a total order even within one timestamp second
+    sql = f'SELECT {cols} FROM {schema}.penalties WHERE guild_id = ? AND user_id = ?'
+    if before is not None:
+        rows = conn.execute(sql + ' AND id > ? ORDER BY id LIMIT ?', (guild_id, user_id, before[0], limit)).fetchall()
+        return rows[::-1]
+    if after is not None:
+        return conn.execute(sql + ' AND id < ? ORDER BY id DESC LIMIT ?', (guild_id, user_id, after[0], limit)).fetchall()
+    return conn.execute(sql + ' ORDER BY id DESC LIMIT ?', (guild_id, user_id, limit)).fetchall()
+
+
+def _offset_ids(conn: sqlite3.Connection, guild_id: str, user_id: str, start: int, end: int) -> list:
+    """Ids of the penalties whose accrued points overlap (start, end]."""
+    ids = []
+    for pid, cumulative, points in conn.execute(
+            'SELECT id, cumulative, points FROM penalties WHERE guild_id = ? AND user_id = ? AND points > 0 '
+            'AND cumulative > ? ORDER BY cumulative', (guild_id, user_id, start)):
+        if cumulative - points >= end:
+            break
+        ids.append(pid)
+    return ids
+
+
+class BanRepo(_Repo):
+    def __init__(self, db: Database):
+        super().__init__(db)
+        # called with each new ban's expiry epoch, on the event loop
+        self.listeners = []
+
+    def notify(self, expiries: list):
+        for expires_at in expiries:
+            for listener in self.listeners:
+                listener(expires_at)
+
+    async def add(self, guild_id: str, user_id: str, name: str, btype: str, reason: str):
+        def _add(conn):
+            _ensure_driver(conn, guild_id, user_id, name)
+            return _insert_ban(conn, guild_id, user_id, btype, reason)
+        self.notify([await self.run(guild_id, _add)])
+        self.db.drivers.index(guild_id).add(user_id, name)
+
+    async def remove(self, guild_id: str, user_id: str, btype: str):
+        def _remove(conn):
+            conn.execute('DELETE FROM bans WHERE guild_id = ? AND user_id = ? AND type = ?', (guild_id, user_id, btype))
+        await self.run(guild_id, _remove)
+
+    async def expire(self, now: Optional[float] = None) -> list:
+        """Delete every ban, in every guild, that has expired by ``now``. Return the guild ids affected."""
+        cutoff = int(now or time.time())
+
+        def _expire(conn):
+            guilds = {r[0] for r in conn.execute('SELECT guild_id FROM bans WHERE expires_at <= ?', (cutoff,))}
+            if guilds:
+                conn.execute('DELETE FROM bans WHERE expires_at <= ?', (cutoff,))
+            return list(guilds)
+        expired = []
+        for shard in self.db.shards():
+            expired += await shard.run(_expire)
+        return expired
+
+    async def expiries(self) -> list:
+        def _expiries(conn):
+            return [r[0] for r in conn.execute('SELECT expires_at FROM bans WHERE expires_at IS NOT NULL')]
+        found = []
+        for shard in self.db.shards():
+            found += await shard.run(_expiries)
+        return found
+
+    async def active(self, guild_id: str) -> list:
+        """Return (user_id, driver name, type, reason, timestamp) rows for the guild's bans that have not expired."""
+        def _active(conn):
+            return conn.execute("""SELECT b.user_id, d.name, b.type, b.reason, b.timestamp
+                FROM bans b LEFT JOIN drivers d ON d.guild_id = b.guild_id AND d.user_id = b.user_id
+                WHERE b.guild_id = ? AND b.expires_at > ? ORDER BY b.expires_at, b.id""",
+                                (guild_id, int(time.time()))).fetchall()
+        return await self.run(guild_id, _active)
+
+    async def live_messages(self, guild_id: str) -> list:
+        """Return (channel_id, message_id) of each page of the guild's live ban list, in page order."""
+        def _get(conn):
+            return conn.execute('SELECT channel_id, message_id FROM banlist_messages WHERE guild_id = ? ORDER BY page',
+                                (guild_id,)).fetchall()
+        return await self.run(guild_id, _get)
+
+    async def set_live_messages(self, guild_id: str, pages: list):
+        """Replace the guild's live ban list pointers with (channel_id, message_id) pages."""
+        def _set(conn):
+            conn.execute('DELETE FROM banlist_messages WHERE guild_id = ?', (guild_id,))
+            conn.executemany('INSERT INTO banlist_messages (guild_id, page, channel_id, message_id) VALUES (?, ?, ?, ?)',
+                             ((guild_id, i, str(ch), str(mid)) for i, (ch, mid) in enumerate(pages)))
+        await self.run(guild_id, _set)
+
+
+class AttendanceRepo(_Repo):
+    async def set_status(self, guild_id: str, message_id: str, user_id: str, status: str):
+        await self.set_many([(guild_id, message_id, user_id, status)])
+
+    async def set_many(self, rows: list):
+        """Store (guild_id, message_id, user_id, status) rows, one transaction per database file."""
+        def _set(conn, batch):
+            conn.executemany('REPLACE INTO attendance (guild_id, message_id, user_id, status, timestamp) '
+                             'VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)', batch)
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(self.db.shard(row[0]), []).append(row)
+        for shard, batch in by_shard.items():
+            await shard.run(_set, batch)
+
+    async def for_message(self, guild_id: str, message_id: str) -> list:
+        """Return (user_id, status) rows for a post, oldest response first."""
+        def _rows(conn):
+            return conn.execute('SELECT user_id, status FROM attendance WHERE guild_id = ? AND message_id = ? '
+                                'ORDER BY timestamp, rowid', (guild_id, message_id)).fetchall()
+        return await self.run(guild_id, _rows)
+
+
+class TicketRepo(_Repo):
+    async def open(self, guild_id: str, channel_id: str, owner_id: str):
+        def _open(conn):
+            conn.execute('INSERT INTO tickets (guild_id, channel_id, owner_id) VALUES (?, ?, ?)', (guild_id, channel_id, owner_id))
+        await self.run(guild_id, _open)
+
+    async def open_for_owner(self, guild_id: str, owner_id: str):
+        """Return (id, channel_id) of the owner's open ticket, or None."""
+        def _get(conn):
+            return conn.execute('SELECT id, channel_id FROM tickets WHERE guild_id = ? AND owner_id = ? AND closed_at IS NULL '
+                                'ORDER BY id DESC LIMIT 1', (guild_id, owner_id)).fetchone()
+        return await self.run(guild_id, _get)
+
+    async def by_channel(self, guild_id: str, channel_id: str):
+        """Return (id, owner_id) for the ticket in this channel, or None."""
+        def _get(conn):
+            return conn.execute('SELECT id, owner_id FROM tickets WHERE guild_id = ? AND channel_id = ?',
+                                (guild_id, channel_id)).fetchone()
+        return await self.run(guild_id, _get)
+
+    async def add_transcript(self, guild_id: str, ticket_id: int, channel_id: int, path: str, message_count: int,
+                             size: int, log_message_id: Optional[int]):
+        def _add(conn):
+            conn.execute('INSERT INTO ticket_transcripts (guild_id, ticket_id, channel_id, path, message_count, bytes, '
+                         'log_message_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (guild_id, ticket_id, str(channel_id), path, message_count, size,
+                          str(log_message_id) if log_message_id else None))
+        await self.run(guild_id, _add)
+
+    async def close(self, guild_id: str, ticket_id: int):
+        def _close(conn):
+            conn.execute('UPDATE tickets SET closed_at = ? WHERE guild_id = ? AND id = ?',
+                         (datetime.datetime.now().isoformat(" ", "seconds"), guild_id, ticket_id))
+        await self.run(guild_id, _close)
+
+
+@dataclass(frozen=True)
+class GuildSettings:
+    guild_id: str
+    welcome_channel_id: Optional[int] = None
+    goodbye_channel_id: Optional[int] = None
+    ticket_log_channel_id: Optional[int] = None
+    steward_role_name: Optional[str] = None
+    ticket_category_id: Optional[int] = None
+    welcome_message: Optional[str] = None
+    goodbye_message: Optional[str] = None
+    quali_ban_points: Optional[int] = None
+    race_ban_points: Optional[int] = None
+    standings_channel_id: Optional[int] = None
+    standings_message_id: Optional[int] = None
+
+    @property
+    def ban_thresholds(self) -> tuple:
+        return (("quali", self.quali_ban_points or QUALI_BAN_POINTS),
+                ("race", self.race_ban_points or RACE_BAN_POINTS))
+
+    @classmethod
+    def from_row(cls, guild_id: str, row: Optional[dict]) -> "GuildSettings":
+        if not row:
+            return cls(guild_id)
+        values = {}
+        for f in fields(cls):
+            v = row.get(f.name)
+            if f.type == Optional[int]:
+                v = int(v) if v else None
+            values[f.name] = v
+        values["guild_id"] = guild_id
+        return cls(**values)
+
+
+class SettingsRepo(_Repo):
+    """Per-guild settings, cached in process and updated write-through."""
+
+    def __init__(self, db: Database):
+        super().__init__(db)
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, guild_id: str) -> GuildSettings:
+        cached = self._cache.get(guild_id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        settings = GuildSettings.from_row(guild_id, await self.run(guild_id, _load_settings, guild_id))
+        return self._cache.setdefault(guild_id, settings)
+
+    async def update(self, guild_id: str, **values):
+        """Set the given settings columns, creating the guild's row if needed."""
+        def _update(conn):
+            conn.execute('INSERT OR IGNORE INTO settings (guild_id) VALUES (?)', (guild_id,))
+            if values:
+                assignments = ", ".join(f"{col} = ?" for col in values)
+                conn.execute(f'UPDATE settings SET {assignments} WHERE guild_id = ?',
+                             (*(None if v is None else str(v) for v in values.values()), guild_id))
+            return _load_settings(conn, guild_id)
+        self._cache[guild_id] = GuildSettings.from_row(guild_id, await self.run(guild_id, _update))
+
+    def invalidate(self, guild_id: Optional[str] = None):
+        if guild_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(guild_id, None)
+
+
+class StateRepo(_Repo):
+    """Small key/value store for bot bookkeeping (e.g. the last synced command hash)."""
+
+    async def get(self, key: str) -> Optional[str]:
+        def _get(conn):
+            row = conn.execute('SELECT value FROM bot_state WHERE key = ?', (key,)).fetchone()
+            return row[0] if row else None
+        return await self.db.run(_get)
+
+    async def set(self, key: str, value: str):
+        def _set(conn):
+            conn.execute('INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)', (key, value))
+        await self.db.run(_set)
+
+
+class PersistentMessageRepo(_Repo):
+    """Index of live messages carrying persistent views, with the kind and state each was posted with."""
+
+    async def add(self, message_id: int, guild_id: int, channel_id: int, kind: str, state: Optional[dict] = None):
+        def _add(conn):
+            conn.execute('INSERT OR REPLACE INTO persistent_messages (message_id, guild_id, channel_id, kind, state) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (str(message_id), str(guild_id), str(channel_id), kind, json.dumps(state or {})))
+        await self.run(str(guild_id), _add)
+
+    async def remove(self, guild_id: int, message_id: int):
+        def _remove(conn):
+            conn.execute('DELETE FROM persistent_messages WHERE message_id = ?', (str(message_id),))
+        await self.run(str(guild_id), _remove)
+
+
+# the guild tables an export carries, in import order. Ids and derived columns
+# (penalty balances, driver_totals) are not exported; the importing database
+# rebuilds them, replaying penalties in their original order.
+ARCHIVE_TABLES = {
+    "drivers": ("user_id", "name"),
+    "penalties": ("user_id", "points", "reason", "incident_ref", "timestamp"),
+    "bans": ("user_id", "type", "reason", "timestamp", "expires_at"),
+    "attendance": ("message_id", "user_id", "status", "timestamp"),
+    "tickets": ("channel_id", "owner_id", "opened_at", "closed_at"),
+}
+# primary key order within a guild: each is the tail of an index led by guild_id
+ARCHIVE_ORDER = {
+    "drivers": "user_id",
+    "penalties": "id",
+    "bans": "id",
+    "attendance": "message_id, user_id",
+    "tickets": "id",
+}
+EXPORT_BATCH = 1000  # rows per fetchmany while exporting
+
+
+def _fetched(cursor: sqlite3.Cursor, size: int):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _export_snapshot(path: str, guild_id: str, sink, batch: int):
+    # a separate read-only connection: WAL lets the DB thread keep writing, and one
+    # read transaction gives every table the same point-in-time view
+    conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro", uri=True)
+    try:
+        conn.execute("BEGIN")
+        for table, cols in ARCHIVE_TABLES.items():
+            # streamed straight off the guild_id index in key order: no other guild's
+            # rows are read and nothing waits on a sort before the first row
+            cursor = conn.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE guild_id = ? "
+                                  f"ORDER BY {ARCHIVE_ORDER[table]}", (guild_id,))
+            sink(table, cols, _fetched(cursor, batch))
+    finally:
+        conn.close()
+
+
+class ArchiveRepo(_Repo):
+    """Bulk export and import of a guild's league tables (see export.py for the file format)."""
+
+    async def export(self, guild_id: str, sink, batch: int = EXPORT_BATCH):
+        """Call ``sink(table, columns, rows)`` for each of ARCHIVE_TABLES, off the event loop and the DB thread.
+
+        ``rows`` is a generator reading ``batch`` rows at a time from one read snapshot.
+        """
+        shard = self.db.shard(guild_id)
+        await shard.run(lambda conn: None)  # create and migrate the file first
+        await asyncio.get_running_loop().run_in_executor(None, _export_snapshot, shard.path, guild_id, sink, batch)
+
+    async def counts(self, guild_id: str) -> dict:
+        """Rows per archive table, plus the penalty points sum and the driver_totals sum an import must match."""
+        return await self.run(guild_id, _archive_counts, guild_id)
+
+    async def load(self, guild_id: str, tables, replace: bool = False, check=None):
+        """Load ``(table, rows)`` pairs (rows in ARCHIVE_TABLES column order) in one transaction.
+
+        ``rows`` are consumed on the DB thread. The guild's existing rows are deleted first
+        if ``replace``, otherwise the guild must hold none. ``check(counts)`` may raise to
+        reject the loaded totals; any error rolls the whole load back, old data included.
+
+        A replace swaps the current season only. Transcript rows go with the tickets they
+        belong to (their files stay on disk); archived seasons, settings and the indexes of
+        posted messages (persistent_messages, banlist_messages) are kept on purpose, since
+        those files and Discord messages outlive the league data.
+        """
+        names = []
+
+        def _load(conn):
+            if replace:
+                for table in ARCHIVE_TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (guild_id,))
+                conn.execute("DELETE FROM driver_totals WHERE guild_id = ?", (guild_id,))
+                conn.execute("DELETE FROM ban_history WHERE guild_id = ?", (guild_id,))  # filled by the bans delete
+                conn.execute("DELETE FROM ticket_transcripts WHERE guild_id = ?", (guild_id,))
+            elif any(conn.execute(f"SELECT 1 FROM {table} WHERE guild_id = ? LIMIT 1", (guild_id,)).fetchone()
+                     for table in ARCHIVE_TABLES):
+                raise ValueError(f"guild {guild_id} already has league data; import with replace to overwrite it")
+            for table, rows in tables:
+                cols = ARCHIVE_TABLES[table]
+                sql = f"INSERT INTO {table} (guild_id, {', '.join(cols)}) VALUES (?{', ?' * len(cols)})"
+                if table == "drivers":
+                    rows = _collect(rows, names)
+                conn.executemany(sql, ((guild_id, *row) for row in rows))
+            if check is not None:
+                check(_archive_counts(conn, guild_id))
+        await self.run(guild_id, _load)
+        index = self.db.drivers.index(guild_id)
+        if replace:
+            index.load(names)
+        else:
+            for user_id, name in names:
+                index.add(user_id, name)
+
+
+def _collect(rows, into: list):
+    for row in rows:
+        into.append(row)
+        yield row
+
+
+def _archive_counts(conn: sqlite3.Connection, guild_id: str) -> dict:
+    found = {table: conn.execute(f"SELECT COUNT(*) FROM {table} WHERE guild_id = ?", (guild_id,)).fetchone()[0]
+             for table in ARCHIVE_TABLES}
+    found["penalty_points"] = conn.execute("SELECT COALESCE(SUM(points), 0) FROM penalties WHERE guild_id = ?",
+                                           (guild_id,)).fetchone()[0]
+    found["driver_totals"] = conn.execute("SELECT COALESCE(SUM(total), 0) FROM driver_totals WHERE guild_id = ?",
+                                          (guild_id,)).fetchone()[0]
+    return found
+
+
+# (table, rows a rollover archives, whether they also leave the live table). Order
+# matters: totals go before penalties so the ledger's delete trigger has nothing
+# left to update, and transcripts before the tickets they belong to.
+SEASON_TABLES = (
+    ("drivers", "guild_id = :guild", False),
+    ("driver_totals", "guild_id = :guild", True),
+    ("penalties", "guild_id = :guild", True),
+    ("bans", "guild_id = :guild", False),  # bans being served carry into the next season
+    ("ban_history", "guild_id = :guild", True),
+    # message ids are snowflakes, so this picks posts made before the cutoff
+    ("attendance", "guild_id = :guild AND CAST(message_id AS INTEGER) < :cutoff", True),
+    ("ticket_transcripts", "guild_id = :guild AND ticket_id IN "
+                           "(SELECT id FROM main.tickets WHERE guild_id = :guild AND closed_at IS NOT NULL)", True),
+    ("tickets", "guild_id = :guild AND closed_at IS NOT NULL", True),
+)
+
+
+def _create_archive(path: str):
+    """A new archive file with the live schema, minus the triggers: archived seasons never change."""
+    if os.path.exists(path):
+        os.remove(path)  # left by a rollover that never committed
+    conn = sqlite3.connect(path)
+    try:
+        _migrate(conn)
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _rollover(conn: sqlite3.Connection, guild_id: str, season: int, path: str, cutoff: int) -> dict:
+    _create_archive(path)
+    conn.execute("ATTACH DATABASE ? AS rollover", (path,))
+    try:
+        # with WAL the two files commit separately; the seasons row commits with the
+        # live deletes, so a crash in between leaves the live data whole and the
+        # unrecorded archive is recreated by the next attempt
+        conn.execute("BEGIN IMMEDIATE")
+        params = {"guild": guild_id, "cutoff": cutoff}
+        moved = {}
+        for table, where, remove in SEASON_TABLES:
+            cols = ", ".join(r[1] for r in conn.execute(f"PRAGMA rollover.table_info({table})"))
+            moved[table] = conn.execute(f"INSERT INTO rollover.{table} ({cols}) SELECT {cols} FROM main.{table} "
+                                        f"WHERE {where}", params).rowcount
+            if remove:
+                conn.execute(f"DELETE FROM main.{table} WHERE {where}", params)
+        conn.execute("ANALYZE rollover")  # in the transaction, so the stats commit with the rows
+        conn.execute("INSERT INTO seasons (guild_id, season, file, summary) VALUES (?, ?, ?, ?)",
+                     (guild_id, season, os.path.basename(path), json.dumps(moved)))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE rollover")
+    return moved
+
+
+def _compact(conn: sqlite3.Connection):
+    conn.execute("VACUUM")
+    try:
+        conn.execute("ANALYZE main")  # not the read-only seasons that may be attached
+    except sqlite3.Error:
+        pass  # stale planner stats only; the space is already reclaimed
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # VACUUM rewrote every page into the WAL
+
+
+class SeasonRepo(_Repo):
+    """Season rollover and read access to archived seasons.
+
+    Season 1 runs until the first rollover. Each rollover copies the guild's season
+    into its own file beside the live database (``league.season-<guild>-<n>.db``)
+    and removes it from the live tables; ``compact`` then reclaims the space.
+    Archived seasons are attached read-only to the DB connection when first queried.
+    """
+
+    async def current(self, guild_id: str) -> int:
+        def _current(conn):
+            return conn.execute("SELECT COALESCE(MAX(season), 0) + 1 FROM seasons WHERE guild_id = ?",
+                                (guild_id,)).fetchone()[0]
+        return await self.run(guild_id, _current)
+
+    async def archived(self, guild_id: str) -> list:
+        """Return (season, ended_at, {table: rows archived}) for each archived season, oldest first."""
+        def _archived(conn):
+            return conn.execute("SELECT season, ended_at, summary FROM seasons WHERE guild_id = ? ORDER BY season",
+                                (guild_id,)).fetchall()
+        return [(season, ended, json.loads(summary or "{}")) for season, ended, summary in await self.run(guild_id, _archived)]
+
+    def _path(self, guild_id: str, season: int) -> str:
+        root, ext = os.path.splitext(self.db.path)
+        return f"{root}.season-{guild_id}-{season}{ext}"
+
+    async def rollover(self, guild_id: str, keep_attendance_days: float = 0) -> tuple:
+        """Archive the guild's current season and start the next. Return (archived season number, rows moved per table).
+
+        Driver points reset to zero; drivers, bans still in force, open tickets and
+        attendance posts from the last ``keep_attendance_days`` stay live.
+        """
+        season = await self.current(guild_id)
+        cutoff = (int((time.time() - keep_attendance_days * 86400) * 1000) - DISCORD_EPOCH_MS) << 22
+        moved = await self.run(guild_id, _rollover, guild_id, season, self._path(guild_id, season), cutoff)
+        return season, moved
+
+    async def compact(self, guild_id: str):
+        """VACUUM and ANALYZE the guild's live file, e.g. after a rollover emptied most of it."""
+        await self.run(guild_id, _compact)
+
+    async def query(self, guild_id: str, season: int, fn, *args):
+        """Run ``fn(conn, *args, schema)`` against archived ``season``; raise LookupError if it was never archived."""
+        def _in_season(conn):
+            row = conn.execute("SELECT file FROM seasons WHERE guild_id = ? AND season = ?", (guild_id, season)).fetchone()
+            if row is None:
+                raise LookupError(f"Season {season} is not archived")
+            try:
+                schema = shard.attach(conn, os.path.join(os.path.dirname(os.path.abspath(self.db.path)), row[0]))
+            except sqlite3.OperationalError as e:
+                raise LookupError(f"Season {season} archive {row[0]} cannot be opened ({e})") from None
+            return fn(conn, *args, schema)
+        shard = self.db.shard(guild_id)
+        return await shard.run(_in_season)
@@ -0,0 +1,317 @@
+# export.py
+"""League archives: a guild's tables streamed into gzip-compressed JSONL or CSV parts.
+
+An archive is a folder with ``manifest.json`` and one or more parts per table
+(``penalties.001.jsonl.gz``, ...). A part is closed before it would pass
+``part_bytes``, so each file fits one Discord upload. The manifest records every
+part's row count and SHA-256, and the totals an import must reproduce.
+
+    python export.py export GUILD_ID [--format csv] [--out DIR] [--part-mb 25]
+    python export.py import DIR [--guild GUILD_ID] [--replace]
+
+Both use DB_PATH / DB_PER_GUILD like the bot. Run imports while the bot is stopped,
+or restart it afterwards, so its caches pick up the new data.
+"""
+import argparse
+import asyncio
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import zlib
+
+from db import ARCHIVE_TABLES, Database
+
+FORMATS = ("jsonl", "csv")
+MANIFEST = "manifest.json"
+ARCHIVE_VERSION = 1
+CHUNK_BYTES = 64 * 1024           # encoded rows compressed per write
+MIN_PART_BYTES = 4 * CHUNK_BYTES
+DEFAULT_PART_BYTES = 25 * 1024 * 1024  # Discord's default upload limit
+INT_COLUMNS = {"points", "expires_at"}
+REQUIRED_COLUMNS = {
+    "drivers": ("user_id",),
+    "penalties": ("user_id", "points"),
+    "bans": ("user_id", "type"),
+    "attendance": ("message_id", "user_id"),
+    "tickets": ("owner_id",),
+}
+
+
+class _CountingFile:
+    """Write-only file wrapper tracking the bytes written and their SHA-256."""
+
+    def __init__(self, path: str):
+        self._f = open(path, "wb")
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.size += len(data)
+        self.sha256.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class _PartWriter:
+    """Writes one table's rows into gzip parts of at most ``part_bytes`` each."""
+
+    def __init__(self, folder: str, table: str, columns: tuple, fmt: str, part_bytes: int):
+        self.folder, self.table, self.columns, self.fmt = folder, table, columns, fmt
+        self.part_bytes = part_bytes
+        self.parts = []  # manifest entries of closed parts
+        self._file = self._gz = None
+        self._rows = 0
+        self._line = io.StringIO()
+        self._csv = csv.writer(self._line, lineterminator="\n")
+
+    def _encode(self, row: tuple) -> bytes:
+        if self.fmt == "jsonl":
+            return json.dumps(dict(zip(self.columns, row)), ensure_ascii=False).encode() + b"\n"
+        self._line.seek(0)
+        self._line.truncate()
+        self._csv.writerow(row)  # None is written as an empty field
+        return self._line.getvalue().encode()
+
+    def write(self, rows):
+        lines, size = [], 0
+        for row in rows:
+            line = self._encode(row)
+            lines.append(line)
+            size += len(line)
+            if size >= CHUNK_BYTES:
+                self._write(lines, size)
+                lines, size = [], 0
+        if lines or not self.parts and self._gz is None:
+            self._write(lines, size)
+        self._close()
+
+    def _write(self, lines: list, size: int):
+        # deflate grows incompressible input by well under 1%; the slack also covers the
+        # CSV header and the gzip trailer, so a part never passes part_bytes
+        if self._gz is not None and self._file.size + size + size // 100 + 1024 > self.part_bytes:
+            self._close()
+        if self._gz is None:
+            self._open()
+        self._gz.write(b"".join(lines))
+        # push the compressed bytes out now so the next size check is exact
+        self._gz.flush(zlib.Z_SYNC_FLUSH)
+        self._rows += len(lines)
+
+    def _open(self):
+        name = f"{self.table}.{len(self.parts) + 1:03d}.{self.fmt}.gz"
+        self._file = _CountingFile(os.path.join(self.folder, name))
+        self._gz = gzip.GzipFile(filename=name[:-3], mode="wb", fileobj=self._file, mtime=0)
+        self._name, self._rows = name, 0
+        if self.fmt == "csv":
+            self._gz.write(self._encode(self.columns))
+
+    def _close(self):
+        if self._gz is None:
+            return
+        self._gz.close()
+        self._file.close()
+        self.parts.append({"file": self._name, "rows": self._rows, "bytes": self._file.size,
+                           "sha256": self._file.sha256.hexdigest()})
+        self._file = self._gz = None
+
+
+async def write_archive(db: Database, guild_id: str, folder: str, fmt: str = "jsonl",
+                        part_bytes: int = DEFAULT_PART_BYTES) -> dict:
+    """Export ``guild_id``'s tables into ``folder``. Return the manifest; its files are listed by ``archive_files``."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    part_bytes = max(part_bytes, MIN_PART_BYTES)
+    os.makedirs(folder, exist_ok=True)
+    tables = {}
+    points = 0
+
+    def summed(rows, i):
+        nonlocal points
+        for row in rows:
+            points += row[i] or 0
+            yield row
+
+    def sink(table, columns, rows):
+        # runs on an executor thread with rows streaming from the database
+        if table == "penalties":
+            rows = summed(rows, columns.index("points"))
+        writer = _PartWriter(folder, table, columns, fmt, part_bytes)
+        writer.write(rows)
+        tables[table] = {"columns": list(columns), "rows": sum(p["rows"] for p in writer.parts), "parts": writer.parts}
+
+    await db.archive.export(guild_id, sink)
+    manifest = {
+        "version": ARCHIVE_VERSION, "guild_id": guild_id, "format": fmt,
+        "exported_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "penalty_points": points, "tables": tables,
+    }
+    with open(os.path.join(folder, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def archive_files(folder: str, manifest: dict) -> list:
+    """Paths of the manifest and every part, manifest first."""
+    return [os.path.join(folder, MANIFEST)] + [os.path.join(folder, part["file"])
+                                                for table in manifest["tables"].values() for part in table["parts"]]
+
+
+def read_manifest(folder: str) -> dict:
+    with open(os.path.join(folder, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != ARCHIVE_VERSION:
+        raise ValueError(f"unsupported archive version {manifest.get('version')}")
+    if manifest.get("format") not in FORMATS:
+        raise ValueError(f"unknown archive format {manifest.get('format')}")
+    for table, columns in ARCHIVE_TABLES.items():
+        found = manifest["tables"].get(table)
+        if found is None:
+            raise ValueError(f"archive has no {table} table")
+        if tuple(found["columns"]) != columns:
+            raise ValueError(f"{table} columns {found['columns']} do not match {list(columns)}")
+    return manifest
+
+
+def _json_values(line: str, columns: tuple) -> list:
+    record = json.loads(line)
+    return [record.get(c) for c in columns] if isinstance(record, dict) else []
+
+
+def _part_rows(path: str, table: str, fmt: str):
+    """Yield validated rows (tuples in ARCHIVE_TABLES order) from one part."""
+    columns = ARCHIVE_TABLES[table]
+    name = os.path.basename(path)
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            reader = csv.reader(f)
+            if next(reader, None) != list(columns):
+                raise ValueError(f"{name}: header does not match {list(columns)}")
+            records = ([v if v != "" else None for v in record] for record in reader)
+        else:
+            records = (_json_values(line, columns) for line in f)
+        for n, values in enumerate(records, start=1):
+            if len(values) != len(columns):
+                raise ValueError(f"{name} row {n}: expected {len(columns)} fields")
+            row = dict(zip(columns, values))
+            for col in REQUIRED_COLUMNS[table]:
+                if row[col] is None:
+                    raise ValueError(f"{name} row {n}: {col} is required")
+            for col in INT_COLUMNS.intersection(row):
+                if row[col] is not None:
+                    try:
+                        row[col] = int(row[col])
+                    except (TypeError, ValueError):
+                        raise ValueError(f"{name} row {n}: {col} must be a whole number") from None
+            for col, v in row.items():
+                if col not in INT_COLUMNS and v is not None:
+                    row[col] = str(v)
+            yield tuple(row.values())
+
+
+def verify_archive(folder: str, manifest: dict):
+    """Check every part's checksum, row count and rows before anything is loaded; raise ValueError if not intact."""
+    points = 0
+    for table, entry in manifest["tables"].items():
+        if table not in ARCHIVE_TABLES:
+            continue
+        for part in entry["parts"]:
+            path = os.path.join(folder, part["file"])
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            if digest.hexdigest() != part["sha256"]:
+                raise ValueError(f"{part['file']}: checksum mismatch")
+            rows = 0
+            try:
+                for row in _part_rows(path, table, manifest["format"]):
+                    rows += 1
+                    if table == "penalties":
+                        points += row[1]
+            except (OSError, EOFError, UnicodeDecodeError, csv.Error) as e:
+                raise ValueError(f"{part['file']}: unreadable ({e})") from None
+            if rows != part["rows"]:
+                raise ValueError(f"{part['file']}: {rows} rows, manifest says {part['rows']}")
+    if points != manifest["penalty_points"]:
+        raise ValueError(f"penalties sum to {points} points, manifest says {manifest['penalty_points']}")
+
+
+async def import_archive(db: Database, folder: str, guild_id: str = None, replace: bool = False) -> dict:
+    """Load an archive into ``guild_id`` (default: the guild it was exported from). Return the loaded counts.
+
+    Every part is verified in full before the database is touched. The guild must hold
+    no league data unless ``replace``. Deleting the old data and loading the new is one
+    transaction: if loading fails or the loaded totals differ from the manifest, it is
+    rolled back, leaving the guild as it was, and ValueError is raised.
+    """
+    manifest = read_manifest(folder)
+    guild_id = guild_id or manifest["guild_id"]
+    await asyncio.get_running_loop().run_in_executor(None, verify_archive, folder, manifest)
+    expected = {table: entry["rows"] for table, entry in manifest["tables"].items() if table in ARCHIVE_TABLES}
+    expected["penalty_points"] = expected["driver_totals"] = manifest["penalty_points"]
+    loaded = {}
+
+    def tables():
+        for table in ARCHIVE_TABLES:
+            for part in manifest["tables"][table]["parts"]:
+                yield table, _part_rows(os.path.join(folder, part["file"]), table, manifest["format"])
+
+    def check(counts):
+        wrong = [f"{key}: {counts[key]} loaded, {value} expected" for key, value in expected.items() if counts[key] != value]
+        if wrong:
+            raise ValueError("import does not match the archive (" + "; ".join(wrong) + ")")
+        loaded.update(counts)
+
+    await db.archive.load(guild_id, tables(), replace, check)
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a guild's league data.")
+    parser.add_argument("--db", default=os.environ.get("DB_PATH", "league.db"))
+    parser.add_argument("--per-guild", action="store_true", default=os.environ.get("DB_PER_GUILD") == "1")
+    commands = parser.add_subparsers(dest="command", required=True)
+    out = commands.add_parser("export")
+    out.add_argument("guild_id")
+    out.add_argument("--format", choices=FORMATS, default="jsonl")
+    out.add_argument("--out", help="archive folder (default: export-GUILD-TIMESTAMP)")
+    out.add_argument("--part-mb", type=float, default=DEFAULT_PART_BYTES / 1024 / 1024)
+    load = commands.add_parser("import")
+    load.add_argument("folder")
+    load.add_argument("--guild", dest="guild_id", help="target guild (default: the exported one)")
+    load.add_argument("--replace", action="store_true", help="delete the guild's existing league data first")
+    args = parser.parse_args()
+
+    async def run():
+        db = Database(args.db, per_guild=args.per_guild)
+        try:
+            if args.command == "export":
+                stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+                folder = args.out or f"export-{args.guild_id}-{stamp}"
+                manifest = await write_archive(db, args.guild_id, folder, args.format, int(args.part_mb * 1024 * 1024))
+                for table, entry in manifest["tables"].items():
+                    print(f"{table}: {entry['rows']} rows in {len(entry['parts'])} part(s)")
+                print(f"Wrote {folder}")
+            else:
+                loaded = await import_archive(db, args.folder, args.guild_id, args.replace)
+                print(", ".join(f"{key} {value}" for key, value in loaded.items()))
+        finally:
+            db.close()
+
+    try:
+        asyncio.run(run())
+    except ValueError as e:
+        raise SystemExit(f"error: {e}")
+
+
+if __name__ == "__main__":
+    main()
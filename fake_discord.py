@@ -0,0 +1,240 @@
+# fake_discord.py
+"""Stand-ins for the discord.py objects the bot's callbacks touch, for offline benchmarks.
+
+Every method that would be a Discord REST request goes through ``Api.call``, which
+counts it by name and sleeps ``latency`` seconds to simulate the round trip.
+"""
+import asyncio
+import datetime
+import itertools
+from collections import Counter
+from types import SimpleNamespace
+
+import discord
+
+
+class Api:
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.calls = Counter()
+        self.ids = itertools.count(10**17)  # snowflake-sized ids for created objects
+
+    async def call(self, name: str):
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+
+class FakeMember:
+    def __init__(self, guild: "FakeGuild", member_id: int, name: str, roles: tuple = ()):
+        self.guild = guild
+        self.id = member_id
+        self.name = name
+        self.display_name = name.title()
+        self.mention = f"<@{member_id}>"
+        self.roles = list(roles)
+        self.bot = False
+        self.display_avatar = SimpleNamespace(url=f"https://cdn.example/avatars/{member_id}.png")
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeTextChannel", message_id: int, content=None, embeds=()):
+        self.channel = channel
+        self.guild = channel.guild
+        self.id = message_id
+        self.content = content
+        self.embeds = list(embeds)
+
+    async def edit(self, content=None, embed=None, view=None, **kwargs):
+        await self.channel.guild.api.call("message.edit")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        return self
+
+    async def delete(self):
+        await self.channel.guild.api.call("message.delete")
+
+    async def pin(self, reason=None):
+        await self.channel.guild.api.call("message.pin")
+
+
+class FakeTextChannel:
+    def __init__(self, guild: "FakeGuild", channel_id: int, name: str, category=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category = category
+        self.mention = f"<#{channel_id}>"
+        self.messages = []
+
+    async def send(self, content=None, embed=None, embeds=None, view=None, file=None, **kwargs):
+        await self.guild.api.call("channel.send")
+        message = FakeMessage(self, next(self.guild.api.ids), content, [embed] if embed else embeds or ())
+        self.messages.append(message)
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(self, message_id)
+
+    async def history(self, limit=None, oldest_first=False):
+        for message in list(self.messages)[:limit]:
+            yield message
+
+    async def delete(self, reason=None):
+        await self.guild.api.call("channel.delete")
+        self.guild.channels.pop(self.id, None)
+        if self.category is not None:
+            self.category.fake_channels.remove(self)
+
+
+class FakeCategory(discord.CategoryChannel):
+    """Subclassed so the bot's isinstance(…, discord.CategoryChannel) checks pass."""
+
+    __slots__ = ("fake_channels", "fake_overwrites")
+
+    def __init__(self, guild: "FakeGuild", channel_id: int, name: str, overwrites=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.position = 0
+        self.nsfw = False
+        self.category_id = None
+        self.fake_channels = []
+        self.fake_overwrites = dict(overwrites or {})
+
+    @property
+    def channels(self):
+        return list(self.fake_channels)
+
+    @property
+    def overwrites(self):
+        return dict(self.fake_overwrites)
+
+
+class FakeGuild:
+    def __init__(self, api: Api, guild_id: int, name: str = "League"):
+        self.api = api
+        self.id = guild_id
+        self.name = name
+        self.members = {}
+        self.channels = {}
+        self.categories = []
+        self.default_role = FakeRole(guild_id, "@everyone")
+        self.roles = [self.default_role]
+        self.filesize_limit = 25 * 1024 * 1024
+
+    @property
+    def member_count(self) -> int:
+        return len(self.members)
+
+    def add_role(self, name: str) -> FakeRole:
+        role = FakeRole(next(self.api.ids), name)
+        self.roles.append(role)
+        return role
+
+    def add_member(self, member_id: int, name: str, roles: tuple = ()) -> FakeMember:
+        member = self.members[member_id] = FakeMember(self, member_id, name, roles)
+        return member
+
+    def add_text_channel(self, name: str, category=None) -> FakeTextChannel:
+        channel = FakeTextChannel(self, next(self.api.ids), name, category)
+        self.channels[channel.id] = channel
+        if category is not None:
+            category.fake_channels.append(channel)
+        return channel
+
+    def get_member(self, member_id: int):
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id: int):
+        await self.api.call("guild.fetch_channel")
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Channel")
+        return channel
+
+    async def query_members(self, user_ids=None, cache=True, **kwargs):
+        await self.api.call("gateway.query_members")
+        return [self.members[i] for i in user_ids or () if i in self.members]
+
+    async def create_category(self, name: str, overwrites=None, **kwargs) -> FakeCategory:
+        await self.api.call("guild.create_category")
+        category = FakeCategory(self, next(self.api.ids), name, overwrites)
+        self.categories.append(category)
+        self.channels[category.id] = category
+        return category
+
+    async def create_text_channel(self, name: str, category=None, overwrites=None, **kwargs) -> FakeTextChannel:
+        await self.api.call("guild.create_text_channel")
+        return self.add_text_channel(name, category)
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _respond(self, name: str):
+        if self._done:
+            raise RuntimeError("interaction already acknowledged")  # discord.InteractionResponded in the real thing
+        self._done = True
+        await self._interaction.guild.api.call(name)
+        self._interaction.acked = asyncio.get_running_loop().time()
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond("interaction.send_message")
+
+    async def defer(self, **kwargs):
+        await self._respond("interaction.defer")
+
+    async def edit_message(self, **kwargs):
+        await self._respond("interaction.edit_message")
+
+    async def send_modal(self, modal):
+        await self._respond("interaction.send_modal")
+
+
+class FakeFollowup:
+    def __init__(self, api: Api):
+        self._api = api
+
+    async def send(self, content=None, **kwargs):
+        await self._api.call("interaction.followup")
+
+
+class FakeInteraction:
+    """An interaction from ``user``; ``acked`` is the loop time of the first response."""
+
+    def __init__(self, guild: FakeGuild, user: FakeMember, channel=None, message=None):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.message = message
+        self.command = None
+        self.extras = {}
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(guild.api)
+        self.acked = None
+
+    async def original_response(self):
+        await self.guild.api.call("interaction.original_response")
+        return FakeMessage(self.channel or FakeTextChannel(self.guild, 0, "unknown"), next(self.guild.api.ids))
@@ -0,0 +1,151 @@
+# greetings.py
+"""Welcome/goodbye messages: precompiled templates and digests during join raids."""
+import asyncio
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Callable
+
+from metrics import background_errors_total
+
+RAID_JOINS = 5       # events per guild within RAID_WINDOW before switching to digests
+RAID_WINDOW = 10.0   # seconds
+DIGEST_DELAY = 5.0   # seconds of events collected into one digest message
+DIGEST_NAMES = 25    # members listed in a digest before "and N others"
+
+PLACEHOLDERS = ("user", "mention", "name", "display_name", "server", "member_count", "count")
+DEFAULT_TEMPLATES = {
+    "welcome": "Welcome {mention} — good luck on track!",
+    "goodbye": "{name} has left the server.",
+}
+DEFAULT_DIGEST_TEMPLATES = {
+    "welcome": "Welcome {mention} — good luck on track!",
+    "goodbye": "{name} have left the server.",
+}
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+@lru_cache(maxsize=1024)
+def compile_template(text: str) -> tuple:
+    """Split a template into literal text (even positions) and placeholder names (odd positions)."""
+    return tuple(_PLACEHOLDER.split(text))
+
+
+def render_template(template: tuple, values: dict) -> str:
+    # unknown placeholders (or stray braces in the text) are left as written
+    return "".join(part if i % 2 == 0 else values.get(part, "{" + part + "}") for i, part in enumerate(template))
+
+
+def _listed(values: list, limit: int) -> str:
+    shown = values[:limit]
+    rest = len(values) - len(shown)
+    return ", ".join(shown) + (f" and {rest} others" if rest else "")
+
+
+def template_values(kind: str, members: list, limit: int = DIGEST_NAMES) -> dict:
+    """Placeholder values for one member, or a digest of several from the same guild."""
+    guild = members[0].guild
+    mention = _listed([m.mention for m in members], limit)
+    name = _listed([m.name for m in members], limit)
+    return {
+        # {user} was the only placeholder originally: a mention on welcome, a plain name on goodbye
+        "user": mention if kind == "welcome" else name,
+        "mention": mention,
+        "name": name,
+        "display_name": _listed([m.display_name for m in members], limit),
+        "server": guild.name,
+        "member_count": str(guild.member_count),
+        "count": str(len(members)),
+    }
+
+
+def greeting_text(kind: str, template: str, members: list, limit: int = DIGEST_NAMES) -> str:
+    """Render the guild's ``template`` (or the default) for ``members``."""
+    if not template:
+        template = (DEFAULT_TEMPLATES if len(members) == 1 else DEFAULT_DIGEST_TEMPLATES)[kind]
+    return render_template(compile_template(template), template_values(kind, members, limit))
+
+
+class Greeter:
+    """Single pipeline for member join ("welcome") and leave ("goodbye") events.
+
+    ``await settings(guild_id)`` returns the guild's settings (see db.GuildSettings);
+    ``await send(channel, kind, text, members)`` posts one message. Each event is sent
+    on its own until a guild sees more than ``raid_joins`` of a kind within
+    ``raid_window`` seconds; after that, events are collected for ``digest_delay``
+    seconds and sent as one digest.
+    """
+
+    def __init__(self, settings: Callable, send: Callable, raid_joins: int = RAID_JOINS,
+                 raid_window: float = RAID_WINDOW, digest_delay: float = DIGEST_DELAY,
+                 digest_names: int = DIGEST_NAMES):
+        self.settings = settings
+        self.send = send
+        self.raid_joins = raid_joins
+        self.raid_window = raid_window
+        self.digest_delay = digest_delay
+        self.digest_names = digest_names
+        self._recent = {}    # (guild id, kind) -> deque of event times within raid_window
+        self._batches = {}   # (guild id, kind) -> [members] awaiting a digest
+        self._tasks = set()  # scheduled digest flushes
+        self.sent = 0
+        self.digests = 0
+
+    async def _target(self, kind: str, guild):
+        settings = await self.settings(str(guild.id))
+        channel_id = getattr(settings, f"{kind}_channel_id")
+        channel = guild.get_channel(channel_id) if channel_id else None
+        return settings, channel
+
+    async def member_event(self, kind: str, member):
+        settings, channel = await self._target(kind, member.guild)
+        if channel is None:
+            return
+        key = (member.guild.id, kind)
+        batch = self._batches.get(key)
+        if batch is not None:
+            batch.append(member)
+            return
+        now = time.monotonic()
+        recent = self._recent.setdefault(key, deque())
+        recent.append(now)
+        while recent[0] <= now - self.raid_window:
+            recent.popleft()
+        if len(recent) <= self.raid_joins:
+            await self._send(channel, kind, getattr(settings, f"{kind}_message"), [member])
+            return
+        self._batches[key] = [member]
+        task = asyncio.create_task(self._flush_later(key, member.guild))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_later(self, key: tuple, guild):
+        await asyncio.sleep(self.digest_delay)
+        await self._flush(key, guild)
+
+    async def _flush(self, key: tuple, guild):
+        members = self._batches.pop(key, None)
+        if not members:
+            return
+        kind = key[1]
+        try:
+            # settings may have changed while the digest was collecting
+            settings, channel = await self._target(kind, guild)
+            if channel is not None:
+                await self._send(channel, kind, getattr(settings, f"{kind}_message"), members)
+                self.digests += len(members) > 1
+        except Exception as e:
+            background_errors_total.inc(f"{kind}_digest")
+            print(f"{kind.title()} digest for {guild.id} failed:", e)
+
+    async def _send(self, channel, kind: str, template: str, members: list):
+        await self.send(channel, kind, greeting_text(kind, template, members, self.digest_names), members)
+        self.sent += 1
+
+    async def flush(self):
+        """Send collected digests now (used on shutdown)."""
+        for task in list(self._tasks):
+            task.cancel()
+        for key, members in list(self._batches.items()):
+            await self._flush(key, members[0].guild)
@@ -0,0 +1,57 @@
+# health.py
+"""Health checks and Prometheus metrics over HTTP, served on the bot's own event loop."""
+import asyncio
+from typing import Callable
+
+from aiohttp import web
+
+CHECK_TIMEOUT = 2.0  # seconds before a check counts as failed
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus text format
+
+
+class HealthServer:
+    """/healthz runs the ``liveness`` checks, /readyz the ``readiness`` ones; each maps a
+    name to ``async fn() -> (ok, detail)`` and the endpoint answers 503 if any fails.
+    /metrics serves the Prometheus text returned by ``metrics()`` (see metrics.Registry)."""
+
+    def __init__(self, liveness: dict, readiness: dict, metrics: Callable, host: str = "0.0.0.0", port: int = 8080):
+        self.liveness = liveness
+        self.readiness = readiness
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self._root)
+        app.router.add_get("/healthz", lambda request: self._checks(self.liveness))
+        app.router.add_get("/readyz", lambda request: self._checks(self.readiness))
+        app.router.add_get("/metrics", self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _root(self, request):
+        return web.Response(text="F1 League Bot — keep-alive")
+
+    async def _checks(self, checks: dict):
+        results = await asyncio.gather(*(asyncio.wait_for(fn(), CHECK_TIMEOUT) for fn in checks.values()),
+                                       return_exceptions=True)
+        body, healthy = {}, True
+        for name, result in zip(checks, results):
+            if isinstance(result, BaseException):
+                ok, detail = False, "timed out" if isinstance(result, asyncio.TimeoutError) else str(result)
+            else:
+                ok, detail = result
+            healthy &= ok
+            body[name] = {"ok": ok, "detail": detail}
+        return web.json_response({"ok": healthy, "checks": body}, status=200 if healthy else 503)
+
+    async def _metrics(self, request):
+        return web.Response(body=self.metrics().encode(), headers={"Content-Type": CONTENT_TYPE})
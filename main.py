@@ -1,200 +1,428 @@
 # main.py
+import abc
+import asyncio
+import csv
+import functools
+import hashlib
+import heapq
+import io
+import json
 import os
+import shutil
+import signal
 import sys
+import tempfile
+import time
+import traceback
 sys.modules['audioop'] = __import__('fake_audioop')
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
-import sqlite3
-import datetime
-from flask import Flask
-from threading import Thread
-from typing import Optional
-
-# ---------- Keep-alive web server (for Replit / uptime pingers) ----------
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "F1 League Bot — keep-alive"
-
-def run_web():
-    app.run(host='0.0.0.0', port=8080)
-
-Thread(target=run_web, daemon=True).start()
+from discord.ext import commands
+from typing import NamedTuple, Optional
+from attendance import AttendanceTracker
+from db import Database
+from export import archive_files, write_archive
+from greetings import PLACEHOLDERS, Greeter, greeting_text
+from health import HealthServer
+import metrics
+from outbox import HIGH, LOW, NORMAL, Outbox
+from transcripts import write_transcript
+
+STARTED_AT = time.perf_counter()
 
 # ---------- Config ----------
 TOKEN = os.environ.get("TOKEN")
-if not TOKEN:
-    raise RuntimeError("Missing TOKEN environment variable!")
 
 # default steward role name; editable by /setsystem stewardrole
 DEFAULT_STEWARD_ROLE = "Steward"
 
+# development: sync slash commands to this guild only (instant) instead of globally
+DEV_GUILD_ID = os.environ.get("DEV_GUILD_ID")
+# set to 1 to sync even when the command tree is unchanged
+FORCE_COMMAND_SYNC = os.environ.get("FORCE_COMMAND_SYNC") == "1"
+
+# health/metrics HTTP server; Cloud Run passes the port in PORT
+HEALTH_PORT = int(os.environ.get("PORT", "8080"))
+
 # ---------- Intents & Bot ----------
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = False  # we use slash commands
-bot = commands.Bot(command_prefix="!", intents=intents)
+class InstrumentedTree(app_commands.CommandTree):
+    """Times every application command (see metrics.py). Timing starts here, before the
+    options are transformed, and ends in on_app_command_completion or the error handler."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # autocomplete never reaches on_app_command_completion, so its timing would never finish
+        if interaction.command is not None and interaction.type is not discord.InteractionType.autocomplete:
+            interaction.extras["timing"] = metrics.start(f"/{interaction.command.qualified_name}", interaction)
+        return True
+
+def instrumented(name: str):
+    """Time a view button or modal callback the same way."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, interaction: discord.Interaction, *args):
+            async with metrics.track(name, interaction):
+                return await fn(self, interaction, *args)
+        return wrapper
+    return decorator
+
+class LeagueBot(commands.Bot):
+    async def setup_hook(self):
+        # runs once per process, not on every gateway reconnect/resume
+        await health.start()
+        register_persistent_views()
+        await db.drivers.load_index()
+        await sync_commands_if_changed()
+        # docker stop / systemd send SIGTERM; close() flushes pending writes before exiting
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass  # Windows event loops have no signal handlers
+
+    async def close(self):
+        # persist buffered attendance clicks and embed edits before disconnecting
+        await attendance.flush()
+        await greeter.flush()
+        # let transcripts being archived finish; their channels are only deleted afterwards
+        if closing_tickets:
+            await asyncio.wait(list(closing_tickets.values()), timeout=30)
+        await outbox.flush()
+        await health.stop()
+        await super().close()
+
+bot = LeagueBot(command_prefix="!", intents=intents, tree_cls=InstrumentedTree, http_trace=metrics.trace_config())
 tree = bot.tree
 
 # ---------- Database ----------
-DB = "league.db"
-conn = sqlite3.connect(DB, check_same_thread=False)
-c = conn.cursor()
-
-# tables
-c.executescript("""
-CREATE TABLE IF NOT EXISTS drivers (
-    user_id TEXT PRIMARY KEY,
-    name TEXT
-);
-
-CREATE TABLE IF NOT EXISTS penalties (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT,
-    points INTEGER,
-    reason TEXT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE TABLE IF NOT EXISTS bans (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT,
-    type TEXT, -- 'quali' or 'race'
-    reason TEXT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE TABLE IF NOT EXISTS attendance (
-    message_id TEXT,
-    user_id TEXT,
-    status TEXT, -- attend / not / maybe
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    PRIMARY KEY (message_id, user_id)
-);
-
-CREATE TABLE IF NOT EXISTS settings (
-    guild_id TEXT PRIMARY KEY,
-    welcome_channel_id TEXT,
-    goodbye_channel_id TEXT,
-    ticket_log_channel_id TEXT,
-    steward_role_name TEXT DEFAULT 'Steward',
-    ticket_category_id TEXT
-    welcome_message TEXT,
-    goodbye_message TEXT
-
-
-);
-
-
-CREATE TABLE IF NOT EXISTS tickets (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    guild_id TEXT,
-    channel_id TEXT,
-    owner_id TEXT,
-    opened_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    closed_at DATETIME
-);
-
-CREATE TABLE IF NOT EXISTS banlist_messages (
-    guild_id TEXT PRIMARY KEY,
-    channel_id TEXT,
-    message_id TEXT
-);
-
-""")
-conn.commit()
+DB = os.environ.get("DB_PATH", "league.db")
+# set to 1 to keep each guild's data in its own file (league.<guild id>.db); guilds already
+# in the shared file are moved into theirs on the first start with it set
+DB_PER_GUILD = os.environ.get("DB_PER_GUILD") == "1"
+db = Database(DB, per_guild=DB_PER_GUILD)
+
+# ---------- Outbound queue ----------
+# channel posts and edits that are not interaction responses; see outbox.py
+outbox = Outbox()
 
 # ---------- Helpers ----------
-def ensure_driver_exists(user_id: str, name: str):
-    c.execute('INSERT OR IGNORE INTO drivers (user_id, name) VALUES (?, ?)', (user_id, name))
-    conn.commit()
+async def ensure_driver_exists(guild_id: str, user_id: str, name: str):
+    await db.drivers.ensure(guild_id, user_id, name)
 
-def get_steward_role_name(guild_id: int) -> str:
-    c.execute('SELECT steward_role_name FROM settings WHERE guild_id = ?', (str(guild_id),))
-    r = c.fetchone()
-    return r[0] if r and r[0] else DEFAULT_STEWARD_ROLE
+async def get_steward_role_name(guild_id: int) -> str:
+    settings = await db.settings.get(str(guild_id))
+    return settings.steward_role_name or DEFAULT_STEWARD_ROLE
 
-def is_steward_member(member: discord.Member) -> bool:
-    role_name = get_steward_role_name(member.guild.id)
+async def is_steward_member(member: discord.Member) -> bool:
+    role_name = await get_steward_role_name(member.guild.id)
     return any(role.name.lower() == role_name.lower() for role in member.roles)
 
-def update_auto_bans(member_id: str, member_name: Optional[str] = None) -> int:
-    """Calculate total points, insert/remove automatic quals/race bans. Return total points."""
-    if member_name:
-        ensure_driver_exists(member_id, member_name)
-    c.execute('SELECT SUM(points) FROM penalties WHERE user_id = ?', (member_id,))
-    total = c.fetchone()[0] or 0
-
-    # quali >=10
-    c.execute('SELECT id FROM bans WHERE user_id = ? AND type = "quali"', (member_id,))
-    has_quali = c.fetchone() is not None
-    if total >= 10 and not has_quali:
-        c.execute('INSERT INTO bans (user_id, type, reason, timestamp) VALUES (?, "quali", ?, CURRENT_TIMESTAMP)',
-                  (member_id, "Automatic quali ban for 10+ points"))
-    elif total < 10 and has_quali:
-        c.execute('DELETE FROM bans WHERE user_id = ? AND type = "quali"', (member_id,))
-
-    # race >=15
-    c.execute('SELECT id FROM bans WHERE user_id = ? AND type = "race"', (member_id,))
-    has_race = c.fetchone() is not None
-    if total >= 15 and not has_race:
-        c.execute('INSERT INTO bans (user_id, type, reason, timestamp) VALUES (?, "race", ?, CURRENT_TIMESTAMP)',
-                  (member_id, "Automatic race ban for 15+ points"))
-    elif total < 15 and has_race:
-        c.execute('DELETE FROM bans WHERE user_id = ? AND type = "race"', (member_id,))
-
-    conn.commit()
-    return total
-
-def cleanup_expired_bans_db():
-    cutoff = datetime.datetime.now() - datetime.timedelta(days=8)
-    c.execute('SELECT id, timestamp FROM bans')
-    rows = c.fetchall()
-    for ban_id, ts in rows:
-        try:
-            ban_time = datetime.datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')
-        except Exception:
+# ---------- Member names ----------
+class MemberNames:
+    """Display names from the gateway member cache, then the drivers table, then one
+    batched gateway member query for whatever is left."""
+
+    QUERY_LIMIT = 100  # user ids per guild.query_members request
+
+    async def resolve(self, guild: Optional[discord.Guild], user_ids: list, stored: Optional[dict] = None) -> dict:
+        """Return {user_id: name} for every id; unknown users render as "User ID <id>"."""
+        names = {}
+        missing = []
+        for uid in dict.fromkeys(user_ids):
+            member = guild.get_member(int(uid)) if guild else None
+            if member:
+                names[uid] = member.display_name
+            else:
+                missing.append(uid)
+        if missing:
+            if stored is None:
+                stored = await db.drivers.names_for(str(guild.id), missing) if guild else {}
+            for uid in missing:
+                if stored.get(uid):
+                    names[uid] = stored[uid]
+            missing = [uid for uid in missing if uid not in names]
+        if missing and guild:
             try:
-                ban_time = datetime.datetime.fromisoformat(ts)
-            except Exception:
-                ban_time = None
-        if ban_time and ban_time < cutoff:
-            c.execute('DELETE FROM bans WHERE id = ?', (ban_id,))
-    conn.commit()
+                found = await guild.query_members(user_ids=[int(uid) for uid in missing[:self.QUERY_LIMIT]], cache=True)
+            except Exception as e:
+                print(f"Member query failed for {guild.id}:", e)
+                found = []
+            for member in found:
+                names[str(member.id)] = member.display_name
+            if found:
+                await db.drivers.rename(str(guild.id), [(str(m.id), m.display_name) for m in found])
+        for uid in missing:
+            names.setdefault(uid, f"User ID {uid}")
+        return names
+
+    async def for_ban_rows(self, guild: discord.Guild, rows: list) -> dict:
+        # ban rows already carry the stored driver name
+        return await self.resolve(guild, [r[0] for r in rows], {r[0]: r[1] for r in rows})
+
+member_names = MemberNames()
+
+# ---------- Driver arguments ----------
+BAN_TYPE_CHOICES = [app_commands.Choice(name="Race", value="race"), app_commands.Choice(name="Quali", value="quali")]
+
+class DriverRef(NamedTuple):
+    """A driver picked by id, who may no longer be a member of the guild."""
+    id: str
+    display_name: str
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+class DriverArg(app_commands.Transformer):
+    """Driver option autocompleted from the in-memory name index; also takes a mention or raw id."""
+
+    async def autocomplete(self, interaction: discord.Interaction, value: str) -> list:
+        index = db.drivers.index(str(interaction.guild_id))
+        return [app_commands.Choice(name=name[:100], value=uid) for uid, name in index.search(value)]
+
+    async def transform(self, interaction: discord.Interaction, value: str) -> DriverRef:
+        index = db.drivers.index(str(interaction.guild_id))
+        raw = value.strip().removeprefix("<@").removeprefix("!").removesuffix(">")
+        if not raw.isdigit():
+            # typed a name without picking a suggestion: accept an exact match
+            matches = [uid for uid, name in index.search(raw) if name.casefold() == raw.casefold()]
+            if not matches:
+                raise app_commands.TransformerError(value, discord.AppCommandOptionType.string, self)
+            raw = matches[0]
+        member = interaction.guild.get_member(int(raw)) if interaction.guild else None
+        name = member.display_name if member else index.name(raw)
+        if name is None:
+            raise app_commands.TransformerError(value, discord.AppCommandOptionType.string, self)
+        return DriverRef(raw, name)
 
-# ---------- Live Ban List Update ----------
-async def update_live_banlist(guild: discord.Guild):
-    # get the message info from DB
-    c.execute('SELECT banlist_message_id, banlist_channel_id FROM settings WHERE guild_id = ?', (str(guild.id),))
-    r = c.fetchone()
-    if not r or not r[0] or not r[1]:
-        return  # nothing to update
-    try:
-        channel = guild.get_channel(int(r[1]))
-        msg = await channel.fetch_message(int(r[0]))
-    except Exception:
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    timing = interaction.extras.get("timing")
+    if timing:
+        metrics.finish(timing)
+
+@tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    timing = interaction.extras.get("timing")
+    if timing:
+        metrics.finish(timing, error)
+    if isinstance(error, app_commands.TransformerError) and isinstance(error.transformer, DriverArg):
+        await interaction.response.send_message(f"Unknown driver `{error.value}`. Pick one from the suggestions.", ephemeral=True)
         return
+    # handled here rather than re-raised: this runs inside the interaction's task, where
+    # a raise is only an unretrieved task exception and the user never gets a reply
+    name = interaction.command.qualified_name if interaction.command else "?"
+    print(f"Unhandled error in /{name}:", error)
+    traceback.print_exception(error)
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+    try:
+        await send("⚠️ Something went wrong running this command.", ephemeral=True)
+    except discord.HTTPException:
+        pass
 
-    # fetch active bans
-    cleanup_expired_bans_db()
-    c.execute('SELECT user_id, type, reason, timestamp FROM bans')
-    rows = c.fetchall()
+# ---------- Live Ban List Update ----------
+BANS_PER_PAGE = 20           # stays under the 25-field / 6000-char embed limits
+LIVE_BANLIST_DELAY = 2.0     # seconds to collect a burst of ban changes into one edit
 
-    emb = red_black_embed("Live Ban List", "")
+def render_ban_pages(rows: list, names: dict, title: str) -> list:
+    """Build one embed per BANS_PER_PAGE bans, naming drivers from ``names`` (see MemberNames)."""
     if not rows:
-        emb.description = "No active bans."
-    else:
-        for uid, btype, reason, ts in rows:
+        return [red_black_embed(title, "No active bans.")]
+    with metrics.timer("render"):
+        chunks = [rows[i:i + BANS_PER_PAGE] for i in range(0, len(rows), BANS_PER_PAGE)]
+        pages = []
+        for n, chunk in enumerate(chunks, start=1):
+            emb = red_black_embed(title if len(chunks) == 1 else f"{title} ({n}/{len(chunks)})", "")
+            for uid, _, btype, reason, ts in chunk:
+                emb.add_field(name=f"{names[uid]} — {btype}"[:256], value=f"{reason} ({ts})"[:200], inline=False)
+            pages.append(emb)
+        return pages
+
+def embed_digest(emb: discord.Embed) -> str:
+    return hashlib.sha1(json.dumps(emb.to_dict(), sort_keys=True).encode()).hexdigest()
+
+class LiveMessage(abc.ABC):
+    """Debounced per-guild updater: a burst of changes becomes one ``refresh(guild)``.
+
+    Refreshes and posts for one guild hold its lock, so overlapping runs never send the same page twice.
+    """
+
+    name = "live message"  # for logs and the background error metric
+
+    def __init__(self, delay: float = LIVE_BANLIST_DELAY):
+        self.delay = delay
+        self._pending = {}   # guild id -> scheduled refresh task
+        self._locks = {}     # guild id -> lock held by refresh and post
+
+    def schedule(self, guild: discord.Guild):
+        if guild.id not in self._pending:
+            self._pending[guild.id] = asyncio.create_task(self._debounced(guild))
+
+    async def _debounced(self, guild: discord.Guild):
+        await asyncio.sleep(self.delay)
+        # changes made while refreshing schedule a fresh run
+        self._pending.pop(guild.id, None)
+        try:
+            async with self.lock(guild):
+                await self.refresh(guild)
+        except Exception as e:
+            metrics.background_errors_total.inc(self.name.replace(" ", "_"))
+            print(f"{self.name.capitalize()} update failed for {guild.id}:", e)
+
+    def lock(self, guild: discord.Guild) -> asyncio.Lock:
+        return self._locks.setdefault(guild.id, asyncio.Lock())
+
+    @abc.abstractmethod
+    async def refresh(self, guild: discord.Guild):
+        """Bring the guild's message up to date; called with ``lock(guild)`` held."""
+
+class LiveBanList(LiveMessage):
+    """The live ban list, one message per page of bans."""
+
+    name = "live banlist"
+
+    def __init__(self, delay: float = LIVE_BANLIST_DELAY):
+        super().__init__(delay)
+        self._handles = {}   # guild id -> [PartialMessage] in page order
+        self._digests = {}   # message id -> digest of the embed it currently shows
+
+    async def _load_handles(self, guild: discord.Guild) -> list:
+        if guild.id not in self._handles:
+            handles = []
+            for channel_id, message_id in await db.bans.live_messages(str(guild.id)):
+                channel = guild.get_channel(int(channel_id))
+                if channel:
+                    handles.append(channel.get_partial_message(int(message_id)))
+            self._handles[guild.id] = handles
+        return self._handles[guild.id]
+
+    async def post(self, guild: discord.Guild, channel: discord.TextChannel):
+        """Start a live ban list in ``channel``, replacing any existing one."""
+        async with self.lock(guild):
+            for old in await self._load_handles(guild):
+                outbox.submit(old.channel.id, old.delete, LOW, label="ban list delete")
+            self._handles[guild.id] = []
+            await db.bans.set_live_messages(str(guild.id), [])
+            first = await outbox.submit(channel.id, lambda: channel.send(embed=red_black_embed("Live Ban List", "Loading…")),
+                                        NORMAL, label="ban list post")
+            self._handles[guild.id] = [first]
+            await db.bans.set_live_messages(str(guild.id), [(channel.id, first.id)])
+            await self.refresh(guild)
+
+    async def refresh(self, guild: discord.Guild):
+        handles = await self._load_handles(guild)
+        if not handles:
+            return  # no live ban list in this guild
+        rows = await db.bans.active(str(guild.id))
+        pages = render_ban_pages(rows, await member_names.for_ban_rows(guild, rows), "Live Ban List")
+        changed_layout = len(pages) != len(handles)
+        for i, emb in enumerate(pages):
+            digest = embed_digest(emb)
+            if i >= len(handles):
+                channel = handles[0].channel
+                msg = await outbox.submit(channel.id, lambda: channel.send(embed=emb), LOW, label="ban list page")
+                handles.append(msg)
+            elif self._digests.get(handles[i].id) != digest:
+                handle = handles[i]
+                try:
+                    await outbox.submit(handle.channel.id, lambda: handle.edit(embed=emb), LOW,
+                                        key=("edit", handle.id), label="ban list edit")
+                except discord.NotFound:
+                    # someone deleted the list; stop tracking it
+                    self._handles[guild.id] = []
+                    await db.bans.set_live_messages(str(guild.id), [])
+                    return
+            else:
+                continue
+            self._digests[handles[i].id] = digest
+        for extra in handles[len(pages):]:
+            self._digests.pop(extra.id, None)
+            outbox.submit(extra.channel.id, extra.delete, LOW, label="ban list delete")
+        del handles[len(pages):]
+        if changed_layout:
+            await db.bans.set_live_messages(str(guild.id), [(h.channel.id, h.id) for h in handles])
+
+live_banlist = LiveBanList()
+
+# ---------- Standings ----------
+STANDINGS_PER_PAGE = 20
+STANDINGS_LIVE_ROWS = 20  # drivers shown on the pinned live standings message
+
+def render_standings(rows: list, thresholds: tuple, page: int, title: str = "Penalty Standings") -> discord.Embed:
+    """One page of ``db.penalties.standings`` rows with each driver's distance to the ban thresholds."""
+    with metrics.timer("render"):
+        lines = []
+        for rank, (uid, name, total, bans) in enumerate(rows, start=(page - 1) * STANDINGS_PER_PAGE + 1):
+            active = bans.split(",") if bans else ()
+            status = []
+            for btype, limit in thresholds:
+                if btype in active:
+                    status.append(f"⛔ {btype} ban")
+                elif total >= limit:
+                    status.append(f"{btype} limit reached")  # ban expired or removed, or threshold lowered
+                else:
+                    status.append(f"{btype} in {limit - total}")
+            lines.append(f"`{rank:>3}.` {name or f'User ID {uid}'} — **{total}** pts · " + " · ".join(status))
+        emb = red_black_embed(title, "\n".join(lines) or "No driver has penalty points.")
+        limits = ", ".join(f"{btype} ban at {limit}" for btype, limit in thresholds)
+        emb.set_footer(text=f"CPG SGN F1 • Page {page} • {limits}")
+        return emb
+
+class LiveStandings(LiveMessage):
+    """A pinned message with the top of the standings, refreshed after penalty and ban changes."""
+
+    name = "live standings"
+
+    def __init__(self, delay: float = LIVE_BANLIST_DELAY):
+        super().__init__(delay)
+        self._digests = {}   # message id -> digest of the embed it currently shows
+
+    async def post(self, guild: discord.Guild, channel: discord.TextChannel):
+        """Start live standings in ``channel``, replacing any existing message."""
+        guild_id = str(guild.id)
+        async with self.lock(guild):
+            settings = await db.settings.get(guild_id)
+            old = guild.get_channel(settings.standings_channel_id) if settings.standings_channel_id else None
+            if old and settings.standings_message_id:
+                outbox.submit(old.id, old.get_partial_message(settings.standings_message_id).delete, LOW,
+                              label="standings delete")
+            msg = await outbox.submit(channel.id, lambda: channel.send(embed=red_black_embed("Penalty Standings", "Loading…")),
+                                      NORMAL, label="standings post")
+            await db.settings.update(guild_id, standings_channel_id=channel.id, standings_message_id=msg.id)
             try:
-                member = await guild.fetch_member(int(uid))
-                name = member.display_name
-            except Exception:
-                name = f"User ID {uid}"
-            emb.add_field(name=f"{name} — {btype}", value=f"{reason} ({ts})", inline=False)
+                await outbox.submit(channel.id, msg.pin, NORMAL, label="standings pin")
+            except discord.HTTPException:
+                pass  # missing Manage Messages; the message still updates
+            await self.refresh(guild)
+
+    async def refresh(self, guild: discord.Guild):
+        guild_id = str(guild.id)
+        settings = await db.settings.get(guild_id)
+        channel = guild.get_channel(settings.standings_channel_id) if settings.standings_channel_id else None
+        if channel is None or not settings.standings_message_id:
+            return
+        rows = await db.penalties.standings(guild_id, STANDINGS_LIVE_ROWS)
+        emb = render_standings(rows, settings.ban_thresholds, 1, "Live Penalty Standings")
+        digest = embed_digest(emb)
+        message = channel.get_partial_message(settings.standings_message_id)
+        if self._digests.get(message.id) == digest:
+            return
+        try:
+            await outbox.submit(channel.id, lambda: message.edit(embed=emb), LOW,
+                                key=("edit", message.id), label="standings edit")
+        except discord.NotFound:
+            await db.settings.update(guild_id, standings_channel_id=None, standings_message_id=None)
+            return
+        self._digests[message.id] = digest
+
+live_standings = LiveStandings()
 
-    await msg.edit(embed=emb)
+async def update_live_lists(guild: discord.Guild):
+    """Refresh everything derived from penalties and bans after a change."""
+    page_cache.invalidate(("standings", str(guild.id)))
+    live_banlist.schedule(guild)
+    live_standings.schedule(guild)
 
 
 # ---------- Embed styling ----------
@@ -204,307 +432,650 @@ def red_black_embed(title: str, description: str = None):
     return e
 
 
-# ---------- Views ----------
-class AttendanceView(discord.ui.View):
-    def __init__(self, msg_id: int):
-        super().__init__(timeout=None)
-        self.msg_id = str(msg_id)
-
-    async def update_embed(self, interaction: Optional[discord.Interaction] = None):
-        # Fetch counts & names
-        c.execute('SELECT user_id, status FROM attendance WHERE message_id = ?', (self.msg_id,))
-        rows = c.fetchall()
-        attending = [r[0] for r in rows if r[1] == 'attend']
-        not_attend = [r[0] for r in rows if r[1] == 'not']
-        maybe = [r[0] for r in rows if r[1] == 'maybe']
-
-        # Build display strings (limit lengths)
-        def names_from_ids(guild, ids):
-            names = []
-            for uid in ids:
-                try:
-                    m = guild.get_member(int(uid))
-                    names.append(m.display_name if m else uid)
-                except Exception:
-                    names.append(uid)
-            return names
-
-        # find the message to edit
-        if interaction:
-            guild = interaction.guild
-            channel = interaction.channel
+# ---------- Paginated lists ----------
+PAGE_CACHE_TTL = 15.0   # seconds a fetched page is reused
+PAGER_TIMEOUT = 300     # seconds before navigation buttons stop responding
+HISTORY_PER_PAGE = 15
+DRIVERS_PER_PAGE = 50
+
+class PageCache:
+    """Short-lived cache of fetched pages, keyed by (namespace..., direction, cursor)."""
+
+    def __init__(self, ttl: float = PAGE_CACHE_TTL, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (expires at, rows)
+
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        self._entries.pop(key, None)
+        return None
+
+    def put(self, key: tuple, rows: list):
+        if len(self._entries) >= self.max_entries:
+            self._entries.pop(next(iter(self._entries)))  # oldest insert
+        self._entries[key] = (time.monotonic() + self.ttl, rows)
+
+    def invalidate(self, namespace: tuple):
+        for key in [k for k in self._entries if k[:len(namespace)] == namespace]:
+            del self._entries[key]
+
+page_cache = PageCache()
+
+class KeysetPager(discord.ui.View):
+    """Prev/next navigation over a keyset-paginated query; each click fetches just that page.
+
+    ``fetch(limit, after=, before=)`` returns rows in display order, ``cursor(row)``
+    gives the row's keyset position and ``render(rows, page)`` builds the embed.
+    """
+
+    def __init__(self, owner_id: int, namespace: tuple, fetch, cursor, render, page_size: int):
+        super().__init__(timeout=PAGER_TIMEOUT)
+        self.owner_id = owner_id
+        self.namespace = namespace
+        self.fetch = fetch
+        self.cursor = cursor
+        self.render = render
+        self.page_size = page_size
+        self.page = 1
+        self.rows = []
+        self.message = None
+
+    async def restart(self) -> list:
+        self.page = 1
+        return await self.load()
+
+    async def load(self, after: Optional[tuple] = None, before: Optional[tuple] = None) -> list:
+        key = self.namespace + (("before", before) if before is not None else ("after", after))
+        rows = page_cache.get(key)
+        if rows is None:
+            # one extra row tells us whether there is another page in that direction
+            rows = await self.fetch(self.page_size + 1, after=after, before=before)
+            page_cache.put(key, rows)
+        if before is not None:
+            self.rows = rows[-self.page_size:]
+            has_next = True
         else:
-            # fallback: can't update without interaction
+            self.rows = rows[:self.page_size]
+            has_next = len(rows) > self.page_size
+        if not self.rows and self.page > 1:
+            # the rows around the cursor are gone (drivers removed, an import replaced the data)
+            return await self.restart()
+        self.prev_page.disabled = self.page <= 1
+        self.next_page.disabled = not has_next
+        return self.rows
+
+    def embed(self) -> discord.Embed:
+        with metrics.timer("render"):
+            return self.render(self.rows, self.page)
+
+    async def send(self, interaction: discord.Interaction):
+        if self.next_page.disabled:
+            await interaction.response.send_message(embed=self.embed())
             return
+        await interaction.response.send_message(embed=self.embed(), view=self)
+        self.message = await interaction.original_response()
 
-        # locate message by id in this channel
-        try:
-            msg = await channel.fetch_message(int(self.msg_id))
-        except Exception:
-            return
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Run the command yourself to browse these pages.", ephemeral=True)
+            return False
+        return True
 
-        emb = discord.Embed(title=msg.embeds[0].title if msg.embeds else "Attendance", color=0x880000)
-        emb.add_field(name=f"✅ Attending ({len(attending)})", value="\n".join(names_from_ids(guild, attending)) or "None", inline=True)
-        emb.add_field(name=f"❌ Not Attending ({len(not_attend)})", value="\n".join(names_from_ids(guild, not_attend)) or "None", inline=True)
-        emb.add_field(name=f"🤔 Maybe ({len(maybe)})", value="\n".join(names_from_ids(guild, maybe)) or "None", inline=False)
-        try:
-            await msg.edit(embed=emb, view=self)
-        except Exception:
-            pass
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    @instrumented("button:page")
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.rows:
+            self.page -= 1
+            await self.load(before=self.cursor(self.rows[0]))
+        else:
+            await self.restart()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    @instrumented("button:page")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.rows:
+            self.page += 1
+            await self.load(after=self.cursor(self.rows[-1]))
+        else:
+            await self.restart()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+
+# ---------- Views ----------
+# Attendance buttons carry the post's message id in their custom_id
+# ("attendance:<status>:<message id>"), so one registered DynamicItem class
+# serves every post; no per-message view objects are kept.
+ATTENDANCE_BUTTONS = {
+    "attend": ("Attend ✅", discord.ButtonStyle.success, "Marked as attending ✅"),
+    "not": ("Not Attend ❌", discord.ButtonStyle.danger, "Marked as NOT attending ❌"),
+    "maybe": ("Maybe 🤔", discord.ButtonStyle.secondary, "Marked as Maybe 🤔"),
+}
+
+class AttendanceButton(discord.ui.DynamicItem[discord.ui.Button], template=r"attendance:(?P<status>attend|not|maybe):(?P<message_id>\d+)"):
+    def __init__(self, status: str, message_id: int):
+        label, style, _ = ATTENDANCE_BUTTONS[status]
+        super().__init__(discord.ui.Button(label=label, style=style, custom_id=f"attendance:{status}:{message_id}"))
+        self.status = status
+        self.message_id = message_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["status"], int(match["message_id"]))
+
+    @instrumented("button:attendance")
+    async def callback(self, interaction: discord.Interaction):
+        await interaction.response.send_message(ATTENDANCE_BUTTONS[self.status][2], ephemeral=True)
+        await attendance.record(interaction.message, str(interaction.user.id), self.status)
+
+def attendance_view(message_id: int) -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    for status in ATTENDANCE_BUTTONS:
+        view.add_item(AttendanceButton(status, message_id))
+    view.stop()  # handled by the registered AttendanceButton; don't keep a per-message copy
+    return view
+
+class AttendanceView(discord.ui.View):
+    """Static custom ids used by attendance posts made before AttendanceButton; registered once."""
+
+    def __init__(self):
+        super().__init__(timeout=None)
 
     @discord.ui.button(label="Attend ✅", style=discord.ButtonStyle.success, custom_id="attend_yes")
+    @instrumented("button:attendance")
     async def attend(self, interaction: discord.Interaction, button: discord.ui.Button):
-        c.execute('REPLACE INTO attendance (message_id, user_id, status, timestamp) VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
-                  (self.msg_id, str(interaction.user.id), "attend"))
-        conn.commit()
         await interaction.response.send_message("Marked as attending ✅", ephemeral=True)
-        await self.update_embed(interaction)
+        await attendance.record(interaction.message, str(interaction.user.id), "attend")
 
     @discord.ui.button(label="Not Attend ❌", style=discord.ButtonStyle.danger, custom_id="attend_no")
+    @instrumented("button:attendance")
     async def not_attend(self, interaction: discord.Interaction, button: discord.ui.Button):
-        c.execute('REPLACE INTO attendance (message_id, user_id, status, timestamp) VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
-                  (self.msg_id, str(interaction.user.id), "not"))
-        conn.commit()
         await interaction.response.send_message("Marked as NOT attending ❌", ephemeral=True)
-        await self.update_embed(interaction)
+        await attendance.record(interaction.message, str(interaction.user.id), "not")
 
     @discord.ui.button(label="Maybe 🤔", style=discord.ButtonStyle.secondary, custom_id="attend_maybe")
+    @instrumented("button:attendance")
     async def maybe(self, interaction: discord.Interaction, button: discord.ui.Button):
-        c.execute('REPLACE INTO attendance (message_id, user_id, status, timestamp) VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
-                  (self.msg_id, str(interaction.user.id), "maybe"))
-        conn.commit()
         await interaction.response.send_message("Marked as Maybe 🤔", ephemeral=True)
-        await self.update_embed(interaction)
+        await attendance.record(interaction.message, str(interaction.user.id), "maybe")
+
+def field_list(names: list) -> str:
+    """Newline-joined names trimmed to the 1024-char embed field limit."""
+    text = "\n".join(names)
+    if len(text) <= 1024:
+        return text or "None"
+    shown = []
+    used = 0
+    for i, name in enumerate(names):
+        more = f"…and {len(names) - i} more"
+        if used + len(name) + 1 + len(more) > 1024:
+            return "\n".join(shown + [more])
+        shown.append(name)
+        used += len(name) + 1
+    return "\n".join(shown)
+
+async def render_attendance_embed(message: discord.Message, tally: dict) -> discord.Embed:
+    names = await member_names.resolve(message.guild, [uid for members in tally.values() for uid in members])
+
+    def names_from_ids(ids):
+        return [names[uid] for uid in ids]
+
+    attending, not_attend, maybe = tally["attend"], tally["not"], tally["maybe"]
+    emb = discord.Embed(title=message.embeds[0].title if message.embeds else "Attendance", color=0x880000)
+    emb.add_field(name=f"✅ Attending ({len(attending)})", value=field_list(names_from_ids(attending)), inline=True)
+    emb.add_field(name=f"❌ Not Attending ({len(not_attend)})", value=field_list(names_from_ids(not_attend)), inline=True)
+    emb.add_field(name=f"🤔 Maybe ({len(maybe)})", value=field_list(names_from_ids(maybe)), inline=False)
+    return emb
+
+attendance = AttendanceTracker(db, render_attendance_embed, outbox=outbox)
+
+TICKET_CATEGORY = "Tickets"
+CATEGORY_CHANNEL_LIMIT = 50  # Discord's cap on channels per category
+
+class TicketDesk:
+    """Opens ticket channels one at a time per guild, one open ticket per member, spreading
+    them over "Tickets", "Tickets 2", "Tickets 3"… as each category fills."""
+
+    UNSEEN_TTL = 60.0  # seconds to count a new channel before the gateway cache shows it
+
+    def __init__(self):
+        self._locks = {}   # guild id -> asyncio.Lock
+        self._unseen = {}  # category id -> {channel id: created at} not yet in the channel cache
+
+    def lock(self, guild_id: int) -> asyncio.Lock:
+        if guild_id not in self._locks:
+            self._locks[guild_id] = asyncio.Lock()
+        return self._locks[guild_id]
+
+    def _count(self, category: discord.CategoryChannel) -> int:
+        # channels we just created appear in category.channels only once their gateway event lands
+        cached = {c.id for c in category.channels}
+        unseen = self._unseen.get(category.id, {})
+        now = time.monotonic()
+        for cid in [cid for cid, at in unseen.items() if cid in cached or now - at > self.UNSEEN_TTL]:
+            del unseen[cid]
+        return len(cached) + len(unseen)
+
+    async def _category_with_room(self, guild: discord.Guild, settings) -> discord.CategoryChannel:
+        primary = guild.get_channel(settings.ticket_category_id) if settings.ticket_category_id else None
+        if not isinstance(primary, discord.CategoryChannel):
+            primary = await guild.create_category(TICKET_CATEGORY)
+            await db.settings.update(str(guild.id), ticket_category_id=primary.id,
+                                     steward_role_name=settings.steward_role_name or DEFAULT_STEWARD_ROLE)
+        category, n = primary, 1
+        while self._count(category) >= CATEGORY_CHANNEL_LIMIT:
+            n += 1
+            name = f"{primary.name} {n}"
+            category = (discord.utils.get(guild.categories, name=name)
+                        or await guild.create_category(name, overwrites=primary.overwrites))
+        return category
+
+    async def open(self, guild: discord.Guild, member: discord.Member) -> tuple:
+        """Return (ticket channel, created); an already-open ticket is returned instead of a new one."""
+        guild_id = str(guild.id)
+        async with self.lock(guild.id):
+            existing = await db.tickets.open_for_owner(guild_id, str(member.id))
+            if existing:
+                channel = guild.get_channel(int(existing[1]))
+                if channel is None:
+                    # not cached yet (just created) or deleted by hand; ask Discord which
+                    try:
+                        channel = await guild.fetch_channel(int(existing[1]))
+                    except discord.NotFound:
+                        await db.tickets.close(guild_id, existing[0])
+                if channel:
+                    return channel, False
+
+            settings = await db.settings.get(guild_id)
+            category = await self._category_with_room(guild, settings)
+            overwrites = {
+                guild.default_role: discord.PermissionOverwrite(read_messages=False),
+                member: discord.PermissionOverwrite(read_messages=True, send_messages=True)
+            }
+            steward_role = discord.utils.get(guild.roles, name=settings.steward_role_name or DEFAULT_STEWARD_ROLE)
+            if steward_role:
+                overwrites[steward_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+
+            chan_name = f"ticket-{member.name}".lower().replace(" ", "-")[:90]
+            channel = await guild.create_text_channel(chan_name, category=category, overwrites=overwrites)
+            self._unseen.setdefault(category.id, {})[channel.id] = time.monotonic()
+            await db.tickets.open(guild_id, str(channel.id), str(member.id))
+            return channel, True
+
+ticket_desk = TicketDesk()
 
 class TicketView(discord.ui.View):
-    def __init__(self, guild_id: int, create_msg_title: str = "Create Ticket", create_msg_desc: str = "Click to open a support ticket"):
+    def __init__(self, guild_id: Optional[int] = None, create_msg_title: str = "Create Ticket", create_msg_desc: str = "Click to open a support ticket"):
         super().__init__(timeout=None)
         self.guild_id = guild_id
         self.create_msg_title = create_msg_title
         self.create_msg_desc = create_msg_desc
 
     @discord.ui.button(label="🎫 Create Ticket", style=discord.ButtonStyle.primary, custom_id="create_ticket")
+    @instrumented("button:create_ticket")
     async def create_ticket(self, interaction: discord.Interaction, button: discord.ui.Button):
-        guild = interaction.guild
+        # creating channels can outlast the 3s interaction deadline, especially behind the lock
+        await interaction.response.defer(ephemeral=True, thinking=True)
         member = interaction.user
-        # get or create ticket category
-        c.execute('SELECT ticket_category_id, steward_role_name FROM settings WHERE guild_id = ?', (str(guild.id),))
-        r = c.fetchone()
-        category = None
-        steward_role_name = r[1] if r and r[1] else DEFAULT_STEWARD_ROLE
-        if r and r[0]:
-            try:
-                category = guild.get_channel(int(r[0]))
-            except Exception:
-                category = None
-        if not category:
-            category = await guild.create_category("Tickets")
-            c.execute('INSERT OR REPLACE INTO settings (guild_id, ticket_category_id, steward_role_name) VALUES (?, ?, ?)',
-                      (str(guild.id), str(category.id), steward_role_name))
-            conn.commit()
-
-        # permissions
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            member: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-        }
-        steward_role = discord.utils.get(guild.roles, name=steward_role_name)
-        if steward_role:
-            overwrites[steward_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
-
-        chan_name = f"ticket-{member.name}".lower().replace(" ", "-")[:90]
-        ticket_chan = await guild.create_text_channel(chan_name, category=category, overwrites=overwrites)
-        # log
-        c.execute('INSERT INTO tickets (guild_id, channel_id, owner_id) VALUES (?, ?, ?)', (str(guild.id), str(ticket_chan.id), str(member.id)))
-        conn.commit()
-
-        await interaction.response.send_message(f"Ticket created: {ticket_chan.mention}", ephemeral=True)
-        await ticket_chan.send(f"Hello {member.mention}, a steward will be with you shortly. Use `/ticket_close` to close this ticket.")
+        try:
+            ticket_chan, created = await ticket_desk.open(interaction.guild, member)
+        except discord.HTTPException as e:
+            print(f"Ticket creation failed in {interaction.guild.id}:", e)
+            await interaction.followup.send("Could not create a ticket channel, please contact a steward.", ephemeral=True)
+            return
+        if not created:
+            await interaction.followup.send(f"You already have an open ticket: {ticket_chan.mention}", ephemeral=True)
+            return
+        await interaction.followup.send(f"Ticket created: {ticket_chan.mention}", ephemeral=True)
+        outbox.submit(ticket_chan.id, lambda: ticket_chan.send(
+            f"Hello {member.mention}, a steward will be with you shortly. Use `/ticket_close` to close this ticket."),
+            HIGH, label="ticket greeting")
 
 # ---------- Events ----------
-@bot.event
-async def on_member_join(member: discord.Member):
-    c.execute('SELECT welcome_channel_id, welcome_message FROM settings WHERE guild_id = ?', (str(member.guild.id),))
-    r = c.fetchone()
-    if r and r[0]:
-        ch = member.guild.get_channel(int(r[0]))
-        if ch:
-            msg_text = r[1] if r[1] else f"Welcome {member.mention} — good luck on track!"
-            msg_text = msg_text.replace("{user}", member.mention)
-            emb = red_black_embed("Welcome to the league!", msg_text)
-            emb.set_thumbnail(url=member.avatar.url if member.avatar else discord.Embed.Empty)
-            await ch.send(embed=emb)
+GREETING_TITLES = {"welcome": "Welcome to the league!", "goodbye": "Goodbye from the league"}
 
-@bot.event
-async def on_member_remove(member: discord.Member):
-    c.execute('SELECT goodbye_channel_id, goodbye_message FROM settings WHERE guild_id = ?', (str(member.guild.id),))
-    r = c.fetchone()
-    if r and r[0]:
-        ch = member.guild.get_channel(int(r[0]))
-        if ch:
-            msg_text = r[1] if r[1] else f"{member.name} has left the server."
-            msg_text = msg_text.replace("{user}", member.name)
-            emb = red_black_embed("Goodbye from the league", msg_text)
-            await ch.send(embed=emb)
+async def send_greeting(channel: discord.TextChannel, kind: str, text: str, members: list):
+    emb = red_black_embed(GREETING_TITLES[kind], text)
+    if kind == "welcome" and len(members) == 1:
+        emb.set_thumbnail(url=members[0].display_avatar.url)
+    # not awaited: a slow channel must not hold up the gateway event
+    outbox.submit(channel.id, lambda: channel.send(embed=emb), NORMAL, label=kind)
+
+greeter = Greeter(db.settings.get, send_greeting)
 
 @bot.event
 async def on_member_join(member: discord.Member):
-    await send_welcome(member)
+    await greeter.member_event("welcome", member)
 
 @bot.event
 async def on_member_remove(member: discord.Member):
-    await send_goodbye(member)
+    await greeter.member_event("goodbye", member)
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    # keep drivers.name in step with nickname changes
+    if before.display_name != after.display_name:
+        await db.drivers.rename(str(after.guild.id), [(str(after.id), after.display_name)])
+        page_cache.invalidate(("drivers", str(after.guild.id)))
 
 # ---------- Slash commands: driver / penalties / bans ----------
 @tree.command(name="adddriver", description="Add a driver to the database")
 @app_commands.describe(user="User to add")
 async def adddriver(interaction: discord.Interaction, user: discord.Member):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 You must be a Steward to add drivers.", ephemeral=True); return
-    ensure_driver_exists(str(user.id), user.display_name)
+    guild_id = str(interaction.guild.id)
+    await ensure_driver_exists(guild_id, str(user.id), user.display_name)
+    page_cache.invalidate(("drivers", guild_id))
     await interaction.response.send_message(f"✅ {user.display_name} added as a driver.", ephemeral=True)
 
 @tree.command(name="removedriver", description="Remove a driver and their data")
-@app_commands.describe(user="User to remove")
-async def removedriver(interaction: discord.Interaction, user: discord.Member):
-    if not is_steward_member(interaction.user):
+@app_commands.describe(user="Driver to remove")
+async def removedriver(interaction: discord.Interaction, user: app_commands.Transform[DriverRef, DriverArg]):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward required.", ephemeral=True); return
-    c.execute('DELETE FROM drivers WHERE user_id = ?', (str(user.id),))
-    c.execute('DELETE FROM penalties WHERE user_id = ?', (str(user.id),))
-    c.execute('DELETE FROM bans WHERE user_id = ?', (str(user.id),))
-    c.execute('DELETE FROM attendance WHERE user_id = ?', (str(user.id),))
-    conn.commit()
+    guild_id = str(interaction.guild.id)
+    await db.drivers.remove(guild_id, str(user.id))
+    page_cache.invalidate(("drivers", guild_id))
+    page_cache.invalidate(("history", guild_id, str(user.id)))
     await interaction.response.send_message(f"✅ Removed {user.display_name} and records.", ephemeral=True)
+    await update_live_lists(interaction.guild)
 
 @tree.command(name="drivers", description="List registered drivers")
 async def list_drivers(interaction: discord.Interaction):
-    c.execute('SELECT name FROM drivers ORDER BY name COLLATE NOCASE')
-    rows = c.fetchall()
-    if not rows:
+    def render(rows, page):
+        embed = discord.Embed(title="Registered Drivers", description="\n".join(name for _, name in rows), color=0x880000)
+        embed.set_footer(text=f"Page {page}")
+        return embed
+
+    guild_id = str(interaction.guild.id)
+    pager = KeysetPager(interaction.user.id, ("drivers", guild_id),
+                        lambda limit, **cursor: db.drivers.page(guild_id, limit, **cursor),
+                        lambda r: (r[1], r[0]), render, DRIVERS_PER_PAGE)
+    if not await pager.load():
         await interaction.response.send_message("No drivers registered.", ephemeral=True); return
-    embed = discord.Embed(title="Registered Drivers", description="\n".join(r[0] for r in rows), color=0x880000)
-    await interaction.response.send_message(embed=embed)
+    await pager.send(interaction)
 
 @tree.command(name="penaltypoints", description="Add penalty points to a driver (Steward only)")
 @app_commands.describe(user="Driver", points="Points to add", reason="Reason")
-async def penaltypoints(interaction: discord.Interaction, user: discord.Member, points: int, reason: str):
-    if not is_steward_member(interaction.user):
+async def penaltypoints(interaction: discord.Interaction, user: app_commands.Transform[DriverRef, DriverArg], points: int, reason: str):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
-    ensure_driver_exists(str(user.id), user.display_name)
-    c.execute('INSERT INTO penalties (user_id, points, reason) VALUES (?, ?, ?)', (str(user.id), points, reason))
-    conn.commit()
-    total = update_auto_bans(str(user.id), user.display_name)
+    if points <= 0:
+        await interaction.response.send_message("Points must be positive; use /removepoints to take points off.", ephemeral=True); return
+    guild_id = str(interaction.guild.id)
+    settings = await db.settings.get(guild_id)
+    total, active = await db.penalties.add(guild_id, str(user.id), user.display_name, points, reason, settings.ban_thresholds)
+    page_cache.invalidate(("drivers", guild_id))
+    page_cache.invalidate(("history", guild_id, str(user.id)))
     emb = red_black_embed("Penalty Points Added", f"{user.mention} received **{points}** points.\nReason: {reason}")
     emb.add_field(name="Total Points", value=str(total), inline=True)
     # show auto bans active
-    c.execute('SELECT type FROM bans WHERE user_id = ?', (str(user.id),))
-    active = [r[0] for r in c.fetchall()]
     if active:
         emb.add_field(name="Active Bans", value=", ".join(active), inline=False)
     await interaction.response.send_message(embed=emb)
-    await update_live_banlist(interaction.guild)
+    await update_live_lists(interaction.guild)
 
 @tree.command(name="removepoints", description="Remove penalty points from a driver (Steward only)")
 @app_commands.describe(user="Driver", points="Points to remove", reason="Reason")
-async def removepoints(interaction: discord.Interaction, user: discord.Member, points: int, reason: Optional[str] = "Adjustment"):
-    if not is_steward_member(interaction.user):
+async def removepoints(interaction: discord.Interaction, user: app_commands.Transform[DriverRef, DriverArg], points: int, reason: Optional[str] = "Adjustment"):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
-    member_id = str(user.id)
-    c.execute('SELECT id, points FROM penalties WHERE user_id = ? ORDER BY timestamp DESC', (member_id,))
-    rows = c.fetchall()
-    if not rows:
+    if points <= 0:
+        await interaction.response.send_message("Points must be positive.", ephemeral=True); return
+    guild_id, member_id = str(interaction.guild.id), str(user.id)
+    settings = await db.settings.get(guild_id)
+    result = await db.penalties.remove_points(guild_id, member_id, user.display_name, points, reason, settings.ban_thresholds)
+    page_cache.invalidate(("drivers", guild_id))
+    page_cache.invalidate(("history", guild_id, member_id))
+    if result is None:
         await interaction.response.send_message(f"{user.display_name} has no penalty points.", ephemeral=True); return
-    to_remove = points
-    removed = 0
-    for pid, pts in rows:
-        if to_remove <= 0: break
-        if pts <= to_remove:
-            c.execute('DELETE FROM penalties WHERE id = ?', (pid,))
-            removed += pts
-            to_remove -= pts
-        else:
-            new_pts = pts - to_remove
-            c.execute('UPDATE penalties SET points = ? WHERE id = ?', (new_pts, pid))
-            removed += to_remove
-            to_remove = 0
-    conn.commit()
-    total = update_auto_bans(member_id, user.display_name)
+    removed, total = result
     emb = red_black_embed("Penalty Points Removed", f"Removed **{removed}** points from {user.mention}.\nReason: {reason}")
     emb.add_field(name="Total Points Now", value=str(total), inline=True)
     await interaction.response.send_message(embed=emb)
+    await update_live_lists(interaction.guild)
 
 @tree.command(name="penaltypoints_list", description="Show penalty history & total for a driver")
-@app_commands.describe(user="Driver")
-async def penaltypoints_list(interaction: discord.Interaction, user: discord.Member):
-    c.execute('SELECT points, reason, timestamp FROM penalties WHERE user_id = ? ORDER BY timestamp DESC', (str(user.id),))
-    rows = c.fetchall()
-    if not rows:
+@app_commands.describe(user="Driver", season="An archived season to show instead of the current one")
+async def penaltypoints_list(interaction: discord.Interaction, user: app_commands.Transform[DriverRef, DriverArg],
+                             season: Optional[int] = None):
+    guild_id, member_id = str(interaction.guild.id), str(user.id)
+    try:
+        total = await db.penalties.total(guild_id, member_id, season=season)
+    except LookupError as e:
+        await interaction.response.send_message(f"{e}. {await archived_seasons_text(guild_id)}", ephemeral=True); return
+
+    def render(rows, page):
+        lines = [f"{ts} — {pts} pts — {reason[:200]}" for _, pts, reason, ts in rows]
+        title = f"Season {season} Penalties for {user.display_name}" if season else f"Penalties for {user.display_name}"
+        emb = red_black_embed(title, f"Total Points: **{total}**\n\n" + "\n".join(lines))
+        emb.set_footer(text=f"CPG SGN F1 • Page {page}")
+        return emb
+
+    pager = KeysetPager(interaction.user.id, ("history", guild_id, member_id, season),
+                        lambda limit, **cursor: db.penalties.page(guild_id, member_id, limit, season=season, **cursor),
+                        lambda r: (r[0],), render, HISTORY_PER_PAGE)
+    if not await pager.load():
         await interaction.response.send_message(f"{user.display_name} has no penalties.", ephemeral=True); return
-    total = sum(r[0] for r in rows)
-    desc = f"Total Points: **{total}**\n\n"
-    for pts, reason, ts in rows:
-        desc += f"{ts} — {pts} pts — {reason}\n"
-    emb = red_black_embed(f"Penalties for {user.display_name}", desc)
-    await interaction.response.send_message(embed=emb)
+    await pager.send(interaction)
+
+@tree.command(name="penalty_audit", description="Full penalty ledger for a driver, including removals (Steward only)")
+@app_commands.describe(user="Driver")
+async def penalty_audit(interaction: discord.Interaction, user: app_commands.Transform[DriverRef, DriverArg]):
+    if not await is_steward_member(interaction.user):
+        await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    guild_id, member_id = str(interaction.guild.id), str(user.id)
+
+    def render(rows, page):
+        lines = []
+        for pid, pts, balance, reason, ref, ts, offsets in rows:
+            tag = f" [{ref}]" if ref else ""
+            if pts < 0:
+                cancels = ", ".join(f"#{o}" for o in offsets)
+                lines.append(f"`#{pid}` {ts} — **{pts}** → {balance} — {reason[:150]}{tag} (offsets {cancels})")
+            else:
+                lines.append(f"`#{pid}` {ts} — **+{pts}** → {balance} — {reason[:150]}{tag}")
+        emb = red_black_embed(f"Penalty Ledger for {user.display_name}", "\n".join(lines))
+        emb.set_footer(text=f"CPG SGN F1 • Page {page}")
+        return emb
+
+    pager = KeysetPager(interaction.user.id, ("history", guild_id, member_id, "audit"),
+                        lambda limit, **cursor: db.penalties.audit(guild_id, member_id, limit, **cursor),
+                        lambda r: (r[0],), render, HISTORY_PER_PAGE)
+    if not await pager.load():
+        await interaction.response.send_message(f"{user.display_name} has no ledger entries.", ephemeral=True); return
+    await pager.send(interaction)
 
 
 @tree.command(name="ban", description="Manually apply a ban (Steward only)")
 @app_commands.describe(user="Driver", ban_type="race or quali", reason="Reason")
-async def ban(interaction: discord.Interaction, user: discord.Member, ban_type: str, reason: Optional[str] = "No reason provided"):
-    if not is_steward_member(interaction.user):
+@app_commands.choices(ban_type=BAN_TYPE_CHOICES)
+async def ban(interaction: discord.Interaction, user: app_commands.Transform[DriverRef, DriverArg], ban_type: str, reason: Optional[str] = "No reason provided"):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
     btype = ban_type.lower()
     if btype not in ("race", "quali"):
         await interaction.response.send_message("Ban type must be 'race' or 'quali'.", ephemeral=True); return
-    ensure_driver_exists(str(user.id), user.display_name)
-    c.execute('INSERT INTO bans (user_id, type, reason, timestamp) VALUES (?, ?, ?, CURRENT_TIMESTAMP)', (str(user.id), btype, reason))
-    conn.commit()
+    await db.bans.add(str(interaction.guild.id), str(user.id), user.display_name, btype, reason)
+    page_cache.invalidate(("drivers", str(interaction.guild.id)))
     await interaction.response.send_message(embed=red_black_embed(f"{btype.title()} Ban Applied", f"{user.mention} banned — {reason}"))
-    await update_live_banlist(interaction.guild)
+    await update_live_lists(interaction.guild)
 
 @tree.command(name="remove_ban", description="Remove a ban (Steward only)")
 @app_commands.describe(user="Driver", ban_type="race or quali")
-async def remove_ban(interaction: discord.Interaction, user: discord.Member, ban_type: str):
-    if not is_steward_member(interaction.user):
+@app_commands.choices(ban_type=BAN_TYPE_CHOICES)
+async def remove_ban(interaction: discord.Interaction, user: app_commands.Transform[DriverRef, DriverArg], ban_type: str):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
     btype = ban_type.lower()
     if btype not in ("race", "quali"):
         await interaction.response.send_message("Ban type must be 'race' or 'quali'.", ephemeral=True); return
-    c.execute('DELETE FROM bans WHERE user_id = ? AND type = ?', (str(user.id), btype))
-    conn.commit()
+    await db.bans.remove(str(interaction.guild.id), str(user.id), btype)
     await interaction.response.send_message(f"✅ Removed {btype} ban from {user.display_name}", ephemeral=True)
-    await update_live_banlist(interaction.guild)
+    await update_live_lists(interaction.guild)
 
 @tree.command(name="banlist", description="Show active bans")
 async def banlist(interaction: discord.Interaction):
-    cleanup_expired_bans_db()
-    c.execute('SELECT user_id, type, reason, timestamp FROM bans')
-    rows = c.fetchall()
+    rows = await db.bans.active(str(interaction.guild.id))
     if not rows:
         await interaction.response.send_message("No active bans.", ephemeral=True); return
-    emb = red_black_embed("Active Bans", "")
-    for uid, btype, reason, ts in rows:
+    # a message holds at most 10 embeds
+    pages = render_ban_pages(rows, await member_names.for_ban_rows(interaction.guild, rows), "Active Bans")
+    await interaction.response.send_message(embeds=pages[:10])
+
+@tree.command(name="banlist_live", description="Post a ban list that keeps itself up to date (Steward only)")
+@app_commands.describe(channel="Channel to post the live ban list in")
+async def banlist_live(interaction: discord.Interaction, channel: discord.TextChannel):
+    if not await is_steward_member(interaction.user):
+        await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    await interaction.response.send_message(f"✅ Live ban list posted in {channel.mention}.", ephemeral=True)
+    await live_banlist.post(interaction.guild, channel)
+
+@tree.command(name="standings", description="Drivers ranked by penalty points, with distance to a ban")
+@app_commands.describe(season="An archived season to show instead of the current one")
+async def standings(interaction: discord.Interaction, season: Optional[int] = None):
+    guild_id = str(interaction.guild.id)
+    thresholds = (await db.settings.get(guild_id)).ban_thresholds
+    title = f"Season {season} Penalty Standings" if season else "Penalty Standings"
+    pager = KeysetPager(interaction.user.id, ("standings", guild_id, season),
+                        lambda limit, **cursor: db.penalties.standings(guild_id, limit, season=season, **cursor),
+                        lambda r: (r[2], r[0]), lambda rows, page: render_standings(rows, thresholds, page, title),
+                        STANDINGS_PER_PAGE)
+    try:
+        if not await pager.load():
+            await interaction.response.send_message("No driver has penalty points.", ephemeral=True); return
+    except LookupError as e:
+        await interaction.response.send_message(f"{e}. {await archived_seasons_text(guild_id)}", ephemeral=True); return
+    await pager.send(interaction)
+
+@tree.command(name="standings_live", description="Post pinned standings that keep themselves up to date (Steward only)")
+@app_commands.describe(channel="Channel to post the live standings in")
+async def standings_live(interaction: discord.Interaction, channel: discord.TextChannel):
+    if not await is_steward_member(interaction.user):
+        await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    await interaction.response.send_message(f"✅ Live standings posted in {channel.mention}.", ephemeral=True)
+    await live_standings.post(interaction.guild, channel)
+
+# ---------- Race-result penalty import ----------
+IMPORT_MAX_BYTES = 512 * 1024
+IMPORT_MAX_ROWS = 2000
+IMPORT_ERRORS_SHOWN = 15
+
+def parse_penalty_import(data: bytes, filename: str) -> tuple:
+    """Parse a CSV or JSON list of {user_id, points, reason, incident_ref}; return (entries, errors)."""
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        records = json.loads(text)
+        if not isinstance(records, list):
+            raise ValueError("JSON file must hold a list of rows")
+    else:
+        records = []
         try:
-            member = await interaction.guild.fetch_member(int(uid))
-            name = member.display_name
-        except Exception:
-            name = f"User ID {uid}"
-        emb.add_field(name=f"{name} — {btype}", value=f"{reason} ({ts})", inline=False)
-    await interaction.response.send_message(embed=emb)
+            for record in csv.DictReader(io.StringIO(text)):
+                records.append(record)
+        except csv.Error as e:
+            raise csv.Error(f"row {len(records) + 1}: {e}") from None
+    if len(records) > IMPORT_MAX_ROWS:
+        raise ValueError(f"at most {IMPORT_MAX_ROWS} rows per import")
+    entries, errors = [], []
+    for n, record in enumerate(records, start=1):
+        if not isinstance(record, dict):
+            errors.append(f"row {n}: not an object"); continue
+        record = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+        uid = str(record.get("user_id") or "").strip().lstrip("<@!").rstrip(">")
+        reason = str(record.get("reason") or "").strip()
+        ref = str(record.get("incident_ref") or record.get("incident") or "").strip() or None
+        try:
+            points = int(str(record.get("points")).strip())
+        except ValueError:
+            errors.append(f"row {n}: points must be a whole number"); continue
+        if points <= 0:
+            # as /penaltypoints: points are only taken away with /removepoints, which clamps at zero
+            errors.append(f"row {n}: points must be positive"); continue
+        if not uid.isdigit():
+            errors.append(f"row {n}: user_id must be a Discord user id"); continue
+        if not reason:
+            errors.append(f"row {n}: reason is required"); continue
+        entries.append((uid, points, reason[:500], ref))
+    return entries, errors
+
+@tree.command(name="penalties_import", description="Apply a race's penalties from a CSV/JSON file (Steward only)")
+@app_commands.describe(file="CSV or JSON with user_id, points, reason, incident_ref columns",
+                       dry_run="Preview totals and bans without saving anything")
+async def penalties_import(interaction: discord.Interaction, file: discord.Attachment, dry_run: bool = False):
+    if not await is_steward_member(interaction.user):
+        await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    if file.size > IMPORT_MAX_BYTES:
+        await interaction.response.send_message(f"File too large (max {IMPORT_MAX_BYTES // 1024} KB).", ephemeral=True); return
+    await interaction.response.defer(thinking=True)
+    try:
+        entries, errors = parse_penalty_import(await file.read(), file.filename)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        await interaction.followup.send(f"Could not read {file.filename}: {e}"); return
+
+    guild, guild_id = interaction.guild, str(interaction.guild.id)
+    index = db.drivers.index(guild_id)
+    names = {}
+    for uid, *_ in entries:
+        if uid in names:
+            continue
+        member = guild.get_member(int(uid))
+        name = member.display_name if member else index.name(uid)
+        if name is None:
+            errors.append(f"<@{uid}> is not a registered driver or member")
+        names[uid] = name
+    if not entries and not errors:
+        errors.append("the file has no rows")
+    if errors:
+        shown = "\n".join(errors[:IMPORT_ERRORS_SHOWN])
+        more = f"\n…and {len(errors) - IMPORT_ERRORS_SHOWN} more" if len(errors) > IMPORT_ERRORS_SHOWN else ""
+        await interaction.followup.send(embed=red_black_embed("Import Rejected", f"Nothing was applied.\n\n{shown}{more}")); return
+
+    settings = await db.settings.get(guild_id)
+    outcome = await db.penalties.add_many(guild_id, entries, names, settings.ban_thresholds, dry_run=dry_run)
+    lines = []
+    for uid, (old, new, banned) in sorted(outcome.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{names[uid]}: {old} → **{new}**" + (f" — new {', '.join(banned)} ban" if banned else ""))
+    summary = f"{len(entries)} penalties, {sum(p for _, p, _, _ in entries)} points across {len(outcome)} drivers."
+    emb = red_black_embed("Penalty Import (dry run)" if dry_run else "Penalty Import Applied", summary)
+    emb.add_field(name="Totals", value=field_list(lines), inline=False)
+    new_bans = sum(len(banned) for _, _, banned in outcome.values())
+    emb.add_field(name="New Bans", value=str(new_bans), inline=True)
+    await interaction.followup.send(embed=emb)
+    if not dry_run:
+        page_cache.invalidate(("drivers", guild_id))
+        for uid in outcome:
+            page_cache.invalidate(("history", guild_id, uid))
+        await update_live_lists(guild)
 
 # ---------- Attendance: create embeds that update live ----------
 @tree.command(name="attendance_create", description="Create an attendance embed with live buttons (Steward only)")
 @app_commands.describe(channel="Channel to post in", title="Embed title", description="Embed description")
 async def attendance_create(interaction: discord.Interaction, channel: discord.TextChannel, title: Optional[str] = "Race Attendance", description: Optional[str] = "Click below to mark attendance."):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    await interaction.response.defer(ephemeral=True, thinking=True)
     emb = red_black_embed(title, description)
-    view = AttendanceView(msg_id=None)  # we don’t have msg.id yet
-    msg = await channel.send(content="@everyone", embed=emb, view=view)  # send once
-    view.msg_id = msg.id  # now attach the message id to the view
-    view = AttendanceView(msg.id)
-    await msg.edit(embed=emb, view=view)
-    await interaction.response.send_message(f"✅ Attendance embed posted in {channel.mention}.", ephemeral=True)
+    try:
+        msg = await outbox.submit(channel.id, lambda: channel.send(content="@everyone", embed=emb), HIGH,
+                                  label="attendance post")
+        # buttons encode the message id, so they can only be attached once it exists
+        await outbox.submit(channel.id, lambda: msg.edit(view=attendance_view(msg.id)), HIGH, label="attendance buttons")
+    except discord.HTTPException:
+        await interaction.followup.send(f"Could not post in {channel.mention}.", ephemeral=True); return
+    await db.persistent.add(msg.id, interaction.guild.id, channel.id, "attendance", {"title": title})
+    await interaction.followup.send(f"✅ Attendance embed posted in {channel.mention}.", ephemeral=True)
 
 # ---------- Ticket setup: customizable embed ----------
 class TicketModal(discord.ui.Modal, title="Ticket Button Message"):
@@ -515,16 +1086,24 @@ class TicketModal(discord.ui.Modal, title="Ticket Button Message"):
         super().__init__()
         self.target_channel = target_channel
 
+    @instrumented("modal:ticket_panel")
     async def on_submit(self, interaction: discord.Interaction):
         emb = red_black_embed(self.title_field.value, self.desc_field.value)
         view = TicketView(interaction.guild.id, create_msg_title=self.title_field.value, create_msg_desc=self.desc_field.value or "Create a ticket")
-        await self.target_channel.send(embed=emb, view=view)
-        await interaction.response.send_message(f"Ticket message posted in {self.target_channel.mention}", ephemeral=True)
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        channel = self.target_channel
+        try:
+            msg = await outbox.submit(channel.id, lambda: channel.send(embed=emb, view=view), HIGH, label="ticket panel")
+        except discord.HTTPException:
+            await interaction.followup.send(f"Could not post in {channel.mention}.", ephemeral=True); return
+        await db.persistent.add(msg.id, interaction.guild.id, channel.id, "ticket_panel",
+                                {"title": view.create_msg_title, "description": view.create_msg_desc})
+        await interaction.followup.send(f"Ticket message posted in {channel.mention}", ephemeral=True)
 
 @tree.command(name="ticket_setup", description="Set up ticket creation button (Steward only)")
 @app_commands.describe(channel="Channel to post ticket button in")
 async def ticket_setup(interaction: discord.Interaction, channel: discord.TextChannel):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
     modal = TicketModal(channel)
     await interaction.response.send_modal(modal)
@@ -532,25 +1111,81 @@ async def ticket_setup(interaction: discord.Interaction, channel: discord.TextCh
 @tree.command(name="ticket_close", description="Close this ticket (use inside ticket channel)")
 async def ticket_close(interaction: discord.Interaction):
     chan = interaction.channel
-    c.execute('SELECT id, owner_id FROM tickets WHERE channel_id = ?', (str(chan.id),))
-    r = c.fetchone()
+    guild_id = str(interaction.guild.id)
+    r = await db.tickets.by_channel(guild_id, str(chan.id))
     if not r:
         await interaction.response.send_message("This channel is not a ticket.", ephemeral=True); return
+    if chan.id in closing_tickets:
+        await interaction.response.send_message("This ticket is already being closed.", ephemeral=True); return
     ticket_id, owner_id = r
-    c.execute('UPDATE tickets SET closed_at = ? WHERE id = ?', (datetime.datetime.now(), ticket_id))
-    conn.commit()
-    # Attempt to delete channel
+    await interaction.response.send_message("Closing ticket — the transcript is archived first.", ephemeral=True)
+    task = asyncio.create_task(archive_ticket(chan, ticket_id, owner_id, interaction.user))
+    closing_tickets[chan.id] = task
+    task.add_done_callback(lambda _: closing_tickets.pop(chan.id, None))
+
+# ---------- Ticket transcripts ----------
+TRANSCRIPT_DIR = os.environ.get("TRANSCRIPT_DIR", "transcripts")
+TRANSCRIPT_PROGRESS_EVERY = 1000  # messages between progress edits
+
+closing_tickets = {}  # ticket channel id -> archive task
+
+async def archive_ticket(channel: discord.TextChannel, ticket_id: int, owner_id: str, closed_by: discord.abc.User):
+    """Stream the channel into a transcript, post it to the ticket log, then close the ticket and delete the channel."""
+    guild, guild_id = channel.guild, str(channel.guild.id)
+    folder = os.path.join(TRANSCRIPT_DIR, guild_id)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"ticket-{ticket_id}-{channel.id}.jsonl.gz")
+    status = await outbox.submit(channel.id, lambda: channel.send("🗄️ Archiving transcript…"), HIGH, label="archive status")
+    reported = 0
+
+    def set_status(content, priority=LOW):
+        return outbox.submit(channel.id, lambda: status.edit(content=content), priority,
+                             key=("edit", status.id), label="archive status")
+
+    async def progress(count):
+        nonlocal reported
+        if count - reported >= TRANSCRIPT_PROGRESS_EVERY:
+            reported = count
+            set_status(f"🗄️ Archiving transcript… {count} messages")  # not awaited; reading history goes on
+
+    try:
+        count = await write_transcript(channel.history(limit=None, oldest_first=True), path, progress)
+    except Exception as e:
+        print(f"Transcript for ticket {ticket_id} failed:", e)
+        set_status("⚠️ Archiving the transcript failed, so the channel was kept. Run /ticket_close to retry.", HIGH)
+        return
+    size = os.path.getsize(path)
+
+    log_message_id = None
+    settings = await db.settings.get(guild_id)
+    log_channel = guild.get_channel(settings.ticket_log_channel_id) if settings.ticket_log_channel_id else None
+    if log_channel:
+        summary = f"🎫 Ticket #{ticket_id} ({channel.name}) from <@{owner_id}> closed by {closed_by.mention} — {count} messages"
+        try:
+            if size <= guild.filesize_limit:
+                # a fresh File per attempt, since a retried upload must re-read the file
+                send = lambda: log_channel.send(summary, file=discord.File(path, filename=os.path.basename(path)))
+            else:
+                send = lambda: log_channel.send(f"{summary}\nTranscript is {size // 1024} KB, over the upload limit; kept on the bot host.")
+            msg = await outbox.submit(log_channel.id, send, NORMAL, label="transcript upload")
+            log_message_id = msg.id
+        except discord.HTTPException as e:
+            print(f"Posting transcript for ticket {ticket_id} failed:", e)
+    await db.tickets.add_transcript(guild_id, ticket_id, channel.id, path, count, size, log_message_id)
+    await db.tickets.close(guild_id, ticket_id)
     try:
-        await chan.delete(reason=f"Ticket closed by {interaction.user}")
-    except Exception:
-        await interaction.response.send_message("Could not delete, please remove manually.", ephemeral=True)
+        await channel.delete(reason=f"Ticket closed by {closed_by}")
+    except discord.HTTPException:
+        set_status("Transcript saved. Could not delete this channel, please remove it manually.", HIGH)
 
 # ---------- Welcome / Goodbye setup ----------
+PLACEHOLDER_HINT = "Placeholders: " + " ".join(f"{{{p}}}" for p in PLACEHOLDERS)
+
 class WelcomeModal(discord.ui.Modal, title="Set Welcome Message"):
     message_input = discord.ui.TextInput(
         label="Welcome message",
         style=discord.TextStyle.long,
-        placeholder="Use {user} for mention",
+        placeholder=PLACEHOLDER_HINT,
         required=True,
         max_length=500
     )
@@ -559,23 +1194,21 @@ class WelcomeModal(discord.ui.Modal, title="Set Welcome Message"):
         super().__init__()
         self.channel = channel
 
+    @instrumented("modal:welcome")
     async def on_submit(self, interaction: discord.Interaction):
         guild_id = str(interaction.guild.id)
         # Store in DB
-        c.execute('INSERT OR IGNORE INTO settings (guild_id) VALUES (?)', (guild_id,))
-        c.execute('UPDATE settings SET welcome_channel_id = ?, welcome_message = ? WHERE guild_id = ?',
-                  (str(self.channel.id), self.message_input.value, guild_id))
-        conn.commit()
+        await db.settings.update(guild_id, welcome_channel_id=self.channel.id, welcome_message=self.message_input.value)
         # Send a preview embed
-        text = self.message_input.value.replace("{user}", interaction.user.mention)
+        text = greeting_text("welcome", self.message_input.value, [interaction.user])
         emb = red_black_embed("Welcome Message Preview", text)
-        await self.channel.send(embed=emb)
         await interaction.response.send_message(f"✅ Welcome message set and preview sent in {self.channel.mention}", ephemeral=True)
+        outbox.submit(self.channel.id, lambda: self.channel.send(embed=emb), NORMAL, label="welcome preview")
 
 @tree.command(name="welcome_setup", description="Set the channel and message for welcome messages (Steward only)")
 @app_commands.describe(channel="Channel to send welcome messages")
 async def welcome_setup(interaction: discord.Interaction, channel: discord.TextChannel):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True)
         return
     modal = WelcomeModal(channel)
@@ -586,7 +1219,7 @@ class GoodbyeModal(discord.ui.Modal, title="Set Goodbye Message"):
     message_input = discord.ui.TextInput(
         label="Goodbye message",
         style=discord.TextStyle.long,
-        placeholder="Use {user} for name",
+        placeholder=PLACEHOLDER_HINT,
         required=True,
         max_length=500
     )
@@ -595,22 +1228,20 @@ class GoodbyeModal(discord.ui.Modal, title="Set Goodbye Message"):
         super().__init__()
         self.channel = channel
 
+    @instrumented("modal:goodbye")
     async def on_submit(self, interaction: discord.Interaction):
         guild_id = str(interaction.guild.id)
-        c.execute('INSERT OR IGNORE INTO settings (guild_id) VALUES (?)', (guild_id,))
-        c.execute('UPDATE settings SET goodbye_channel_id = ?, goodbye_message = ? WHERE guild_id = ?',
-                  (str(self.channel.id), self.message_input.value, guild_id))
-        conn.commit()
+        await db.settings.update(guild_id, goodbye_channel_id=self.channel.id, goodbye_message=self.message_input.value)
         # Send a preview
-        text = self.message_input.value.replace("{user}", interaction.user.mention)
+        text = greeting_text("goodbye", self.message_input.value, [interaction.user])
         emb = red_black_embed("Goodbye Message Preview", text)
-        await self.channel.send(embed=emb)
         await interaction.response.send_message(f"✅ Goodbye message set and preview sent in {self.channel.mention}", ephemeral=True)
+        outbox.submit(self.channel.id, lambda: self.channel.send(embed=emb), NORMAL, label="goodbye preview")
 
 @tree.command(name="goodbye_setup", description="Set the channel and message for goodbye messages (Steward only)")
 @app_commands.describe(channel="Channel to send goodbye messages")
 async def goodbye_setup(interaction: discord.Interaction, channel: discord.TextChannel):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True)
         return
     modal = GoodbyeModal(channel)
@@ -620,95 +1251,360 @@ async def goodbye_setup(interaction: discord.Interaction, channel: discord.TextC
 @tree.command(name="welcome_edit", description="Edit the welcome message")
 @app_commands.describe(message="The new welcome message")
 async def welcome_edit(interaction: discord.Interaction, message: str):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True)
         return
     guild_id = str(interaction.guild.id)
-    c.execute('INSERT OR IGNORE INTO settings (guild_id) VALUES (?)', (guild_id,))
-    c.execute('UPDATE settings SET welcome_message = ? WHERE guild_id = ?', (message, guild_id))
-    conn.commit()
-    await interaction.response.send_message(f"✅ Welcome message updated. Preview:\n{message}", ephemeral=True)
+    await db.settings.update(guild_id, welcome_message=message)
+    preview = greeting_text("welcome", message, [interaction.user])
+    await interaction.response.send_message(f"✅ Welcome message updated. Preview:\n{preview}", ephemeral=True)
 
 @tree.command(name="goodbye_edit", description="Edit the goodbye message")
 @app_commands.describe(message="The new goodbye message")
 async def goodbye_edit(interaction: discord.Interaction, message: str):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True)
         return
     guild_id = str(interaction.guild.id)
-    c.execute('INSERT OR IGNORE INTO settings (guild_id) VALUES (?)', (guild_id,))
-    c.execute('UPDATE settings SET goodbye_message = ? WHERE guild_id = ?', (message, guild_id))
-    conn.commit()
-    await interaction.response.send_message(f"✅ Goodbye message updated. Preview:\n{message}", ephemeral=True)
+    await db.settings.update(guild_id, goodbye_message=message)
+    preview = greeting_text("goodbye", message, [interaction.user])
+    await interaction.response.send_message(f"✅ Goodbye message updated. Preview:\n{preview}", ephemeral=True)
 
 
 # ---------- Edit welcome/goodbye messages ----------
 @tree.command(name="welcome_message", description="Set or edit the welcome message (Steward only)")
-@app_commands.describe(message="Message text (use {user} for mention)")
+@app_commands.describe(message=f"Message text. {PLACEHOLDER_HINT}")
 async def welcome_message(interaction: discord.Interaction, message: str):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True)
         return
     guild_id = str(interaction.guild.id)
-    c.execute('INSERT OR IGNORE INTO settings (guild_id) VALUES (?)', (guild_id,))
-    c.execute('UPDATE settings SET welcome_message = ? WHERE guild_id = ?', (message, guild_id))
-    conn.commit()
+    await db.settings.update(guild_id, welcome_message=message)
     await interaction.response.send_message(f"✅ Welcome message updated.", ephemeral=True)
 
 
 @tree.command(name="goodbye_message", description="Set or edit the goodbye message (Steward only)")
-@app_commands.describe(message="Message text (use {user} for name)")
+@app_commands.describe(message=f"Message text. {PLACEHOLDER_HINT}")
 async def goodbye_message(interaction: discord.Interaction, message: str):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True)
         return
     guild_id = str(interaction.guild.id)
-    c.execute('INSERT OR IGNORE INTO settings (guild_id) VALUES (?)', (guild_id,))
-    c.execute('UPDATE settings SET goodbye_message = ? WHERE guild_id = ?', (message, guild_id))
-    conn.commit()
+    await db.settings.update(guild_id, goodbye_message=message)
     await interaction.response.send_message(f"✅ Goodbye message updated.", ephemeral=True)
 
 
-# ---------- Settings: steward role name, ticket log ----------
-@tree.command(name="setsystem", description="Set steward role name or ticket log channel (Steward only)")
-@app_commands.describe(kind="welcome/goodbye/ticketlog/stewardrole", channel="channel if applicable", value="role name if setting stewardrole")
+# ---------- Settings: steward role name, ticket log, ban thresholds ----------
+@tree.command(name="setsystem", description="Set steward role name, ticket log channel or auto-ban thresholds (Steward only)")
+@app_commands.describe(kind="ticketlog/stewardrole/qualiban/raceban", channel="channel if applicable", value="role name for stewardrole, points for qualiban/raceban")
 async def setsystem(interaction: discord.Interaction, kind: str, channel: Optional[discord.TextChannel] = None, value: Optional[str] = None):
-    if not is_steward_member(interaction.user):
+    if not await is_steward_member(interaction.user):
         await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
     kind = kind.lower()
     guild_id = str(interaction.guild.id)
-    c.execute('INSERT OR IGNORE INTO settings (guild_id) VALUES (?)', (guild_id,))
     if kind == "ticketlog":
         if not channel:
             await interaction.response.send_message("Provide a channel.", ephemeral=True); return
-        c.execute('UPDATE settings SET ticket_log_channel_id = ? WHERE guild_id = ?', (str(channel.id), guild_id))
-        conn.commit()
+        await db.settings.update(guild_id, ticket_log_channel_id=channel.id)
         await interaction.response.send_message(f"Ticket log set to {channel.mention}", ephemeral=True)
     elif kind == "stewardrole":
         if not value:
             await interaction.response.send_message("Provide a role name in value.", ephemeral=True); return
-        c.execute('UPDATE settings SET steward_role_name = ? WHERE guild_id = ?', (value, guild_id))
-        conn.commit()
+        await db.settings.update(guild_id, steward_role_name=value)
         await interaction.response.send_message(f"Steward role set to `{value}`", ephemeral=True)
+    elif kind in ("qualiban", "raceban"):
+        if not value or not value.isdigit() or int(value) <= 0:
+            await interaction.response.send_message("Provide a positive number of points in value.", ephemeral=True); return
+        btype = kind[:-3]
+        await db.settings.update(guild_id, **{f"{btype}_ban_points": int(value)})
+        await interaction.response.send_message(f"Automatic {btype} ban now applies at {value}+ points", ephemeral=True)
+        await update_live_lists(interaction.guild)  # distances to the thresholds changed
     else:
-        await interaction.response.send_message("Valid kinds: ticketlog, stewardrole", ephemeral=True)
+        await interaction.response.send_message("Valid kinds: ticketlog, stewardrole, qualiban, raceban", ephemeral=True)
 
-# ---------- Background task ----------
-@tasks.loop(hours=24)
-async def daily_tasks():
-    cleanup_expired_bans_db()
+@tree.command(name="outbox_stats", description="Show the outbound message queue (Steward only)")
+async def outbox_stats(interaction: discord.Interaction):
+    if not await is_steward_member(interaction.user):
+        await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    s = outbox.stats()
+    await interaction.response.send_message(
+        f"Queued: {s['depth']} in {s['channels']} channels — lag p50 {s['lag_p50']:.2f}s, max {s['lag_max']:.2f}s\n"
+        f"Sent {s['sent']}, failed {s['failed']}, retried {s['retried']}, superseded edits {s['superseded']}", ephemeral=True)
 
-# ---------- On ready: sync slash commands ----------
-@bot.event
-async def on_ready():
+PERF_COMMANDS_SHOWN = 15
+
+@tree.command(name="perf", description="Show interaction latency per command (Steward only)")
+async def perf(interaction: discord.Interaction):
+    if not await is_steward_member(interaction.user):
+        await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    hist = metrics.interaction_seconds
+    commands_seen = sorted({command for command, part in hist.series if part == "wall"},
+                           key=lambda c: -hist.quantiles(c, "wall")[0.95])
+    if not commands_seen:
+        await interaction.response.send_message("No interactions timed yet.", ephemeral=True); return
+    lines = []
+    for command in commands_seen[:PERF_COMMANDS_SHOWN]:
+        wall = hist.quantiles(command, "wall")
+        p95 = {part: hist.quantiles(command, part)[0.95] for part in ("db", "rest", "render")}
+        count = hist.series[(command, "wall")][1]
+        lines.append(f"`{command}` ×{count} — p50 {wall[0.5] * 1000:.0f} / p95 {wall[0.95] * 1000:.0f} / "
+                     f"p99 {wall[0.99] * 1000:.0f} ms (p95 db {p95['db'] * 1000:.0f}, rest {p95['rest'] * 1000:.0f}, "
+                     f"render {p95['render'] * 1000:.0f})")
+    slow = sum(metrics.slow_interactions_total.values.values())
+    emb = red_black_embed("Interaction latency", "\n".join(lines))
+    emb.set_footer(text=f"Slowest p95 first · {slow} slow interactions logged · full series at /metrics")
+    await interaction.response.send_message(embed=emb, ephemeral=True)
+
+# ---------- Seasons ----------
+SEASON_KEEP_ATTENDANCE_DAYS = 7  # attendance posts this recent stay live for the new season
+
+async def archived_seasons_text(guild_id: str) -> str:
+    seasons = await db.seasons.archived(guild_id)
+    if not seasons:
+        return "No seasons have been archived yet."
+    return "Archived seasons: " + ", ".join(str(season) for season, _, _ in seasons) + "."
+
+@tree.command(name="season_rollover", description="Archive the current season and reset all penalty points (Steward only)")
+@app_commands.describe(confirm="Set to True to archive the season; this cannot be undone from Discord")
+async def season_rollover(interaction: discord.Interaction, confirm: bool = False):
+    if not await is_steward_member(interaction.user):
+        await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    guild, guild_id = interaction.guild, str(interaction.guild.id)
+    if not confirm:
+        current = await db.seasons.current(guild_id)
+        await interaction.response.send_message(
+            f"This archives season {current}: every driver's points reset to 0, and penalties, lifted bans, closed "
+            f"tickets and older attendance move to the season archive. Run again with `confirm: True` to proceed.",
+            ephemeral=True); return
+    await interaction.response.defer(thinking=True)
+    await attendance.flush_writes()  # clicks still queued belong to the season being archived
     try:
-        synced = await tree.sync()
-        print(f"Synced {len(synced)} commands.")
+        season, moved = await db.seasons.rollover(guild_id, SEASON_KEEP_ATTENDANCE_DAYS)
+    except Exception as e:
+        print(f"Season rollover for {guild_id} failed:", e)
+        await interaction.followup.send("⚠️ The rollover failed and nothing was archived."); return
+    attendance.forget(guild_id)
+    page_cache.invalidate(("standings", guild_id))
+    page_cache.invalidate(("history", guild_id))
+    emb = red_black_embed(f"Season {season} Archived", f"Season {season + 1} starts now; all penalty points are reset.")
+    emb.add_field(name="Archived", value="\n".join(f"{table}: {rows}" for table, rows in moved.items()), inline=False)
+    emb.set_footer(text=f"Browse it with /standings season:{season} or /penaltypoints_list season:{season}")
+    await interaction.followup.send(embed=emb)
+    await update_live_lists(guild)
+    try:
+        await db.seasons.compact(guild_id)
+    except Exception as e:
+        print(f"Compacting the database after the season {season} rollover failed:", e)
+
+@tree.command(name="seasons", description="List archived seasons")
+async def seasons(interaction: discord.Interaction):
+    guild_id = str(interaction.guild.id)
+    archived = await db.seasons.archived(guild_id)
+    lines = [f"**Season {season}** — ended {ended} · {summary.get('penalties', 0)} penalties across "
+             f"{summary.get('driver_totals', 0)} drivers" for season, ended, summary in archived]
+    lines.append(f"**Season {archived[-1][0] + 1 if archived else 1}** — current")
+    await interaction.response.send_message(embed=red_black_embed("Seasons", "\n".join(lines)), ephemeral=True)
+
+# ---------- League export ----------
+EXPORT_FORMAT_CHOICES = [app_commands.Choice(name="JSON lines", value="jsonl"), app_commands.Choice(name="CSV", value="csv")]
+EXPORT_FILES_PER_MESSAGE = 10  # Discord's attachment limit per message
+
+@tree.command(name="export", description="Download this league's data as gzip-compressed files (Steward only)")
+@app_commands.describe(format="JSON lines (default) or CSV")
+@app_commands.choices(format=EXPORT_FORMAT_CHOICES)
+async def export_league(interaction: discord.Interaction, format: str = "jsonl"):
+    if not await is_steward_member(interaction.user):
+        await interaction.response.send_message("🚫 Steward only.", ephemeral=True); return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    guild, guild_id = interaction.guild, str(interaction.guild.id)
+    folder = tempfile.mkdtemp(prefix=f"export-{guild_id}-")
+    try:
+        # parts are cut at the guild's upload limit, then packed up to 10 files per message
+        manifest = await write_archive(db, guild_id, folder, format, guild.filesize_limit)
+        counts = ", ".join(f"{entry['rows']} {table}" for table, entry in manifest["tables"].items())
+        files = archive_files(folder, manifest)
+        messages, batch, size = [], [], 0
+        for path in files:
+            part = os.path.getsize(path)
+            if batch and (len(batch) == EXPORT_FILES_PER_MESSAGE or size + part > guild.filesize_limit):
+                messages.append(batch)
+                batch, size = [], 0
+            batch.append(path)
+            size += part
+        messages.append(batch)
+        for n, batch in enumerate(messages, start=1):
+            content = (f"📦 League export ({format}): {counts}. Load it on another host with "
+                       f"`python export.py import <folder>`." if n == 1 else "")
+            await interaction.followup.send(f"{content}\nFiles {n}/{len(messages)}".strip(), ephemeral=True,
+                                            files=[discord.File(path, filename=os.path.basename(path)) for path in batch])
+    except discord.HTTPException as e:
+        print(f"Export for {guild_id} failed to upload:", e)
+        await interaction.followup.send("⚠️ Uploading the export failed.", ephemeral=True)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------- Ban expiry ----------
+class BanExpiryScheduler:
+    """Min-heap of ban expiry times; sleeps until the earliest one, then expires bans in one DELETE."""
+
+    def __init__(self):
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def push(self, expires_at: int):
+        heapq.heappush(self._heap, expires_at)
+        if self._heap[0] == expires_at:
+            self._wakeup.set()  # new earliest deadline, re-arm the sleep
+
+    async def start(self):
+        if self._task is not None:
+            return
+        for expires_at in await db.bans.expiries():
+            heapq.heappush(self._heap, expires_at)
+        db.bans.listeners.append(self.push)
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            now = time.time()
+            while self._heap and self._heap[0] <= now:
+                heapq.heappop(self._heap)
+            try:
+                expired = await db.bans.expire(now)
+            except Exception as e:
+                print("Ban expiry error:", e)
+                self.push(int(now) + 60)  # retry shortly
+                continue
+            for guild_id in set(expired):
+                guild = bot.get_guild(int(guild_id)) if guild_id.isdigit() else None
+                if guild:
+                    await update_live_lists(guild)
+
+ban_expiry = BanExpiryScheduler()
+
+# ---------- Persistent views ----------
+def register_persistent_views():
+    bot.add_dynamic_items(AttendanceButton)
+    # single shared instances for posts that predate the message index
+    bot.add_view(AttendanceView())
+    # owns every ticket panel's button: create_ticket only needs interaction.guild, so the
+    # panels indexed in persistent_messages need no per-message views of their own
+    bot.add_view(TicketView())
+
+# ---------- Slash command sync ----------
+def command_tree_hash(guild: Optional[discord.abc.Snowflake] = None) -> str:
+    """Stable hash of the command payloads Discord would receive for this scope."""
+    payload = sorted((cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)),
+                     key=lambda d: (d.get("type", 1), d["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands_if_changed():
+    guild = discord.Object(int(DEV_GUILD_ID)) if DEV_GUILD_ID else None
+    if guild:
+        tree.copy_global_to(guild=guild)
+    key = f"command_hash:{guild.id if guild else 'global'}"
+    digest = command_tree_hash(guild)
+    if not FORCE_COMMAND_SYNC and await db.state.get(key) == digest:
+        print(f"Slash commands unchanged; skipped sync ({time.perf_counter() - STARTED_AT:.2f}s since start).")
+        return
+    try:
+        started = time.perf_counter()
+        synced = await tree.sync(guild=guild)
+        await db.state.set(key, digest)
+        print(f"Synced {len(synced)} commands {'to guild ' + DEV_GUILD_ID if guild else 'globally'} "
+              f"in {time.perf_counter() - started:.2f}s.")
     except Exception as e:
         print("Sync error:", e)
-    print(f"{bot.user} — online.")
-    if not daily_tasks.is_running():
-        daily_tasks.start()
+
+# ---------- On ready ----------
+_ready_once = False
+
+@bot.event
+async def on_ready():
+    global _ready_once
+    if _ready_once:
+        print(f"{bot.user} — reconnected.")
+        return
+    _ready_once = True
+    print(f"{bot.user} — online, {time.perf_counter() - STARTED_AT:.2f}s after start.")
+    await ban_expiry.start()
+
+# ---------- Health & metrics ----------
+GATEWAY_GRACE = 120.0  # seconds the gateway may be down (e.g. reconnecting) before /healthz fails
+
+gateway_down_since = time.monotonic()  # None while connected
+
+@bot.event
+async def on_connect():
+    global gateway_down_since
+    gateway_down_since = None
+
+@bot.event
+async def on_resumed():
+    global gateway_down_since
+    gateway_down_since = None
+
+@bot.event
+async def on_disconnect():
+    global gateway_down_since
+    if gateway_down_since is None:
+        gateway_down_since = time.monotonic()
+
+async def check_gateway():
+    latency = f"{bot.latency * 1000:.0f}ms" if bot.latency != float("inf") else "no heartbeat yet"
+    if gateway_down_since is None:
+        return True, f"connected, heartbeat {latency}"
+    down = time.monotonic() - gateway_down_since
+    return down < GATEWAY_GRACE, f"disconnected for {down:.0f}s"
+
+async def check_db():
+    await db.run(lambda conn: conn.execute("SELECT 1").fetchone())
+    return True, "reachable"
+
+async def check_ready():
+    return bot.is_ready() and gateway_down_since is None, "guilds loaded" if bot.is_ready() else "starting"
+
+def register_metrics(registry: metrics.Registry):
+    g = registry.gauge
+    g("bot_uptime_seconds", "Seconds since the process started.", lambda: time.perf_counter() - STARTED_AT)
+    g("discord_gateway_connected", "1 while the gateway connection is up.", lambda: gateway_down_since is None)
+    g("discord_gateway_latency_seconds", "Latest heartbeat round trip.", lambda: bot.latency)
+    g("discord_guilds", "Guilds the bot is in.", lambda: len(bot.guilds))
+    g("outbox_queue_depth", "Outbound calls waiting to be sent.", lambda: outbox.depth)
+    g("outbox_lag_seconds", "Wait from submit to first attempt over recent calls.",
+      lambda: {("0.5",): outbox.stats()["lag_p50"], ("1",): outbox.stats()["lag_max"]}, ("quantile",))
+    g("outbox_calls_total", "Outbound calls by outcome.",
+      lambda: {(r,): getattr(outbox, r) for r in ("sent", "failed", "retried", "superseded")}, ("result",), "counter")
+    g("attendance_commits_total", "Grouped attendance write commits.", lambda: attendance.commits, kind="counter")
+    g("attendance_embed_edits_total", "Attendance embed edits sent.", lambda: attendance.edits, kind="counter")
+    g("greetings_messages_total", "Welcome/goodbye messages sent.", lambda: greeter.sent, kind="counter")
+    g("greetings_digests_total", "Welcome/goodbye digests sent during raids.", lambda: greeter.digests, kind="counter")
+    g("settings_cache_requests_total", "Guild settings lookups.",
+      lambda: {("hit",): db.settings.hits, ("miss",): db.settings.misses}, ("result",), "counter")
+    g("tickets_archiving", "Ticket transcripts being archived.", lambda: len(closing_tickets))
+
+register_metrics(metrics.registry)
+health = HealthServer({"gateway": check_gateway, "db": check_db}, {"gateway": check_ready, "db": check_db},
+                      metrics.registry.render, port=HEALTH_PORT)
 
 # ---------- Run ----------
-bot.run(TOKEN)
+def main():
+    if not TOKEN:
+        raise RuntimeError("Missing TOKEN environment variable!")
+    db.migrate()
+    bot.run(TOKEN)
+
+if __name__ == "__main__":
+    main()
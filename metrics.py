@@ -0,0 +1,252 @@
+# metrics.py
+"""In-process metrics registry and per-interaction timing.
+
+An interaction's wall time is split into the time its own task spent waiting on
+the database, on Discord REST calls and on rendering; the rest ("other") is
+queueing and awaits on background work. Timings travel in a context variable,
+so DB and REST time is charged to whichever interaction awaited it.
+"""
+import json
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+import aiohttp
+
+PARTS = ("db", "rest", "render")
+WINDOW = 1000           # most recent observations kept per histogram series
+QUANTILES = (0.5, 0.95, 0.99)
+ACK_DEADLINE = 3.0      # seconds Discord allows before an interaction must be acknowledged
+SLOW_AFTER = 2.0        # log interactions not acknowledged within this many seconds
+
+
+# ----- registry -----
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> list:
+        return [("", tuple(zip(self.labels, lv)), v) for lv, v in self.values.items()]
+
+
+class Histogram:
+    """Rolling quantiles over the last ``window`` observations per label set, exported as a summary."""
+
+    kind = "summary"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), window: int = WINDOW):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.window = window
+        self.series = {}  # label values -> [deque of recent values, total count, total sum]
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [deque(maxlen=self.window), 0, 0.0]
+        series[0].append(value)
+        series[1] += 1
+        series[2] += value
+
+    def quantiles(self, *label_values) -> dict:
+        series = self.series.get(label_values)
+        ordered = sorted(series[0]) if series else []
+        return {q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0 for q in QUANTILES}
+
+    def samples(self) -> list:
+        out = []
+        for lv, (_, count, total) in self.series.items():
+            labels = tuple(zip(self.labels, lv))
+            for q, v in self.quantiles(*lv).items():
+                out.append(("", labels + (("quantile", str(q)),), v))
+            out.append(("_sum", labels, total))
+            out.append(("_count", labels, count))
+        return out
+
+
+class Gauge:
+    """Read from ``fn()`` at scrape time; fn returns a number or {label values: number}.
+    ``kind="counter"`` exports a running total kept elsewhere (e.g. Outbox.sent)."""
+
+    def __init__(self, name: str, help_text: str, fn: Callable, labels: tuple = (), kind: str = "gauge"):
+        self.name, self.help, self.labels, self.fn, self.kind = name, help_text, labels, fn, kind
+
+    def samples(self) -> list:
+        value = self.fn()
+        if isinstance(value, dict):
+            return [("", tuple(zip(self.labels, lv)), v) for lv, v in value.items()]
+        return [("", (), value)]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = ()) -> Histogram:
+        return self._add(Histogram(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, fn: Callable, labels: tuple = (), kind: str = "gauge") -> Gauge:
+        return self._add(Gauge(name, help_text, fn, labels, kind))
+
+    def render(self) -> str:
+        return render_metrics((m.name, m.kind, m.help, m.samples()) for m in self.metrics.values())
+
+
+def _number(value) -> str:
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_metrics(families) -> str:
+    """Prometheus text format for (name, type, help, samples) families, where samples
+    is a list of (name suffix, ((label, value), ...), number)."""
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, v in samples:
+            label = ",".join(f'{k}="{_escape(str(lv))}"' for k, lv in labels)
+            lines.append(f"{name}{suffix}{{{label}}} {_number(v)}" if label else f"{name}{suffix} {_number(v)}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+interaction_seconds = registry.histogram(
+    "interaction_seconds", "Interaction handling time by command and part (wall, db, rest, render, other).",
+    ("command", "part"))
+interaction_ack_seconds = registry.histogram(
+    "interaction_ack_seconds", "Time from dispatch to the interaction being acknowledged.", ("command",))
+interactions_total = registry.counter("interactions_total", "Interactions handled by command and outcome.",
+                                      ("command", "outcome"))
+slow_interactions_total = registry.counter(
+    "slow_interactions_total", f"Interactions not acknowledged within {SLOW_AFTER:g}s.", ("command",))
+db_seconds = registry.histogram("db_call_seconds", "Database calls, including the wait for the DB thread.")
+rest_seconds = registry.histogram("rest_call_seconds", "Discord REST requests.", ("method",))
+background_errors_total = registry.counter("background_errors_total", "Failures in background work by task.",
+                                           ("task",))
+
+
+# ----- per-interaction timing -----
+class Timing:
+    __slots__ = ("command", "started", "age", "parts", "acked", "done")
+
+    def __init__(self, command: str, age: float = 0.0):
+        self.command = command
+        self.started = time.perf_counter()
+        self.age = age  # seconds between Discord creating the interaction and dispatch
+        self.parts = dict.fromkeys(PARTS, 0.0)
+        self.acked = None
+        self.done = False
+
+
+current: ContextVar[Optional[Timing]] = ContextVar("interaction_timing", default=None)
+
+
+def spent(part: str, seconds: float):
+    """Charge ``seconds`` of ``part`` to the interaction being handled, if any."""
+    timing = current.get()
+    if timing is not None and not timing.done:
+        timing.parts[part] += seconds
+
+
+@contextmanager
+def timer(part: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spent(part, time.perf_counter() - start)
+
+
+def start(command: str, interaction=None) -> Timing:
+    """Begin timing ``command`` in the current task; ``interaction`` dates it."""
+    age = 0.0
+    if interaction is not None:
+        age = max(0.0, time.time() - interaction.created_at.timestamp())
+    timing = Timing(command, age)
+    current.set(timing)
+    return timing
+
+
+def finish(timing: Timing, error: Optional[BaseException] = None):
+    if timing.done:
+        return
+    timing.done = True
+    wall = time.perf_counter() - timing.started
+    command = timing.command
+    interaction_seconds.observe(wall, command, "wall")
+    for part, seconds in timing.parts.items():
+        interaction_seconds.observe(seconds, command, part)
+    interaction_seconds.observe(max(0.0, wall - sum(timing.parts.values())), command, "other")
+    interactions_total.inc(command, "error" if error else "ok")
+    ack = timing.acked if timing.acked is not None else wall
+    if timing.acked is not None:
+        interaction_ack_seconds.observe(timing.acked, command)
+    if timing.age + ack >= SLOW_AFTER:
+        slow_interactions_total.inc(command)
+        # one JSON object per line; Cloud Run and most log shippers parse it as a structured entry
+        print(json.dumps({
+            "severity": "WARNING", "message": "slow interaction", "command": command,
+            "acknowledged": timing.acked is not None, "ack_s": round(ack, 3), "gateway_age_s": round(timing.age, 3),
+            "deadline_s": ACK_DEADLINE, "wall_s": round(wall, 3),
+            **{f"{part}_s": round(seconds, 3) for part, seconds in timing.parts.items()},
+            "error": repr(error) if error else None,
+        }), flush=True)
+
+
+@asynccontextmanager
+async def track(command: str, interaction=None):
+    """Time a component or modal callback the way the command tree times slash commands."""
+    timing = start(command, interaction)
+    try:
+        yield timing
+    except BaseException as e:
+        finish(timing, e)
+        raise
+    finally:
+        finish(timing)
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    """aiohttp tracing for the bot's HTTP session: REST time, and when the interaction was acknowledged."""
+    async def on_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+
+    async def on_end(session, ctx, params):
+        elapsed = time.perf_counter() - ctx.started
+        rest_seconds.observe(elapsed, params.method)
+        spent("rest", elapsed)
+        timing = current.get()
+        if timing is not None and timing.acked is None and params.url.path.endswith("/callback"):
+            timing.acked = time.perf_counter() - timing.started  # POST /interactions/{id}/{token}/callback
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_start)
+    config.on_request_end.append(on_end)
+    config.on_request_exception.append(on_end)
+    return config
@@ -0,0 +1,187 @@
+# outbox.py
+"""Prioritized, rate-limit-aware queue for outbound Discord REST calls that are not
+interaction responses (announcements, embed refreshes, uploads).
+
+Calls are bucketed per channel: a channel's calls run one at a time, highest
+priority first, and a channel that hits a rate limit waits out ``Retry-After``
+without holding up other channels. A pending edit with the same ``key`` as a new
+one is replaced in place, so only the latest state is ever sent.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable, Optional
+
+import discord
+
+HIGH, NORMAL, LOW = 0, 1, 2   # user-visible posts / announcements / cosmetic refreshes
+CONCURRENCY = 4               # calls in flight across all channels
+RETRIES = 3                   # retries after a 429 or 5xx before giving up
+BACKOFF = 1.0                 # seconds before the first 5xx retry, doubled each time
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "channel_id", "call", "key", "label", "future", "enqueued", "attempts")
+
+    def __init__(self, priority, seq, channel_id, call, key, label, future):
+        self.priority = priority
+        self.seq = seq
+        self.channel_id = channel_id
+        self.call = call
+        self.key = key
+        self.label = label
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _retry_after(error: Exception, attempts: int, backoff: float) -> Optional[float]:
+    """Seconds to wait before retrying ``error``, or None if it should not be retried."""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException):
+        if error.status == 429:
+            return float(error.response.headers.get("Retry-After", backoff))
+        if error.status >= 500:
+            return backoff * 2 ** attempts
+    return None
+
+
+class Outbox:
+    def __init__(self, concurrency: int = CONCURRENCY, retries: int = RETRIES, backoff: float = BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self._free = concurrency
+        self._waiters = []     # heap of (priority, seq, future) waiting for a free slot
+        self._channels = {}    # channel id -> heap of pending jobs
+        self._drains = {}      # channel id -> task draining that channel
+        self._pending = {}     # supersede key -> job not yet started
+        self._seq = itertools.count()
+        self.lags = deque(maxlen=1000)  # seconds from submit to first attempt, most recent calls
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.superseded = 0
+
+    def submit(self, channel_id: int, call: Callable[[], Awaitable], priority: int = NORMAL,
+               key: Optional[Hashable] = None, label: str = "") -> asyncio.Future:
+        """Queue ``call()`` for ``channel_id``. Return a future for its result.
+
+        With ``key`` (e.g. ("edit", message id)), a pending call with the same key is
+        replaced by this one and both callers get the newer call's result.
+        """
+        job = self._pending.get(key) if key is not None else None
+        if job is not None:
+            job.call = call
+            self.superseded += 1
+            if priority < job.priority:
+                job.priority = priority
+                heapq.heapify(self._channels[job.channel_id])
+            return job.future
+        job = _Job(priority, next(self._seq), channel_id, call, key, label or "call",
+                   asyncio.get_running_loop().create_future())
+        # failures are logged here; don't warn about results nobody awaited
+        job.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if key is not None:
+            self._pending[key] = job
+        heapq.heappush(self._channels.setdefault(channel_id, []), job)
+        if channel_id not in self._drains:
+            self._drains[channel_id] = asyncio.create_task(self._drain(channel_id))
+        return job.future
+
+    @property
+    def depth(self) -> int:
+        return sum(len(jobs) for jobs in self._channels.values())
+
+    def stats(self) -> dict:
+        lags = sorted(self.lags)
+        return {
+            "depth": self.depth,
+            "channels": len(self._channels),
+            "lag_p50": lags[len(lags) // 2] if lags else 0.0,
+            "lag_max": lags[-1] if lags else 0.0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "superseded": self.superseded,
+        }
+
+    async def _acquire(self, priority: int):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        await waiter  # the releasing call hands its slot straight over
+
+    def _release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+    async def _drain(self, channel_id: int):
+        jobs = self._channels[channel_id]
+        try:
+            while jobs:
+                await self._acquire(jobs[0].priority)
+                job = heapq.heappop(jobs)  # may be a higher-priority job that arrived while waiting
+                if job.key is not None and self._pending.get(job.key) is job:
+                    del self._pending[job.key]  # edits submitted from now on queue a fresh call
+                if job.attempts == 0:
+                    self.lags.append(time.monotonic() - job.enqueued)
+                try:
+                    result = await job.call()
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+                finally:
+                    self._release()
+                if error is None:
+                    self.sent += 1
+                    job.future.set_result(result)
+                    continue
+                delay = _retry_after(error, job.attempts, self.backoff)
+                if delay is None or job.attempts >= self.retries:
+                    self.failed += 1
+                    print(f"Outbound {job.label} to channel {channel_id} failed:", error)
+                    job.future.set_exception(error)
+                    continue
+                job.attempts += 1
+                self.retried += 1
+                newer = self._pending.get(job.key) if job.key is not None else None
+                if newer is not None:
+                    # a newer edit is already queued; it makes this retry pointless
+                    newer.future.add_done_callback(lambda f, old=job.future: _chain(f, old))
+                else:
+                    heapq.heappush(jobs, job)
+                    if job.key is not None:
+                        self._pending[job.key] = job
+                await asyncio.sleep(delay)  # holds up this channel's bucket only
+        finally:
+            del self._channels[channel_id]
+            del self._drains[channel_id]
+
+    async def flush(self, timeout: float = 10.0):
+        """Wait for queued calls to finish (used on shutdown)."""
+        if self._drains:
+            await asyncio.wait(list(self._drains.values()), timeout=timeout)
+
+
+def _chain(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,56 @@
+# transcripts.py
+"""Streams a channel's message history into a gzip-compressed JSONL transcript on disk."""
+import asyncio
+import gzip
+import json
+import os
+from typing import Awaitable, Callable, Optional
+
+CHUNK = 200  # messages serialized per disk write; also how often progress is reported
+
+
+def message_record(message) -> dict:
+    """One transcript line for a discord.Message."""
+    return {
+        "id": str(message.id),
+        "author_id": str(message.author.id),
+        "author": str(message.author),
+        "created_at": message.created_at.isoformat(),
+        "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+        "content": message.content,
+        "attachments": [a.url for a in message.attachments],
+        "embeds": [e.title for e in message.embeds if e.title],
+    }
+
+
+async def write_transcript(history, path: str, on_progress: Optional[Callable[[int], Awaitable]] = None,
+                           chunk: int = CHUNK) -> int:
+    """Write each message from the async iterator ``history`` to ``path`` as gzip JSONL.
+
+    At most ``chunk`` messages are held in memory; compression and disk writes run
+    off the event loop. The file only appears at ``path`` once complete. Return the
+    number of messages written.
+    """
+    loop = asyncio.get_running_loop()
+    part = path + ".part"
+    out = await loop.run_in_executor(None, gzip.open, part, "wb")
+    count = 0
+    try:
+        lines = []
+        async for message in history:
+            lines.append(json.dumps(message_record(message), ensure_ascii=False))
+            count += 1
+            if len(lines) >= chunk:
+                await loop.run_in_executor(None, out.write, ("\n".join(lines) + "\n").encode())
+                lines = []
+                if on_progress:
+                    await on_progress(count)
+        if lines:
+            await loop.run_in_executor(None, out.write, ("\n".join(lines) + "\n").encode())
+    except BaseException:
+        await loop.run_in_executor(None, out.close)
+        os.remove(part)
+        raise
+    await loop.run_in_executor(None, out.close)
+    os.replace(part, path)
+    return count